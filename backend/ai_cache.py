@@ -0,0 +1,418 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Two-tier cache for generated AI content (syllabus, flashcards, quiz, ...).
+
+Bounded by entry count and by an approximate byte budget; the least recently
+used entry goes first. Keys look like "<namespace>:<...>" and every namespace
+has its own TTL (AI_CACHE_TTLS). Expired entries are swept in expiry order at
+most once per sweep interval, so an entry that is never read again still
+leaves on time instead of living until the same key comes back. An entry set
+with a shorter TTL than its namespace's (a read-through from the shared tier
+keeps only its remaining lifetime) is indexed in a heap instead, so it cannot
+hide behind longer-lived entries.
+
+An entry's size is sys.getsizeof summed over the payload's containers and
+leaves (AI payloads are small JSON-like trees) plus a fixed per-entry overhead.
+
+Behind the in-process tier sits `ai_cache_entries` in the main database,
+shared by every worker and kept across deploys. It is read through on a
+memory miss (a hit is copied into memory for its remaining lifetime) and
+written through on every set. Rows hold zlib-compressed JSON under the sha256
+of AI_CACHE_KEY_VERSION plus the normalized key, so bumping the version
+orphans everything stored before a prompt change. Expired rows, then the
+soonest-expiring ones past AI_CACHE_DB_MAX_MB, are pruned in the background;
+the byte cap can be overshot by one prune interval's worth of writes. A
+failing database only costs the second tier: lookups miss and writes are
+dropped.
+"""
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import database, metrics, models
+from .config import settings
+
+logger = logging.getLogger("lumios.ai")
+
+# Two dict slots, two OrderedDict links and the entry tuple, per entry
+ENTRY_OVERHEAD_BYTES = 280
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    """'syllabus=86400,quiz=3600' -> {'syllabus': 86400.0, 'quiz': 3600.0}"""
+    ttls = {}
+    for item in spec.split(","):
+        if item.strip():
+            name, _, seconds = item.partition("=")
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+
+def estimate_size(key: str, value: Any) -> int:
+    """sys.getsizeof over the payload's containers and leaves, plus the entry's own bookkeeping."""
+    size = sys.getsizeof(key) + ENTRY_OVERHEAD_BYTES
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return size
+
+
+def namespace_of(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+def cache_key(namespace: str, *parts: Any) -> str:
+    """
+    Normalized key: each part trimmed, whitespace collapsed and case-folded,
+    so "  Photo synthesis" and "photo  Synthesis" share one entry.
+    cache_key("quiz", " Cells ", 5) -> 'quiz:["cells", "5"]'
+    """
+    return f"{namespace}:{json.dumps([' '.join(str(part).split()).casefold() for part in parts], ensure_ascii=False)}"
+
+
+class MemoryCache:
+    """LRU with per-namespace TTLs, bounded by entries and approximate bytes."""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, default_ttl: float = 3600.0,
+                 ttls: Optional[Dict[str, float]] = None, sweep_interval: float = 60.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, size), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # namespace -> key -> expires_at; one TTL per namespace keeps each in expiry order
+        self._expiry: Dict[str, "OrderedDict[str, float]"] = {}
+        # (expires_at, key) for entries set with a shortened TTL; stale items are skipped when popped
+        self._early: List[Tuple[float, str]] = []
+        self._bytes = 0
+        self._next_sweep = clock() + sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def get(self, key: str) -> Optional[Any]:
+        namespace = namespace_of(key)
+        now = self._clock()
+        with self._lock:
+            self._sweep_if_due(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._expire(key, namespace)
+                self._publish()
+                entry = None
+            if entry is None:
+                self.misses += 1
+                metrics.AI_CACHE_LOOKUPS.inc(namespace, "miss")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        metrics.AI_CACHE_LOOKUPS.inc(namespace, "hit")
+        return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """`ttl` may only shorten the namespace TTL."""
+        namespace = namespace_of(key)
+        early = ttl is not None and ttl < self.ttl_for(namespace)
+        ttl = ttl if early else self.ttl_for(namespace)
+        size = estimate_size(key, value)
+        now = self._clock()
+        with self._lock:
+            self._sweep_if_due(now)
+            if key in self._entries:
+                self._remove(key)
+            if ttl > 0 and size <= self.max_bytes:
+                self._entries[key] = (value, now + ttl, size)
+                if early:
+                    heapq.heappush(self._early, (now + ttl, key))
+                else:
+                    self._expiry.setdefault(namespace, OrderedDict())[key] = now + ttl
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._remove(oldest)
+                    self.evictions += 1
+                    metrics.AI_CACHE_EVICTIONS.inc(namespace_of(oldest), "capacity")
+            self._publish()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop every expired entry; returns how many went."""
+        with self._lock:
+            removed = self._sweep(self._clock() if now is None else now)
+            self._publish()
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+            self._early.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = self.expired = 0
+            self._publish()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "namespaces": dict(Counter(namespace_of(key) for key in self._entries)),
+            }
+
+    # --- internals; callers hold the lock ---
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        order = self._expiry.get(namespace_of(key))
+        if order is not None:
+            order.pop(key, None)
+        self._bytes -= size
+
+    def _expire(self, key: str, namespace: str):
+        self._remove(key)
+        self.expired += 1
+        metrics.AI_CACHE_EVICTIONS.inc(namespace, "expired")
+
+    def _sweep_if_due(self, now: float):
+        if now >= self._next_sweep and self._sweep(now):
+            self._publish()
+
+    def _sweep(self, now: float) -> int:
+        self._next_sweep = now + self.sweep_interval
+        removed = 0
+        for namespace, order in self._expiry.items():
+            while order:
+                key, expires_at = next(iter(order.items()))
+                if expires_at > now:
+                    break
+                self._expire(key, namespace)
+                removed += 1
+        while self._early and self._early[0][0] <= now:
+            expires_at, key = heapq.heappop(self._early)
+            entry = self._entries.get(key)
+            # Skip keys that were removed or set again since
+            if entry is not None and entry[1] == expires_at:
+                self._expire(key, namespace_of(key))
+                removed += 1
+        return removed
+
+    def _publish(self):
+        metrics.AI_CACHE_ENTRIES.set(len(self._entries))
+        metrics.AI_CACHE_BYTES.set(self._bytes)
+
+
+class PersistentCache:
+    """Compressed JSON payloads in `ai_cache_entries`; blocking, so async callers go through a thread."""
+
+    def __init__(self, engine=None, max_bytes: int = 256 * 1024 * 1024, max_entry_bytes: int = 512 * 1024,
+                 default_ttl: float = 3600.0, ttls: Optional[Dict[str, float]] = None, compress_level: int = 6,
+                 version: str = "1", batch_size: int = 500, clock=datetime.utcnow):
+        self._engine = engine
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.compress_level = compress_level
+        self.version = version
+        self.batch_size = batch_size
+        self._clock = clock
+
+    @property
+    def engine(self):
+        # Resolved lazily so test suites patching database.engine are honoured
+        return self._engine or database.engine
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def digest(self, key: str) -> str:
+        return hashlib.sha256(f"{self.version}:{key}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(value, seconds left) for a live entry, else None."""
+        namespace = namespace_of(key)
+        now = self._clock()
+        table = models.AICacheEntry.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(table.c.payload, table.c.expires_at)
+                .where(table.c.key_hash == self.digest(key), table.c.expires_at > now)
+            ).first()
+        if row is None:
+            metrics.AI_CACHE_PERSISTENT_LOOKUPS.inc(namespace, "miss")
+            return None
+        metrics.AI_CACHE_PERSISTENT_LOOKUPS.inc(namespace, "hit")
+        return json.loads(zlib.decompress(row.payload)), (row.expires_at - now).total_seconds()
+
+    def set(self, key: str, value: Any) -> bool:
+        """Upsert one entry; False when its namespace is not cached or the payload is over the per-entry cap."""
+        namespace = namespace_of(key)
+        ttl = self.ttl_for(namespace)
+        payload = zlib.compress(json.dumps(value, separators=(",", ":")).encode(), self.compress_level)
+        if ttl <= 0 or len(payload) > self.max_entry_bytes:
+            return False
+        now = self._clock()
+        table = models.AICacheEntry.__table__
+        with self.engine.begin() as conn:
+            dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+            stmt = dialect_insert(table).values(
+                key_hash=self.digest(key), namespace=namespace, payload=payload, size_bytes=len(payload),
+                created_at=now, expires_at=now + timedelta(seconds=ttl),
+            )
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["key_hash"],
+                set_={column: stmt.excluded[column] for column in ("payload", "size_bytes", "created_at", "expires_at")},
+            ))
+        return True
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """Delete expired rows, then the soonest-expiring ones until under max_bytes. Returns rows deleted."""
+        now = now or self._clock()
+        table = models.AICacheEntry.__table__
+        expired = select(table.c.key_hash).where(table.c.expires_at <= now).limit(self.batch_size).scalar_subquery()
+
+        removed = 0
+        while True:
+            # Short transactions, as in the auth session sweeper
+            with self.engine.begin() as conn:
+                batch = conn.execute(delete(table).where(table.c.key_hash.in_(expired))).rowcount or 0
+            removed += batch
+            if batch < self.batch_size:
+                break
+        if removed:
+            metrics.AI_CACHE_PERSISTENT_PRUNED.inc("expired", amount=removed)
+
+        with self.engine.connect() as conn:
+            total = conn.execute(select(func.coalesce(func.sum(table.c.size_bytes), 0))).scalar_one()
+        while total > self.max_bytes:
+            with self.engine.begin() as conn:
+                rows = conn.execute(
+                    select(table.c.key_hash, table.c.size_bytes).order_by(table.c.expires_at).limit(self.batch_size)
+                ).all()
+                victims = []
+                for key_hash, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    victims.append(key_hash)
+                    total -= size
+                if not victims:
+                    break
+                conn.execute(delete(table).where(table.c.key_hash.in_(victims)))
+            removed += len(victims)
+            metrics.AI_CACHE_PERSISTENT_PRUNED.inc("capacity", amount=len(victims))
+        metrics.AI_CACHE_PERSISTENT_BYTES.set(total)
+        if removed:
+            logger.info(f"Pruned {removed} shared AI cache entries")
+        return removed
+
+    async def run_periodically(self, interval_seconds: float):
+        """Prune on startup and then every `interval_seconds`, off the event loop."""
+        while True:
+            try:
+                await asyncio.to_thread(self.prune)
+            except Exception as e:
+                logger.error(f"AI cache prune failed: {e}")
+            await asyncio.sleep(interval_seconds)
+
+
+class TieredCache:
+    """MemoryCache in front of an optional PersistentCache: read-through on a miss, write-through on set."""
+
+    def __init__(self, memory: MemoryCache, persistent: Optional[PersistentCache] = None):
+        self.memory = memory
+        self.persistent = persistent
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None or self.persistent is None:
+            return value
+        try:
+            found = await asyncio.to_thread(self.persistent.get, key)
+        except Exception as e:
+            metrics.AI_CACHE_PERSISTENT_LOOKUPS.inc(namespace_of(key), "error")
+            logger.warning(f"Shared AI cache read failed for {key}: {e}")
+            return None
+        if found is None:
+            return None
+        value, seconds_left = found
+        self.memory.set(key, value, ttl=seconds_left)
+        return value
+
+    async def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                await asyncio.to_thread(self.persistent.set, key, value)
+            except Exception as e:
+                logger.warning(f"Shared AI cache write failed for {key}: {e}")
+
+    def clear(self):
+        """Local tier only; the shared tier belongs to every worker."""
+        self.memory.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.memory.get_stats(), "persistent": self.persistent is not None}
+
+
+def build_memory_cache() -> MemoryCache:
+    return MemoryCache(
+        max_entries=settings.AI_CACHE_MAX_ENTRIES,
+        max_bytes=int(settings.AI_CACHE_MAX_MB * 1024 * 1024),
+        default_ttl=settings.AI_CACHE_TTL_SECONDS,
+        ttls=parse_ttls(settings.AI_CACHE_TTLS),
+        sweep_interval=settings.AI_CACHE_SWEEP_SECONDS,
+    )
+
+
+def build_persistent_cache(engine=None) -> PersistentCache:
+    return PersistentCache(
+        engine=engine,
+        max_bytes=int(settings.AI_CACHE_DB_MAX_MB * 1024 * 1024),
+        max_entry_bytes=settings.AI_CACHE_DB_MAX_ENTRY_KB * 1024,
+        default_ttl=settings.AI_CACHE_TTL_SECONDS,
+        ttls=parse_ttls(settings.AI_CACHE_TTLS),
+        compress_level=settings.AI_CACHE_COMPRESS_LEVEL,
+        version=settings.AI_CACHE_KEY_VERSION,
+    )
+
+
+def build_cache() -> TieredCache:
+    return TieredCache(build_memory_cache(), build_persistent_cache() if settings.AI_CACHE_PERSISTENT else None)
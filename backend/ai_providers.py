@@ -0,0 +1,413 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+AI providers behind AIService.
+
+AIService describes each operation as an AIRequest and hands it to the
+providers named in AI_PROVIDERS, in order, until one answers:
+
+- gemini: Gemini 2.0 Flash (google-generativeai)
+- openai: GPT-4o on the pooled AsyncOpenAI client
+- stub:   local and deterministic. Canned payloads match each task's schema
+          (syllabus, quiz, flashcards, grading, solver, report, ...), with
+          configurable latency distribution, error rate and token counts.
+          AI_PROVIDERS=stub load-tests the whole API with no network.
+
+Every provider offers generate_text, generate_json and vision.
+"""
+import asyncio
+import base64
+import json
+import logging
+import math
+import random
+import re
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+logger = logging.getLogger("ai_service")
+
+PROVIDER_NAMES = ("gemini", "openai", "stub")
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class ProviderError(Exception):
+    """A provider could not produce a completion."""
+
+
+@dataclass(frozen=True)
+class AIRequest:
+    task: str  # names the operation; the stub picks its canned payload by it
+    prompt: str
+    system: Optional[str] = None
+    history: Sequence[Dict[str, str]] = ()
+    image: Optional[bytes] = None
+    mime_type: Optional[str] = None
+    json_mode: bool = False
+    json_object: bool = False  # the answer must be a JSON object, not an array
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    params: Mapping[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Completion:
+    text: str
+    source: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    duration_ms: float = 0.0
+    data: Any = None  # parsed payload for JSON requests
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def parse_json(text: str) -> Any:
+    """Parse JSON from a model answer, cleaning up markdown if needed."""
+    try:
+        clean_text = text.strip()
+        # If it's a markdown response but NOT JSON, try to extract anything that looks like JSON
+        if "{" not in clean_text and "[" not in clean_text:
+             # This might be a conversational response from a model that failed vision
+             logger.warning(f"AI returned non-JSON text: {text[:100]}...")
+             return {"error": "AI failed to return structured data", "raw": text}
+
+        if "```json" in clean_text:
+            clean_text = clean_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in clean_text:
+            clean_text = clean_text.split("```")[1].split("```")[0].strip()
+
+        # Remove any trailing commas before closing braces/brackets
+        clean_text = re.sub(r',\s*([\]}])', r'\1', clean_text)
+
+        return json.loads(clean_text)
+    except Exception as e:
+        logger.error(f"JSON Parse Error: {e} | Raw: {text[:200]}...")
+        # Try one more aggressive cleanup: find first { and last }
+        try:
+            start = clean_text.find("{")
+            end = clean_text.rfind("}") + 1
+            if start != -1 and end != 0:
+                return json.loads(clean_text[start:end])
+        except:
+            pass
+
+        # Fallback: if it fails, try a very simple cleanup
+        try:
+            # Replace single backslashes with double backslashes, but avoid tripling existing double backslashes
+            fixed_text = re.sub(r'(?<!\\)\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', clean_text)
+            return json.loads(fixed_text)
+        except:
+            return {"error": "Structured data parsing failed", "raw": text}
+
+
+class AIProvider:
+    name = "base"
+    supports_vision = False
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    async def _complete(self, request: AIRequest) -> Completion:
+        raise NotImplementedError
+
+    async def _timed(self, request: AIRequest) -> Completion:
+        started = time.perf_counter()
+        completion = await self._complete(request)
+        return replace(completion, duration_ms=(time.perf_counter() - started) * 1000)
+
+    async def generate_text(self, request: AIRequest) -> Completion:
+        return await self._timed(request)
+
+    async def generate_json(self, request: AIRequest) -> Completion:
+        completion = await self._timed(replace(request, json_mode=True))
+        return replace(completion, data=parse_json(completion.text))
+
+    async def vision(self, request: AIRequest) -> Completion:
+        """Prompt plus request.image; parsed into .data when request.json_mode."""
+        if not self.supports_vision:
+            raise ProviderError(f"{self.name} has no vision support")
+        completion = await self._timed(request)
+        return replace(completion, data=parse_json(completion.text)) if request.json_mode else completion
+
+    async def aclose(self):
+        pass
+
+
+class GeminiProvider(AIProvider):
+    name = "gemini"
+    supports_vision = True
+
+    def __init__(self, model, timeout: float, model_name: str = "gemini-2.0-flash"):
+        self.model = model
+        self.enabled = model is not None
+        self.timeout = timeout
+        self.model_name = model_name
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and self.model is not None
+
+    async def _complete(self, request: AIRequest) -> Completion:
+        prompt = request.prompt
+        if request.history:
+            context = "\n".join(f"{h['role']}: {h['content']}" for h in request.history[-5:])
+            prompt = f"Context:\n{context}\n\nUser: {prompt}"
+        if request.system:
+            prompt = f"{request.system}\n\n{prompt}"
+        contents = [prompt, {"mime_type": request.mime_type, "data": request.image}] if request.image is not None else prompt
+        # The SDK takes no per-call timeout, so wait_for cancels the pending RPC when it expires
+        response = await asyncio.wait_for(self.model.generate_content_async(contents), self.timeout)
+        text = response.text
+        return Completion(
+            text=text, source=self.name, model=self.model_name,
+            prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(text or ""),
+        )
+
+
+class OpenAIProvider(AIProvider):
+    name = "openai"
+    supports_vision = True
+
+    def __init__(self, api_key: str, timeout: float, model: str = "gpt-4o", max_retries: int = 2,
+                 max_connections: int = 100, max_keepalive_connections: int = 20, connect_timeout: float = 5.0):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.model = model
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.connect_timeout = connect_timeout
+        self.client = self._build_client() if api_key else None
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    def _build_client(self) -> AsyncOpenAI:
+        # Connections open lazily, so a fresh client holds nothing until its first call
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            max_retries=self.max_retries,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            ),
+        )
+
+    async def _complete(self, request: AIRequest) -> Completion:
+        messages = [{"role": "system", "content": request.system}] if request.system else []
+        messages.extend(request.history)
+        if request.image is not None:
+            encoded = base64.b64encode(request.image).decode("utf-8")
+            if not encoded:
+                raise ProviderError("Empty image data")
+            content = [
+                {"type": "text", "text": request.prompt},
+                {"type": "image_url", "image_url": {"url": f"data:{request.mime_type};base64,{encoded}"}},
+            ]
+        else:
+            content = request.prompt
+        messages.append({"role": "user", "content": content})
+
+        options = {}
+        if request.temperature is not None:
+            options["temperature"] = request.temperature
+        if request.max_tokens is not None:
+            options["max_tokens"] = request.max_tokens
+        if request.json_object:
+            options["response_format"] = {"type": "json_object"}
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=messages, timeout=self.timeout, **options
+        )
+        text = response.choices[0].message.content
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+            prompt_tokens, completion_tokens = estimate_tokens(request.prompt), estimate_tokens(text or "")
+        return Completion(
+            text=text, source=self.name, model=self.model,
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        )
+
+    async def aclose(self):
+        """
+        Close pooled connections. The pool is bound to the closing event
+        loop, so a fresh client replaces it for any later loop.
+        """
+        if self.client is not None:
+            await self.client.close()
+            self.client = self._build_client()
+
+
+# --- stub payloads: deterministic in the request params, valid for each task's schema ---
+
+def _stub_syllabus(p):
+    topic, weeks = p.get("topic", "Topic"), int(p.get("weeks", 4))
+    return {
+        "topic": topic,
+        "grade": p.get("grade", ""),
+        "weeks": [
+            {
+                "week": i + 1,
+                "title": f"{topic}: Unit {i + 1}",
+                "objectives": [f"Explain the core ideas of unit {i + 1}", "Apply them to a worked example"],
+                "concepts": [f"{topic} concept {i + 1}.1", f"{topic} concept {i + 1}.2"],
+                "activity": "Small-group exercise and discussion",
+            }
+            for i in range(weeks)
+        ],
+    }
+
+
+def _stub_quiz(p):
+    topic = p.get("topic", "Topic")
+    return [
+        {
+            "q": f"Question {i + 1} about {topic}?",
+            "options": [f"Option {chr(65 + j)}" for j in range(4)],
+            "correct": i % 4,
+        }
+        for i in range(int(p.get("count", 5)))
+    ]
+
+
+def _stub_flashcards(p):
+    topic = p.get("topic", "Topic")
+    return [
+        {"term": f"{topic} term {i + 1}", "def": f"Definition of {topic} term {i + 1}."}
+        for i in range(int(p.get("count", 10)))
+    ]
+
+
+def _stub_grading(p):
+    total = p.get("total_marks", 100)
+    payload = {
+        "student": "Unknown",
+        "score": round(total * 0.8),
+        "feedback": "✅ Method is correct\n⚠️ Show units in the final answer",
+        "annotations": [{"point": "Q1", "comment": "Clear working"}],
+        "insights": {
+            "strengths": ["Problem setup"],
+            "weaknesses": ["Units"],
+            "recommendation": "Practise carrying units through each step.",
+        },
+        "flags": [],
+        "grading_confidence": 0.9,
+    }
+    if p.get("has_reference"):
+        payload["reference_match_score"] = 80.0
+    return payload
+
+
+def _stub_solver(p):
+    return {
+        "subject": p.get("subject", ""),
+        "difficulty": p.get("difficulty", ""),
+        "steps": [
+            {"title": "Step 1: Identify the Operation", "content": "Restate the problem and the quantities involved."},
+            {"title": "Step 2: Perform the Calculation", "content": "Work through the calculation one step at a time."},
+        ],
+        "final_answer": "Stub answer.",
+        "verification_status": "Verified",
+        "pedagogical_note": "Check each step against the original problem.",
+    }
+
+
+def _stub_reference(p):
+    return {
+        "answers": [{"q": "1", "answer": "Stub answer", "marks": 10}],
+        "total_marks": 10,
+        "criteria": "Full marks for the correct answer with working.",
+        "summary": "Stub reference material.",
+    }
+
+
+def _stub_brand(p):
+    return {
+        "name": "Stub Academy",
+        "motto": "Learning without limits",
+        "primaryColor": "#1E3A8A",
+        "secondaryColor": "#F59E0B",
+        "logoUrl": "https://example.com/logo.png",
+        "websiteContext": "A stub school profile.",
+    }
+
+
+STUB_PAYLOADS: Dict[str, Callable[[Mapping[str, Any]], Any]] = {
+    "syllabus": _stub_syllabus,
+    "quiz": _stub_quiz,
+    "flashcards": _stub_flashcards,
+    "grading": _stub_grading,
+    "solver": _stub_solver,
+    "reference": _stub_reference,
+    "brand": _stub_brand,
+    "report": lambda p: f"## Weekly Report: {p.get('name')}\n\nSteady progress this week. Keep up the regular practice.",
+    "prediction": lambda p: f"{p.get('name')} is on a stable trajectory; consistent attendance should sustain it.",
+    "chat": lambda p: "This is a stub response.",
+    "landing_chat": lambda p: "Hello from NOVA (stub).",
+}
+
+
+class StubProvider(AIProvider):
+    name = "stub"
+    supports_vision = True
+
+    def __init__(self, latency_ms: float = 0.0, distribution: str = "fixed", spread: float = 0.5,
+                 error_rate: float = 0.0, completion_tokens: int = 256, seed: int = 0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown stub latency distribution: {distribution}")
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.spread = spread
+        self.error_rate = error_rate
+        self.completion_tokens = completion_tokens
+        self._random = random.Random(seed)
+
+    def latency(self) -> float:
+        """One latency sample in seconds; latency_ms is the mean."""
+        mean = self.latency_ms / 1000.0
+        if mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return self._random.uniform(mean * (1 - self.spread), mean * (1 + self.spread))
+        if self.distribution == "exponential":
+            return self._random.expovariate(1 / mean)
+        if self.distribution == "lognormal":
+            # spread is sigma; mu keeps the mean at latency_ms
+            return self._random.lognormvariate(math.log(mean) - self.spread ** 2 / 2, self.spread)
+        return mean
+
+    async def _complete(self, request: AIRequest) -> Completion:
+        delay = self.latency()
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise ProviderError("stub provider: injected failure")
+        build = STUB_PAYLOADS.get(request.task)
+        payload = build(request.params) if build is not None else "This is a stub response."
+        text = payload if isinstance(payload, str) else json.dumps(payload)
+        return Completion(
+            text=text, source=self.name, model="stub",
+            prompt_tokens=estimate_tokens(request.prompt), completion_tokens=self.completion_tokens,
+        )
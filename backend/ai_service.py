@@ -11,14 +11,16 @@ Created by: Faizain Murtuza
 © 2025 Faizain Murtuza. All Rights Reserved.
 """
 import os
-import time
 import json
 import logging
-import base64
-import re
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from backend.ai_cache import build_cache, cache_key as cache_key_for
+from backend.ai_providers import (
+    PROVIDER_NAMES, AIProvider, AIRequest, Completion, GeminiProvider, OpenAIProvider, StubProvider, parse_json,
+)
 from backend.config import settings
+from backend.single_flight import SingleFlight
+from backend import metrics
 
 try:
     import google.generativeai as genai
@@ -30,73 +32,171 @@ except Exception as e:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ai_service")
 
-class SimpleCache:
-    def __init__(self, ttl: int = 3600): # 1 hour TTL
-        self.cache = {}
-        self.ttl = ttl
-
-    def get(self, key: str) -> Optional[Any]:
-        if key in self.cache:
-            entry = self.cache[key]
-            if time.time() - entry['timestamp'] < self.ttl:
-                return entry['value']
-            else:
-                del self.cache[key]
-        return None
 
-    def set(self, key: str, value: Any):
-        self.cache[key] = {
-            'value': value,
-            'timestamp': time.time()
-        }
+def _usable(data: Any, expect: Union[type, Tuple[type, ...]]) -> bool:
+    """A non-empty payload of the expected shape; parse_json failures come back as {"error": ...}."""
+    if not data or not isinstance(data, expect):
+        return False
+    return not (isinstance(data, dict) and "error" in data)
 
-    def get_stats(self) -> Dict[str, int]:
-        return {"size": len(self.cache)}
 
 class AIService:
-    def __init__(self, openai_api_key: str, gemini_api_key: str):
-        self.client = OpenAI(api_key=openai_api_key) if openai_api_key else None
-        # Nova Core uses OpenAI GPT-4o
-        self.nova_model = "gpt-4o"
-        self.model = "gpt-4o" # Default model for Nova operations
-        
-        self.gemini_available = False
-        self.cache = SimpleCache() # Initialize cache
-        
+    def __init__(self, openai_api_key: str, gemini_api_key: str, providers: Optional[str] = None):
+        # Every provider call awaits; a slow completion must never hold the event loop
+        self.request_timeout = settings.AI_REQUEST_TIMEOUT_SECONDS
+        self.cache = build_cache()
+        # Identical cache misses in flight share one provider call
+        self.inflight = SingleFlight()
+
+        gemini_model = None
         if gemini_api_key and genai:
             try:
                 genai.configure(api_key=gemini_api_key)
                 # LumiX Core uses Gemini 2.0 Flash (Latest)
-                self.lumix_model = genai.GenerativeModel('gemini-2.0-flash')
-                self.vision_model = self.lumix_model # Alias for backward compatibility
-                self.gemini_available = True
+                gemini_model = genai.GenerativeModel('gemini-2.0-flash')
                 logger.info("AI System: LumiX (Gemini 2.0 Flash) initialized")
             except Exception as e:
                 logger.error(f"AI System: Failed to initialize LumiX (Gemini): {e}")
-                self.lumix_model = None
-                self.vision_model = None
-        else:
-            self.lumix_model = None
-            self.vision_model = None
+
+        self.gemini = GeminiProvider(gemini_model, timeout=self.request_timeout)
+        # Nova Core uses OpenAI GPT-4o
+        self.openai = OpenAIProvider(
+            openai_api_key,
+            timeout=self.request_timeout,
+            max_retries=settings.AI_MAX_RETRIES,
+            max_connections=settings.AI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_MAX_KEEPALIVE_CONNECTIONS,
+            connect_timeout=settings.AI_CONNECT_TIMEOUT_SECONDS,
+        )
+        self.stub = StubProvider(
+            latency_ms=settings.AI_STUB_LATENCY_MS,
+            distribution=settings.AI_STUB_LATENCY_DISTRIBUTION,
+            spread=settings.AI_STUB_LATENCY_SPREAD,
+            error_rate=settings.AI_STUB_ERROR_RATE,
+            completion_tokens=settings.AI_STUB_COMPLETION_TOKENS,
+            seed=settings.AI_STUB_SEED,
+        )
+        names = [n.strip() for n in (providers or settings.AI_PROVIDERS).split(",") if n.strip()]
+        unknown = [n for n in names if n not in PROVIDER_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown AI providers: {', '.join(unknown)}")
+        by_name = {p.name: p for p in (self.gemini, self.openai, self.stub)}
+        self.providers: List[AIProvider] = [by_name[n] for n in names]
+        logger.info(f"AI System: providers {', '.join(names)}")
+
         self.metrics = {
             "openai_requests": 0,
             "gemini_requests": 0,
+            "stub_requests": 0,
             "total_tokens": 0,
             "avg_response_time_ms": 0,
             "cache_hits": 0,
             "errors": 0
         }
 
+    # Provider SDK objects, kept addressable for callers and tests
+    @property
+    def client(self):
+        return self.openai.client
+
+    @client.setter
+    def client(self, value):
+        self.openai.client = value
+
+    @property
+    def vision_model(self):
+        return self.gemini.model
+
+    @vision_model.setter
+    def vision_model(self, value):
+        self.gemini.model = value
+
+    lumix_model = vision_model  # Alias for backward compatibility
+
+    @property
+    def gemini_available(self) -> bool:
+        return self.gemini.enabled
+
+    @gemini_available.setter
+    def gemini_available(self, value: bool):
+        self.gemini.enabled = value
+
+    async def aclose(self):
+        """Close pooled provider connections."""
+        for provider in (self.gemini, self.openai, self.stub):
+            await provider.aclose()
+
+    def _chain(self, prefer: Optional[str] = None, vision: bool = False) -> List[AIProvider]:
+        chain = [p for p in self.providers if p.available and (p.supports_vision or not vision)]
+        if prefer is not None:
+            chain.sort(key=lambda p: p.name != prefer)
+        return chain
+
+    async def _generate(self, request: AIRequest, label: str, accept: Optional[Callable[[Completion], Any]] = None,
+                        prefer: Optional[str] = None, errors: Optional[list] = None) -> Optional[Completion]:
+        """
+        Try the configured providers in order until one returns a completion
+        that `accept` approves (by default: non-empty text, or non-empty data
+        for JSON requests). Provider failures are logged and counted, not
+        raised; cancellation still propagates.
+        """
+        for provider in self._chain(prefer, vision=request.image is not None):
+            try:
+                if request.image is not None:
+                    completion = await provider.vision(request)
+                elif request.json_mode:
+                    completion = await provider.generate_json(request)
+                else:
+                    completion = await provider.generate_text(request)
+            except Exception as e:
+                logger.error(f"{provider.name} {label} Error: {e}")
+                self._update_metrics(0, source=provider.name, error=True)
+                if errors is not None:
+                    errors.append(e)
+                continue
+            ok = accept(completion) if accept is not None else (completion.data if request.json_mode else completion.text)
+            if ok:
+                self._update_metrics(completion.duration_ms, completion.tokens, source=completion.source)
+                return completion
+        return None
+
+    async def _generate_cached(self, cache_key: str, request: AIRequest, label: str,
+                               expect: Union[type, Tuple[type, ...]] = list) -> Optional[Any]:
+        """
+        JSON payload for `request` from the cache, or from one provider call
+        shared by every concurrent request with the same key. Only payloads of
+        type `expect` that carry no parse error are accepted and cached; None
+        when every provider failed or returned something unusable.
+        """
+        cached = await self.cache.get(cache_key)
+        if cached:
+            self.metrics["cache_hits"] += 1
+            logger.info(f"Cache hit for {cache_key}")
+            return cached
+
+        async def generate():
+            completion = await self._generate(request, label, accept=lambda c: _usable(c.data, expect))
+            if completion:
+                await self.cache.set(cache_key, completion.data)
+                return completion.data
+            return None
+
+        return await self.inflight.do(cache_key, generate)
+
     def _update_metrics(self, duration_ms: float, tokens: int = 0, source: str = "openai", error: bool = False):
         """Update internal performance metrics."""
         if error:
             self.metrics["errors"] += 1
+            metrics.AI_PROVIDER_ERRORS.inc(source)
             return
 
+        metrics.AI_PROVIDER_DURATION.observe(duration_ms / 1000.0, source)
+        if tokens:
+            metrics.AI_PROVIDER_TOKENS.inc(source, amount=tokens)
+
         key = f"{source}_requests"
-        count = self.metrics.get(key, 0)
         old_avg = self.metrics["avg_response_time_ms"]
-        total_requests = self.metrics["openai_requests"] + self.metrics["gemini_requests"]
+        total_requests = sum(v for k, v in self.metrics.items() if k.endswith("_requests"))
         
         # Incremental average calculation
         if total_requests > 0:
@@ -104,7 +204,7 @@ class AIService:
         else:
             self.metrics["avg_response_time_ms"] = duration_ms
             
-        self.metrics[key] += 1
+        self.metrics[key] = self.metrics.get(key, 0) + 1
         self.metrics["total_tokens"] += tokens
         
         try:
@@ -133,33 +233,20 @@ class AIService:
         }
         """
         
-        if self.gemini_available and self.vision_model:
-            try:
-                # If it's an image
-                if mime_type.startswith("image/"):
-                    response = await self.vision_model.generate_content_async([prompt, {"mime_type": mime_type, "data": content}])
-                else:
-                    # Text content
-                    response = await self.vision_model.generate_content_async([prompt, f"CONTENT:\n{content}"])
-                
-                return self._parse_json(response.text)
-            except Exception as e:
-                logger.error(f"Reference Analysis Error: {e}")
-                raise
-        
-        # Fallback for text only via OpenAI
-        if not mime_type.startswith("image/") and self.client:
-             response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a teacher's assistant."},
-                    {"role": "user", "content": f"{prompt}\n\nCONTENT:\n{content}"}
-                ],
-                response_format={"type": "json_object"}
-            )
-             return json.loads(response.choices[0].message.content)
-             
-        return {"error": "AI service unavailable for this operation"}
+        is_image = mime_type.startswith("image/")
+        request = AIRequest(
+            task="reference",
+            prompt=prompt if is_image else f"{prompt}\n\nCONTENT:\n{content}",
+            system="You are a teacher's assistant.",
+            image=content if is_image else None,
+            mime_type=mime_type,
+            json_mode=True,
+            json_object=True,
+        )
+        completion = await self._generate(request, "Reference Analysis", accept=lambda c: True)
+        if completion is None:
+            return {"error": "AI service unavailable for this operation"}
+        return completion.data
 
     async def process_vision_grading(self, image_data: bytes, mime_type: str, context: str = "", reference_data: Optional[Dict] = None) -> Dict[str, Any]:
         """
@@ -211,114 +298,39 @@ class AIService:
         }}
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                logger.info("Attempting Gemini Vision...")
-                start_time = time.time()
-                # Prepare image part
-                image_part = {
-                    "mime_type": mime_type,
-                    "data": image_data
-                }
-
-                response = await self.vision_model.generate_content_async([prompt, image_part])
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                result = self._parse_json(text)
-                
-                # Check for parsing error and return fallback
-                if "error" in result:
-                    logger.warning(f"Gemini Vision JSON Parse Failed. Raw: {text[:200]}")
-                    return {
-                        "student": "Unknown Student",
-                        "score": 0,
-                        "feedback": "Automated Grading Failed: The AI could not process this image via Gemini.",
-                        "annotations": [],
-                        "insights": {
-                            "strengths": ["N/A"],
-                            "weaknesses": ["Image processing failed"],
-                            "recommendation": "Please try again or use a different image."
-                        },
-                        "flags": ["System Error"],
-                        "grading_confidence": 0.0
-                    }
-
-                self._update_metrics(duration_ms, source="gemini")
-                return result
-            except Exception as e:
-                logger.error(f"Gemini Vision Error: {e}")
-
-        # Fallback to OpenAI Vision
-        if self.client:
-            try:
-                logger.info("Attempting OpenAI Vision Fallback...")
-                start_time = time.time()
-                
-                # Convert image data to base64 for OpenAI
-                import base64 as b64
-                base64_image = b64.b64encode(image_data).decode('utf-8')
-                
-                # Log a small part of the base64 and mime type for debugging
-                logger.info(f"OpenAI Vision Attempt - Mime: {mime_type}, Base64 length: {len(base64_image)}")
-
-                # Verify base64 image is not empty
-                if not base64_image:
-                    logger.error("Empty base64 image data")
-                    return {"error": "Failed to process image data"}
-
-                response = self.client.chat.completions.create(
-                    model=self.nova_model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a vision-capable AI that provides academic grading. You MUST return valid JSON matching the requested structure. Even if you cannot see the image clearly, provide a best guess or empty structure in JSON. JSON structure: {\"student\": \"string\", \"score\": number, \"feedback\": \"string\", \"annotations\": [{\"point\": \"string\", \"comment\": \"string\"}], \"insights\": {\"strengths\": [\"string\"], \"weaknesses\": [\"string\"], \"recommendation\": \"string\"}, \"flags\": [\"string\"], \"grading_confidence\": number}"
-                        },
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:{mime_type};base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=1000,
-                    response_format={"type": "json_object"}
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                result = self._parse_json(text)
-                
-                # Check for parsing error and return fallback
-                if "error" in result:
-                    logger.warning(f"OpenAI Vision JSON Parse Failed. Raw: {text[:200]}")
-                    return {
-                        "student": "Unknown Student",
-                        "score": 0,
-                        "feedback": "Automated Grading Failed: The AI could not process this image. It may not be recognized as an academic document. Please try uploading a clearer image of an assignment.",
-                        "annotations": [],
-                        "insights": {
-                            "strengths": ["N/A"],
-                            "weaknesses": ["Image not recognized as academic content"],
-                            "recommendation": "Upload a clear image of a student assignment or quiz."
-                        },
-                        "flags": ["Parsing Error"],
-                        "grading_confidence": 0.0
-                    }
-
-                self._update_metrics(duration_ms, source="openai")
-                return result
-            except Exception as e:
-                logger.error(f"OpenAI Vision Error: {e}")
-
-        return {"error": "All vision links are currently offline. Please check your API configuration."}
+        request = AIRequest(
+            task="grading",
+            prompt=prompt,
+            system="You are a vision-capable AI that provides academic grading. You MUST return valid JSON matching the requested structure. Even if you cannot see the image clearly, provide a best guess or empty structure in JSON. JSON structure: {\"student\": \"string\", \"score\": number, \"feedback\": \"string\", \"annotations\": [{\"point\": \"string\", \"comment\": \"string\"}], \"insights\": {\"strengths\": [\"string\"], \"weaknesses\": [\"string\"], \"recommendation\": \"string\"}, \"flags\": [\"string\"], \"grading_confidence\": number}",
+            image=image_data,
+            mime_type=mime_type,
+            json_mode=True,
+            json_object=True,
+            max_tokens=1000,
+            params={"total_marks": reference_data.get('total_marks', 100) if reference_data else 100, "has_reference": bool(reference_data)},
+        )
+        # A parse failure is answered with a readable fallback rather than another provider
+        completion = await self._generate(request, "Vision Grading", accept=lambda c: True)
+        if completion is None:
+            return {"error": "All vision links are currently offline. Please check your API configuration."}
+
+        result = completion.data
+        if "error" in result:
+            logger.warning(f"{completion.source} Vision JSON Parse Failed. Raw: {completion.text[:200]}")
+            return {
+                "student": "Unknown Student",
+                "score": 0,
+                "feedback": "Automated Grading Failed: The AI could not process this image. It may not be recognized as an academic document. Please try uploading a clearer image of an assignment.",
+                "annotations": [],
+                "insights": {
+                    "strengths": ["N/A"],
+                    "weaknesses": ["Image not recognized as academic content"],
+                    "recommendation": "Upload a clear image of a student assignment or quiz."
+                },
+                "flags": ["Parsing Error"],
+                "grading_confidence": 0.0
+            }
+        return result
 
     async def predict_performance(self, student_data: Dict[str, Any]) -> str:
         """Predict student performance based on historical data."""
@@ -333,42 +345,14 @@ class AIService:
         Be professional and supportive.
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                if text:
-                    self._update_metrics(duration_ms, source="gemini")
-                    return text
-            except Exception as e:
-                logger.error(f"Gemini Prediction Error: {e}")
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a predictive analytics engine for educational success."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                if text:
-                    self._update_metrics(duration_ms, source="openai")
-                    return text
-            except Exception as e:
-                logger.error(f"OpenAI Prediction Error: {e}")
-
-        return "Performance prediction unavailable at this moment."
+        completion = await self._generate(AIRequest(
+            task="prediction",
+            prompt=prompt,
+            system="You are a predictive analytics engine for educational success.",
+            temperature=0.7,
+            params={"name": student_data.get('name')},
+        ), "Prediction")
+        return completion.text if completion else "Performance prediction unavailable at this moment."
 
     async def solve_educational_problem(self, subject: str, topic: str, difficulty: str, grade: str, problem: str) -> Dict[str, Any]:
         """
@@ -421,46 +405,18 @@ class AIService:
         }}
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                result = self._parse_json(text)
-                
-                self._update_metrics(duration_ms, source="gemini")
-                return result
-            except Exception as e:
-                logger.error(f"Gemini Solver Error: {e}")
-                # Fall through to OpenAI
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional educational tutor specializing in solving problems accurately."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7,
-                    max_tokens=2048
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                result = self._parse_json(text)
-                
-                self._update_metrics(duration_ms, source="openai")
-                return result
-            except Exception as e:
-                logger.error(f"OpenAI Solver Error: {e}")
-
-        return {"error": "All neural links are currently offline. Please check your API configuration."}
+        completion = await self._generate(AIRequest(
+            task="solver",
+            prompt=prompt,
+            system="You are a professional educational tutor specializing in solving problems accurately.",
+            json_mode=True,
+            temperature=0.7,
+            max_tokens=2048,
+            params={"subject": subject, "difficulty": difficulty},
+        ), "Solver")
+        if completion is None:
+            return {"error": "All neural links are currently offline. Please check your API configuration."}
+        return completion.data
 
     async def analyze_url(self, url: str, site_snippet: str) -> Dict[str, Any]:
         """Analyze a school website to extract brand identity."""
@@ -489,95 +445,34 @@ class AIService:
         }}
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                result = self._parse_json(text)
-                
-                self._update_metrics(duration_ms, source="gemini")
-                return result
-            except Exception as e:
-                logger.error(f"Gemini URL Analysis Error: {e}")
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional brand analyst."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.2
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                result = self._parse_json(text)
-                
-                self._update_metrics(duration_ms, source="openai")
-                return result
-            except Exception as e:
-                logger.error(f"OpenAI URL Analysis Error: {e}")
-
-        return {"error": "Brand analysis service is currently offline."}
+        completion = await self._generate(AIRequest(
+            task="brand",
+            prompt=prompt,
+            system="You are a professional brand analyst.",
+            json_mode=True,
+            temperature=0.2,
+        ), "URL Analysis")
+        if completion is None:
+            return {"error": "Brand analysis service is currently offline."}
+        return completion.data
 
     async def chat(self, prompt: str, context: str = "") -> str:
         """Generic AI chat functionality."""
         full_prompt = f"{context}\n\n{prompt}" if context else prompt
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(full_prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                if text:
-                    self._update_metrics(duration_ms, source="gemini")
-                    return text
-            except Exception as e:
-                logger.error(f"Gemini Chat Error: {e}")
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are NOVA, a helpful AI assistant for the LUMI OS educational platform."},
-                        {"role": "user", "content": full_prompt}
-                    ],
-                    temperature=0.7
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                if text:
-                    self._update_metrics(duration_ms, source="openai")
-                    return text
-            except Exception as e:
-                logger.error(f"OpenAI Chat Error: {e}")
-
+        completion = await self._generate(AIRequest(
+            task="chat",
+            prompt=full_prompt,
+            system="You are NOVA, a helpful AI assistant for the LUMI OS educational platform.",
+            temperature=0.7,
+        ), "Chat")
+        if completion:
+            return completion.text
         return "I'm sorry, I'm having trouble connecting to my neural network right now."
 
     async def generate_syllabus(self, topic: str, grade: str, weeks: int = 4) -> Dict[str, Any]:
         """Generate a structured syllabus using Gemini."""
-        cache_key = f"syllabus:{topic}:{grade}:{weeks}"
-        cached = self.cache.get(cache_key)
-        if cached:
-            self.metrics["cache_hits"] += 1
-            logger.info(f"Cache hit for {cache_key}")
-            return cached
-
+        cache_key = cache_key_for("syllabus", topic, grade, weeks)
         prompt = f"""
         Generate a comprehensive {weeks}-week educational syllabus for the topic "{topic}" appropriate for Grade {grade}.
         
@@ -605,48 +500,16 @@ class AIService:
         Return ONLY raw JSON.
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                result = self._parse_json(text)
-                
-                if result:
-                    self.cache.set(cache_key, result)
-                    tokens = (len(prompt) + len(text)) // 4
-                    self._update_metrics(duration_ms, tokens, source="gemini")
-                    return result
-            except Exception as e:
-                logger.error(f"Gemini Syllabus Error: {e}")
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional academic curriculum designer."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                result = self._parse_json(text)
-                
-                if result:
-                    self.cache.set(cache_key, result)
-                    tokens = (len(prompt) + len(text)) // 4
-                    self._update_metrics(duration_ms, tokens, source="openai")
-                    return result
-            except Exception as e:
-                logger.error(f"OpenAI Syllabus Error: {e}")
+        data = await self._generate_cached(cache_key, AIRequest(
+            task="syllabus",
+            prompt=prompt,
+            system="You are a professional academic curriculum designer.",
+            json_mode=True,
+            temperature=0.7,
+            params={"topic": topic, "grade": grade, "weeks": weeks},
+        ), "Syllabus", expect=(dict, list))
+        if data:
+            return data
 
         # Return a meaningful structure if both AI fail
         return {
@@ -665,12 +528,7 @@ class AIService:
 
     async def generate_flashcards(self, topic: str, count: int = 10) -> List[Dict[str, Any]]:
         """Generate flashcards for a topic."""
-        cache_key = f"flashcards:{topic}:{count}"
-        cached = self.cache.get(cache_key)
-        if cached:
-            logger.info(f"Cache hit for {cache_key}")
-            return cached
-
+        cache_key = cache_key_for("flashcards", topic, count)
         prompt = f"""
         Generate {count} educational flashcards for the topic "{topic}".
         
@@ -685,59 +543,22 @@ class AIService:
         Return ONLY raw JSON.
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                result = self._parse_json(text)
-                
-                if result:
-                    self.cache.set(cache_key, result)
-                    tokens = (len(prompt) + len(text)) // 4
-                    self._update_metrics(duration_ms, tokens, source="gemini")
-                    return result
-            except Exception as e:
-                logger.error(f"Gemini Flashcard Error: {e}")
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional educational content creator."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                result = self._parse_json(text)
-                
-                if result:
-                    self.cache.set(cache_key, result)
-                    tokens = (len(prompt) + len(text)) // 4
-                    self._update_metrics(duration_ms, tokens, source="openai")
-                    return result
-            except Exception as e:
-                logger.error(f"OpenAI Flashcard Error: {e}")
+        data = await self._generate_cached(cache_key, AIRequest(
+            task="flashcards",
+            prompt=prompt,
+            system="You are a professional educational content creator.",
+            json_mode=True,
+            temperature=0.7,
+            params={"topic": topic, "count": count},
+        ), "Flashcard")
+        if data:
+            return data
 
         return []
 
     async def generate_quiz(self, topic: str, count: int = 5) -> List[Dict[str, Any]]:
         """Generate a multiple choice quiz."""
-        cache_key = f"quiz:{topic}:{count}"
-        cached = self.cache.get(cache_key)
-        if cached:
-            logger.info(f"Cache hit for {cache_key}")
-            return cached
-
+        cache_key = cache_key_for("quiz", topic, count)
         prompt = f"""
         Create a {count}-question multiple choice quiz about "{topic}".
         
@@ -754,48 +575,16 @@ class AIService:
         Return ONLY raw JSON.
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                result = self._parse_json(text)
-                
-                if result:
-                    self.cache.set(cache_key, result)
-                    tokens = (len(prompt) + len(text)) // 4
-                    self._update_metrics(duration_ms, tokens, source="gemini")
-                    return result
-            except Exception as e:
-                logger.error(f"Gemini Quiz Error: {e}")
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional educational assessment designer."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                result = self._parse_json(text)
-                
-                if result:
-                    self.cache.set(cache_key, result)
-                    tokens = (len(prompt) + len(text)) // 4
-                    self._update_metrics(duration_ms, tokens, source="openai")
-                    return result
-            except Exception as e:
-                logger.error(f"OpenAI Quiz Error: {e}")
+        data = await self._generate_cached(cache_key, AIRequest(
+            task="quiz",
+            prompt=prompt,
+            system="You are a professional educational assessment designer.",
+            json_mode=True,
+            temperature=0.7,
+            params={"topic": topic, "count": count},
+        ), "Quiz")
+        if data:
+            return data
 
         return []
 
@@ -813,80 +602,18 @@ class AIService:
         Use Markdown formatting.
         """
 
-        # Try Gemini first
-        if self.gemini_available and self.vision_model:
-            try:
-                start_time = time.time()
-                response = await self.vision_model.generate_content_async(prompt)
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.text
-                if text:
-                    self._update_metrics(duration_ms, source="gemini")
-                    return text
-            except Exception as e:
-                logger.error(f"Gemini Report Error: {e}")
-
-        # Fallback to OpenAI
-        if self.client:
-            try:
-                start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a professional academic advisor and counselor."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-                duration_ms = (time.time() - start_time) * 1000
-                
-                text = response.choices[0].message.content
-                if text:
-                    self._update_metrics(duration_ms, source="openai")
-                    return text
-            except Exception as e:
-                logger.error(f"OpenAI Report Error: {e}")
-
-        return "Report generation failed. Please try again later."
+        completion = await self._generate(AIRequest(
+            task="report",
+            prompt=prompt,
+            system="You are a professional academic advisor and counselor.",
+            temperature=0.7,
+            params={"name": student_data.get('name')},
+        ), "Report")
+        return completion.text if completion else "Report generation failed. Please try again later."
 
     def _parse_json(self, text: str) -> Any:
         """Helper to parse JSON from AI response, cleaning up markdown if needed."""
-        try:
-            clean_text = text.strip()
-            # If it's a markdown response but NOT JSON, try to extract anything that looks like JSON
-            if "{" not in clean_text and "[" not in clean_text:
-                 # This might be a conversational response from a model that failed vision
-                 logger.warning(f"AI returned non-JSON text: {text[:100]}...")
-                 return {"error": "AI failed to return structured data", "raw": text}
-
-            if "```json" in clean_text:
-                clean_text = clean_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in clean_text:
-                clean_text = clean_text.split("```")[1].split("```")[0].strip()
-            
-            # Remove any trailing commas before closing braces/brackets
-            clean_text = re.sub(r',\s*([\]}])', r'\1', clean_text)
-            
-            return json.loads(clean_text)
-        except Exception as e:
-            logger.error(f"JSON Parse Error: {e} | Raw: {text[:200]}...")
-            # Try one more aggressive cleanup: find first { and last }
-            try:
-                start = clean_text.find("{")
-                end = clean_text.rfind("}") + 1
-                if start != -1 and end != 0:
-                    return json.loads(clean_text[start:end])
-            except:
-                pass
-
-            # Fallback: if it fails, try a very simple cleanup
-            try:
-                # Replace single backslashes with double backslashes, but avoid tripling existing double backslashes
-                fixed_text = re.sub(r'(?<!\\)\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', clean_text)
-                return json.loads(fixed_text)
-            except:
-                return {"error": "Structured data parsing failed", "raw": text}
+        return parse_json(text)
 
     async def generate_landing_chat_response(self, prompt: str, history: List[Dict[str, str]] = [], language: str = "en") -> Dict[str, Any]:
         """
@@ -908,14 +635,9 @@ class AIService:
                 "model": "nova-core-help"
             }
 
-        # If OpenAI client is not initialized, try to fallback to Gemini if available
-        if not self.client:
-            if self.gemini_available and self.lumix_model:
-                logger.info("OpenAI client not initialized, falling back to Gemini for landing chat")
-                return await self._generate_gemini_landing_chat_response(prompt, history, language)
-            
-            logger.error("OpenAI client not initialized and Gemini unavailable")
-            # FALLBACK: If both are missing, return a simulation response so the demo doesn't crash
+        if not self._chain():
+            logger.error("No AI provider available for landing chat")
+            # FALLBACK: If every provider is missing, return a simulation response so the demo doesn't crash
             return {
                 "response": "I am currently operating in offline simulation mode. My neural link to the OpenAI core is inactive, but I can still greet you! Welcome to LumiX.",
                 "model": "offline-simulation"
@@ -974,97 +696,34 @@ class AIService:
         If the user asks a question about the system, answer it fully and conversationally in the target language.
         """
 
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add history (context management)
-        # Limit history to last 5 exchanges to keep it concise
-        messages.extend(history[-10:])
-        
-        # Add current prompt
-        messages.append({"role": "user", "content": prompt})
-
-        try:
-            start_time = time.time()
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1024,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0
-            )
-            duration_ms = (time.time() - start_time) * 1000
-            
-            text = response.choices[0].message.content
-            tokens = response.usage.total_tokens
-            
-            self._update_metrics(duration_ms, tokens, source="openai")
-            logger.info(f"AI Response generated in {duration_ms:.2f}ms using {self.model}")
-            
+        errors = []
+        completion = await self._generate(AIRequest(
+            task="landing_chat",
+            prompt=prompt,
+            system=system_prompt,
+            history=history[-10:],
+            temperature=0.7,
+            max_tokens=1024,
+        ), "Landing Chat", prefer="openai", errors=errors)
+
+        if completion is not None:
+            logger.info(f"AI Response generated in {completion.duration_ms:.2f}ms using {completion.model}")
             return {
-                "response": text,
-                "model": self.model,
+                "response": completion.text,
+                "model": completion.model,
                 "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": tokens
+                    "prompt_tokens": completion.prompt_tokens,
+                    "completion_tokens": completion.completion_tokens,
+                    "total_tokens": completion.tokens
                 }
             }
 
-        except Exception as e:
-            logger.error(f"OpenAI API Error: {e}")
-            self._update_metrics(0, error=True)
-            
-            # Fallback to Gemini if OpenAI fails
-            if self.gemini_available and self.lumix_model:
-                logger.info("OpenAI failed, falling back to Gemini for landing chat")
-                return await self._generate_gemini_landing_chat_response(prompt, history, language)
-                
-            error_msg = str(e)
-            if "rate_limit" in error_msg.lower():
-                return {"response": "I'm receiving too many requests right now. Please wait a moment.", "error": "rate_limit_exceeded"}
-            elif "invalid_api_key" in error_msg.lower():
-                return {"response": "My neural link configuration is invalid.", "error": "invalid_api_key"}
-            else:
-                return {"response": "My neural link is currently unstable. Please try again later.", "error": "provider_error"}
-
-    async def _generate_gemini_landing_chat_response(self, prompt: str, history: List[Dict[str, str]] = [], language: str = "en") -> Dict[str, Any]:
-        """Gemini fallback for landing page chat."""
-        # Reuse the system prompt logic but adapt for Gemini
-        lang_instructions = {
-            "ur": "Respond strictly in Urdu script (اردو).",
-            "hi": "Respond strictly in Hindi Devanagari script (हिन्दी).",
-            "ar": "Respond strictly in Arabic script (العربية).",
-            "fr": "Respond in elegant French (Français).",
-            "es": "Respond in professional Spanish (Español)."
-        }
-        target_lang_instruction = lang_instructions.get(language, "Respond in natural, professional English.")
-        
-        system_prompt = f"You are NOVA, the soulful AI companion for LumiX. Created by Faizain Murtuza. {target_lang_instruction}"
-        
-        # Format history for Gemini
-        # Gemini uses 'user' and 'model' (instead of 'assistant')
-        chat = self.lumix_model.start_chat(history=[])
-        
-        # In simple implementation, we'll just send the full context as one prompt
-        # to avoid complex history conversion for now
-        context_str = "\n".join([f"{h['role']}: {h['content']}" for h in history[-5:]])
-        full_prompt = f"{system_prompt}\n\nContext:\n{context_str}\n\nUser: {prompt}"
-        
-        try:
-            start_time = time.time()
-            response = await self.lumix_model.generate_content_async(full_prompt)
-            duration_ms = (time.time() - start_time) * 1000
-            
-            self._update_metrics(duration_ms, source="gemini")
-            
-            return {
-                "response": response.text,
-                "model": "gemini-2.0-flash-fallback"
-            }
-        except Exception as e:
-            logger.error(f"Gemini Fallback Error: {e}")
-            return {"response": "My neural links are completely offline. Please check back later."}
+        error_msg = " ".join(str(e) for e in errors).lower()
+        if "rate_limit" in error_msg:
+            return {"response": "I'm receiving too many requests right now. Please wait a moment.", "error": "rate_limit_exceeded"}
+        elif "invalid_api_key" in error_msg:
+            return {"response": "My neural link configuration is invalid.", "error": "invalid_api_key"}
+        else:
+            return {"response": "My neural link is currently unstable. Please try again later.", "error": "provider_error"}
 
 ai_service = AIService(settings.OPENAI_API_KEY, settings.GEMINI_API_KEY)
@@ -0,0 +1,245 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Write-behind audit log pipeline.
+
+The HTTP middleware only enqueues a plain dict per request; a background task
+drains the bounded queue and bulk-inserts rows into `audit_logs`, flushing when
+a batch fills up or the flush interval elapses. The request path never waits on
+the database and never blocks when the queue is full. AuditPolicy decides which
+requests are worth a row at all.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from . import database, models
+from .config import settings
+
+logger = logging.getLogger("lumios.audit")
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest")
+READ_METHODS = frozenset(("GET", "HEAD"))
+
+
+class AuditPolicy:
+    """
+    Route classes for auditing:
+    - preflights (OPTIONS) and liveness paths are never logged
+    - writes and error responses (status >= 400) are always logged
+    - successful reads are sampled at `read_sample_rate`
+
+    `sample_rate()` returns the rate a logged row was kept at (1.0 for
+    always-logged rows) so rollups can re-weight sampled counts, or None when
+    the request should not be logged.
+    """
+
+    def __init__(self, read_sample_rate: float = 1.0, skip_paths=(), rng: Callable[[], float] = random.random):
+        self.read_sample_rate = min(1.0, max(0.0, float(read_sample_rate)))
+        # Entries ending in "*" match by prefix, everything else exactly
+        self.skip_exact = frozenset(p for p in skip_paths if p and not p.endswith("*"))
+        self.skip_prefixes = tuple(p[:-1] for p in skip_paths if p.endswith("*"))
+        self._rng = rng
+
+    def skips(self, method: str, path: str) -> bool:
+        return method == "OPTIONS" or path in self.skip_exact or path.startswith(self.skip_prefixes)
+
+    def sample_rate(self, method: str, path: str, status_code: int) -> Optional[float]:
+        if self.skips(method, path):
+            return None
+        if method not in READ_METHODS or status_code >= 400:
+            return 1.0
+        rate = self.read_sample_rate
+        if rate >= 1.0:
+            return 1.0
+        if rate <= 0.0 or self._rng() >= rate:
+            return None
+        return rate
+
+
+class AuditWriter:
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Any]] = None,
+        max_queue: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        overflow_policy: str = "drop_newest",
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown audit overflow policy: {overflow_policy}")
+        # Resolved lazily so test suites patching database.SessionLocal are honoured
+        self._session_factory = session_factory
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.overflow_policy = overflow_policy
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Rows taken off the queue but not yet handed to the DB thread
+        self._batch: List[Dict[str, Any]] = []
+
+        self.metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "last_flush_ms": 0,
+        }
+
+    # --- request path ---
+
+    def submit(self, row: Dict[str, Any]) -> bool:
+        """Queue one audit row without waiting. Returns False if the row was dropped."""
+        row.setdefault("created_at", datetime.utcnow())
+        self._ensure_running()
+        queue = self._queue
+        if queue.full():
+            if self.overflow_policy == "drop_newest":
+                self.metrics["dropped"] += 1
+                return False
+            try:
+                queue.get_nowait()
+                self.metrics["dropped"] += 1
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(row)
+        self.metrics["enqueued"] += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "running": bool(self._task and not self._task.done()),
+        }
+
+    # --- lifecycle ---
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+
+        # First use, or the previous loop went away (serverless invocations, test
+        # clients): carry over anything still queued to a fresh queue on this loop.
+        leftovers = self._drain_queue()
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        for row in leftovers[-self.max_queue:]:
+            self._queue.put_nowait(row)
+        self.metrics["dropped"] += max(0, len(leftovers) - self.max_queue)
+        self._task = loop.create_task(self._run())
+
+    async def flush(self):
+        """Write everything currently queued, in batches, off the event loop."""
+        rows = self._batch + self._drain_queue()
+        self._batch = []
+        for i in range(0, len(rows), self.batch_size):
+            await asyncio.to_thread(self._write_batch, rows[i:i + self.batch_size])
+
+    async def stop(self):
+        """Graceful shutdown: flush pending rows, then stop the drain task."""
+        if self._task is not None and not self._task.done() and self._loop is asyncio.get_running_loop():
+            await self.flush()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        else:
+            self._write_remaining()
+        self._task = None
+
+    # --- drain task ---
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        try:
+            while True:
+                self._batch = [await queue.get()]
+                deadline = loop.time() + self.flush_interval
+                while len(self._batch) < self.batch_size:
+                    try:
+                        self._batch.append(queue.get_nowait())
+                        continue
+                    except asyncio.QueueEmpty:
+                        pass
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        self._batch.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                batch, self._batch = self._batch, []
+                await asyncio.to_thread(self._write_batch, batch)
+        except asyncio.CancelledError:
+            # The loop is going away; do not lose what we already accepted.
+            self._write_remaining()
+            raise
+
+    def _drain_queue(self) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        if self._queue is None:
+            return rows
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return rows
+
+    def _write_remaining(self):
+        rows = self._batch + self._drain_queue()
+        self._batch = []
+        for i in range(0, len(rows), self.batch_size):
+            self._write_batch(rows[i:i + self.batch_size])
+
+    def _write_batch(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        started = time.perf_counter()
+        session_factory = self._session_factory or database.SessionLocal
+        db = session_factory()
+        try:
+            db.execute(insert(models.AuditLog), rows)
+            db.commit()
+            self.metrics["written"] += len(rows)
+            self.metrics["batches"] += 1
+        except Exception as e:
+            db.rollback()
+            self.metrics["failed_batches"] += 1
+            self.metrics["dropped"] += len(rows)
+            logger.error(f"Audit batch write failed ({len(rows)} rows): {e}")
+        finally:
+            db.close()
+            self.metrics["last_flush_ms"] = int((time.perf_counter() - started) * 1000)
+
+
+audit_policy = AuditPolicy(
+    read_sample_rate=settings.AUDIT_READ_SAMPLE_RATE,
+    skip_paths=[p.strip() for p in settings.AUDIT_SKIP_PATHS.split(",") if p.strip()],
+)
+
+audit_writer = AuditWriter(
+    max_queue=settings.AUDIT_QUEUE_MAXSIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_MS / 1000.0,
+    overflow_policy=settings.AUDIT_OVERFLOW_POLICY,
+)
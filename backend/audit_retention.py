@@ -0,0 +1,272 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Audit log retention.
+
+`audit_logs` is the hot table: the write-behind writer inserts into it. The
+compaction job keeps it small:
+
+1. Rows older than AUDIT_HOT_DAYS move into per-month buckets. On SQLite each
+   month is its own table (`audit_logs_YYYYMM`); on Postgres the buckets are
+   native range partitions of `audit_logs_archive`.
+2. Once a whole month is older than AUDIT_RAW_RETENTION_DAYS, its bucket is
+   rolled up into `audit_daily_rollups` (counts per day, school, path and
+   status code) and dropped. Dropping a table is O(1) and hands its pages back
+   for reuse, so the database stops growing instead of accumulating DELETEs.
+
+Admin listings read the hot table and, when their range reaches past it, the
+buckets too (`readable_tables`), so raw rows stay visible for the whole
+retention period. On Postgres the listing goes through `audit_logs_archive`
+and the planner prunes partitions by created_at. `audit_logs` itself stays an
+ordinary table there: a partitioned parent would need created_at in its
+primary key, and the hot table is small once compaction runs. Listings page
+by (created_at, id) across all of these, so ids must not repeat between the
+hot table and the buckets; see `archive_hot_rows`.
+
+Usage:
+    python -m backend.audit_retention
+"""
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData, String, Table, cast, func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import database, models
+from .config import settings
+
+logger = logging.getLogger("lumios.audit")
+
+ARCHIVE_PREFIX = "audit_logs_"
+PG_ARCHIVE_TABLE = "audit_logs_archive"
+AUDIT_COLUMNS = ("id", "created_at", "user_id", "school_id", "ip", "method", "path", "status_code", "user_agent", "request_id", "sample_rate")
+
+_BUCKET_NAME = re.compile(r"^audit_logs_(?:archive_)?(\d{4})(\d{2})$")
+
+
+def _month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def _next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + 1, 1, 1) if dt.month == 12 else datetime(dt.year, dt.month + 1, 1)
+
+
+def bucket_name(month: datetime, dialect: str) -> str:
+    if dialect == "postgresql":
+        return f"{PG_ARCHIVE_TABLE}_{month:%Y%m}"
+    return f"{ARCHIVE_PREFIX}{month:%Y%m}"
+
+
+def _bucket_table(name: str) -> Table:
+    # Same columns as audit_logs; only created_at is indexed since buckets are
+    # only ever scanned by month for rollup.
+    return Table(
+        name,
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("created_at", DateTime),
+        Column("user_id", Integer),
+        Column("school_id", String),
+        Column("ip", String),
+        Column("method", String),
+        Column("path", String),
+        Column("status_code", Integer),
+        Column("user_agent", String),
+        Column("request_id", String),
+        Column("sample_rate", Float),
+        Index(f"ix_{name}_created_at", "created_at"),
+    )
+
+
+def list_buckets(conn) -> Dict[datetime, str]:
+    """Existing month buckets, keyed by the first day of their month."""
+    buckets = {}
+    for name in inspect(conn).get_table_names():
+        match = _BUCKET_NAME.match(name)
+        if match and (name.startswith(PG_ARCHIVE_TABLE) == (conn.dialect.name == "postgresql")):
+            buckets[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return buckets
+
+
+def readable_tables(conn, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    before: Optional[datetime] = None) -> List[Table]:
+    """
+    audit_logs, then every archive that can hold rows created in
+    [since, until) and before `before` (a keyset cursor), newest first.
+    """
+    tables = [models.AuditLog.__table__]
+    buckets = list_buckets(conn)
+    if conn.dialect.name == "postgresql":
+        # One parent; partition pruning picks the months
+        return tables + [_bucket_table(PG_ARCHIVE_TABLE)] if buckets else tables
+    for month, name in sorted(buckets.items(), reverse=True):
+        end = _next_month(month)
+        if since is not None and end <= since:
+            continue
+        if (until is not None and month >= until) or (before is not None and month > before):
+            continue
+        tables.append(_bucket_table(name))
+    return tables
+
+
+def _ensure_bucket(conn, month: datetime) -> str:
+    dialect = conn.dialect.name
+    name = bucket_name(month, dialect)
+    if dialect == "postgresql":
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {PG_ARCHIVE_TABLE} "
+            f"(LIKE audit_logs INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text(f"ALTER TABLE {PG_ARCHIVE_TABLE} ADD COLUMN IF NOT EXISTS sample_rate FLOAT"))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{PG_ARCHIVE_TABLE}_created_at ON {PG_ARCHIVE_TABLE} (created_at)"
+        ))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PG_ARCHIVE_TABLE} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        ))
+    else:
+        _bucket_table(name).create(conn, checkfirst=True)
+        # Buckets created before audit sampling existed lack sample_rate
+        if "sample_rate" not in {c["name"] for c in inspect(conn).get_columns(name)}:
+            conn.execute(text(f"ALTER TABLE {name} ADD COLUMN sample_rate FLOAT"))
+    return name
+
+
+def _reuses_ids(conn) -> bool:
+    """
+    True for a SQLite audit_logs created without AUTOINCREMENT: it hands out
+    max(id) + 1, so ids of archived rows come back once the rows above them go.
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'audit_logs'")).scalar()
+    return "AUTOINCREMENT" not in (ddl or "").upper()
+
+
+def archive_hot_rows(conn, cutoff: datetime) -> int:
+    """Move audit_logs rows created before `cutoff` into their month buckets."""
+    audit = models.AuditLog.__table__
+    oldest = conn.execute(select(func.min(audit.c.created_at)).where(audit.c.created_at < cutoff)).scalar()
+    if oldest is None:
+        return 0
+
+    # Listings page by (created_at, id) across the hot table and the buckets,
+    # so an id must stay unique across both; where the table would reuse ids,
+    # its highest one stays behind until a newer row arrives
+    keep = None
+    if _reuses_ids(conn):
+        keep = conn.execute(select(func.max(audit.c.id))).scalar()
+
+    moved = 0
+    cols = ", ".join(AUDIT_COLUMNS)
+    month = _month_start(oldest)
+    while month < cutoff:
+        end = min(_next_month(month), cutoff)
+        params = {"start": month, "end": end, "keep": keep}
+        in_month = (audit.c.created_at >= month) & (audit.c.created_at < end)
+        if keep is not None:
+            in_month &= audit.c.id != keep
+        if conn.execute(select(audit.c.id).where(in_month).limit(1)).first() is None:
+            month = _next_month(month)
+            continue
+        name = _ensure_bucket(conn, month)
+        where = "created_at >= :start AND created_at < :end"
+        if keep is not None:
+            where += " AND id != :keep"
+        conn.execute(text(f"INSERT INTO {name} ({cols}) SELECT {cols} FROM audit_logs WHERE {where}"), params)
+        moved += conn.execute(text(f"DELETE FROM audit_logs WHERE {where}"), params).rowcount or 0
+        month = _next_month(month)
+    return moved
+
+
+def _upsert_rollups(conn, rows: List[Dict[str, Any]]):
+    table = models.AuditDailyRollup.__table__
+    dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "school_id", "path", "status_code"],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+    conn.execute(stmt, rows)
+
+
+def rollup_bucket(conn, name: str) -> int:
+    """
+    Fold one month bucket into audit_daily_rollups. Sampled rows count as
+    1 / sample_rate requests. Returns the raw row count.
+    """
+    bucket = _bucket_table(name)
+    day = cast(func.date(bucket.c.created_at), String)
+    school = func.coalesce(bucket.c.school_id, "")
+    path = func.coalesce(bucket.c.path, "")
+    status = func.coalesce(bucket.c.status_code, 0)
+    weight = 1.0 / func.coalesce(func.nullif(bucket.c.sample_rate, 0), 1.0)
+    grouped = conn.execute(
+        select(day, school, path, status, func.count(), func.sum(weight))
+        .group_by(day, school, path, status)
+    ).all()
+    if not grouped:
+        return 0
+    _upsert_rollups(conn, [
+        {"day": d, "school_id": s, "path": p, "status_code": c, "count": int(round(w))}
+        for d, s, p, c, _, w in grouped
+    ])
+    return sum(row[4] for row in grouped)
+
+
+def compact(
+    engine=None,
+    now: Optional[datetime] = None,
+    hot_days: Optional[int] = None,
+    retention_days: Optional[int] = None,
+) -> Dict[str, int]:
+    """Run one archive + rollup + drop pass. Safe to run repeatedly."""
+    engine = engine or database.engine
+    now = now or datetime.utcnow()
+    retention_days = settings.AUDIT_RAW_RETENTION_DAYS if retention_days is None else retention_days
+    hot_days = min(settings.AUDIT_HOT_DAYS if hot_days is None else hot_days, retention_days)
+
+    stats = {"archived": 0, "rolled_up": 0, "buckets_dropped": 0}
+    retention_cutoff = now - timedelta(days=retention_days)
+
+    with engine.begin() as conn:
+        stats["archived"] = archive_hot_rows(conn, now - timedelta(days=hot_days))
+
+    # One transaction per bucket: counts are only added if the drop commits too
+    with engine.connect() as conn:
+        buckets = sorted(list_buckets(conn).items())
+    for month, name in buckets:
+        if _next_month(month) > retention_cutoff:
+            continue
+        with engine.begin() as conn:
+            stats["rolled_up"] += rollup_bucket(conn, name)
+            conn.execute(text(f"DROP TABLE {name}"))
+        stats["buckets_dropped"] += 1
+
+    if stats["archived"] or stats["buckets_dropped"]:
+        logger.info("Audit compaction finished", extra=stats)
+    return stats
+
+
+async def run_periodically(interval_seconds: float):
+    """Compact on startup and then every `interval_seconds`, off the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(compact)
+        except Exception as e:
+            logger.error(f"Audit compaction failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(compact())
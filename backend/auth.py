@@ -4,20 +4,26 @@ Created by: Faizain Murtuza
 © 2025 Faizain Murtuza. All Rights Reserved.
 """
 
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, List, Dict, Mapping, NamedTuple, Tuple
 import hashlib
 import secrets
 import logging
-from types import SimpleNamespace
+import threading
+import time
+from types import MappingProxyType, SimpleNamespace
 
 logger = logging.getLogger("lumios.auth")
 from jose import jwt, JWTError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from . import schemas, database, models
+from . import schemas, database, metrics, models
 from .config import settings
+from .identity_cache import UserSnapshot, identity_cache, identity_epochs
+from .password_hasher import password_hasher
+from .quota_leases import lease_block, quota_leases
 
 # Configuration
 SECRET_KEY = settings.SECRET_KEY
@@ -25,23 +31,83 @@ ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
 # Password Hashing - Centralized for production security
-# OWASP recommends 600,000 iterations for PBKDF2-HMAC-SHA256
-HASH_ITERATIONS = 600000
-
+# Stored format: $<algorithm>$<k=v,...>$<salt hex>$<digest hex>
+#   $pbkdf2-sha256$i=600000$...$...
+#   $scrypt$n=32768,r=8,p=1$...$...
+# Hashes from before the format existed are bare "salt:digest" PBKDF2 at 600,000
+# iterations; they still verify and are rewritten on the next successful login.
+LEGACY_HASH_ITERATIONS = 600000
+PASSWORD_HASH_ALGORITHMS = ("pbkdf2-sha256", "scrypt")
+
+def _configured_algorithm() -> str:
+    """PASSWORD_HASH_ALGORITHM, refusing anything it would otherwise silently treat as PBKDF2."""
+    algorithm = settings.PASSWORD_HASH_ALGORITHM
+    if algorithm not in PASSWORD_HASH_ALGORITHMS:
+        raise ValueError(f"Unknown PASSWORD_HASH_ALGORITHM {algorithm!r}; expected one of {', '.join(PASSWORD_HASH_ALGORITHMS)}")
+    return algorithm
+
+# Checked at import so a misspelt setting stops the app instead of every login
+_configured_algorithm()
+
+def _scrypt_maxmem(n: int, r: int, p: int) -> int:
+    # hashlib.scrypt refuses anything above 32 MiB unless told otherwise
+    return 128 * r * (n + p + 2) + (1 << 20)
+
+def _current_params() -> Dict[str, int]:
+    if _configured_algorithm() == "scrypt":
+        return {"n": settings.PASSWORD_SCRYPT_N, "r": settings.PASSWORD_SCRYPT_R, "p": settings.PASSWORD_SCRYPT_P}
+    return {"i": settings.PASSWORD_PBKDF2_ITERATIONS}
+
+def _derive(algorithm: str, params: Dict[str, int], password: str, salt: bytes) -> bytes:
+    secret = password.encode("utf-8")
+    if algorithm == "pbkdf2-sha256":
+        return password_hasher.derive("sha256", secret, salt, params["i"])
+    if algorithm == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        return password_hasher.run(hashlib.scrypt, secret, salt=salt, n=n, r=r, p=p, maxmem=_scrypt_maxmem(n, r, p), dklen=32)
+    raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+
+def _parse_hash(hashed_password: str):
+    """(algorithm, params, salt, digest hex); ValueError if unreadable."""
+    if hashed_password.startswith("$"):
+        _, algorithm, raw_params, salt_hex, digest_hex = hashed_password.split("$")
+        params = {k: int(v) for k, v in (item.split("=") for item in raw_params.split(","))}
+        return algorithm, params, bytes.fromhex(salt_hex), digest_hex
+    salt_hex, digest_hex = hashed_password.split(":")
+    return "pbkdf2-sha256", {"i": LEGACY_HASH_ITERATIONS}, bytes.fromhex(salt_hex), digest_hex
+
+# Derivation runs on the bounded hashing pool; HasherSaturated (and HasherUnavailable) propagate (503)
 def get_password_hash(password: str) -> str:
-    """Generate a secure password hash using PBKDF2-HMAC-SHA256."""
-    salt = secrets.token_bytes(16).hex()
-    dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), bytes.fromhex(salt), HASH_ITERATIONS)
-    return f"{salt}:{dk.hex()}"
+    """Hash with the configured algorithm and cost (PASSWORD_HASH_ALGORITHM)."""
+    algorithm = _configured_algorithm()
+    params = _current_params()
+    salt = secrets.token_bytes(16)
+    dk = _derive(algorithm, params, password, salt)
+    encoded = ",".join(f"{k}={v}" for k, v in params.items())
+    return f"${algorithm}${encoded}${salt.hex()}${dk.hex()}"
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against its hashed version."""
+    """Verify a plain password against a stored hash of any supported format."""
+    try:
+        algorithm, params, salt, digest_hex = _parse_hash(hashed_password)
+    except (ValueError, TypeError, AttributeError, KeyError):
+        return False
     try:
-        salt_hex, hash_hex = hashed_password.split(":")
-        dk = hashlib.pbkdf2_hmac('sha256', plain_password.encode('utf-8'), bytes.fromhex(salt_hex), HASH_ITERATIONS)
-        return dk.hex() == hash_hex
-    except (ValueError, TypeError, Exception):
+        dk = _derive(algorithm, params, plain_password, salt)
+    except (ValueError, TypeError, KeyError, OverflowError):
+        # Parameters no KDF accepts: a corrupt hash, not a hashing outage
         return False
+    return secrets.compare_digest(dk.hex(), digest_hex)
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when the stored hash is legacy or not at the configured algorithm and cost."""
+    if not (hashed_password or "").startswith("$"):
+        return True
+    try:
+        algorithm, params, _, _ = _parse_hash(hashed_password)
+    except (ValueError, TypeError, AttributeError, KeyError):
+        return True
+    return algorithm != _configured_algorithm() or params != _current_params()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -212,6 +278,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def entitlement_claims(user: models.User) -> Dict[str, Any]:
+    """
+    Compact "ent" claim for access tokens: everything FeatureAccess and
+    RoleChecker decide on, plus the identity epoch it was issued at.
+    """
+    expiry = getattr(user, "subscription_expiry", None)
+    if expiry is not None and expiry.tzinfo is not None:
+        expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+    return {
+        "uid": user.id,
+        "role": user.role,
+        "plan": normalize_plan(getattr(user, "plan", None)),
+        "st": user.subscription_status,
+        "x": int((expiry - datetime(1970, 1, 1)).total_seconds()) if expiry is not None else None,
+        "sc": getattr(user, "school_id", None),
+        "ep": int(getattr(user, "identity_version", 0) or 0),
+        "su": bool(getattr(user, "is_suspended", False)),
+    }
+
+
 def create_demo_access_token(
     expires_delta: Optional[timedelta] = None,
     *,
@@ -260,13 +346,37 @@ def create_dev_access_token(
 def is_production() -> bool:
     return settings.ENVIRONMENT == "production"
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
+def _remember_identity(request: Optional[Request], user):
+    """Expose the resolved identity on request.state for audit_middleware."""
+    if request is not None and user is not None:
+        request.state.user_id = getattr(user, "id", None)
+        request.state.school_id = getattr(user, "school_id", None)
+    return user
+
+class ClaimsCache:
+    """
+    Verified access-token claims keyed by a digest of the token, kept until the
+    token's exp. A dashboard firing many parallel calls with one token pays for
+    one signature check per worker instead of one per call.
+    """
+
+    def __init__(self, max_entries: int = 4096, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+    def decode(self, token: str) -> Mapping[str, Any]:
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                metrics.JWT_CLAIMS_CACHE_LOOKUPS.inc("hit")
+                return entry[0]
+        metrics.JWT_CLAIMS_CACHE_LOOKUPS.inc("miss")
+        # Raises JWTError (including expiry) exactly as before; failures are not cached
         payload = jwt.decode(
             token,
             SECRET_KEY,
@@ -274,6 +384,35 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             audience="lumios-frontend",
             issuer="lumios-api",
         )
+        claims = MappingProxyType(payload)
+        with self._lock:
+            self._entries[key] = (claims, float(payload.get("exp") or 0))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+claims_cache = ClaimsCache(max_entries=settings.JWT_CLAIMS_CACHE_SIZE)
+
+
+def decode_access_token(token: str) -> Mapping[str, Any]:
+    """Verified, read-only claims for an access token; raises JWTError."""
+    return claims_cache.decode(token)
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db), request: Request = None):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             logger.warning(f"No username in payload: {payload}")
@@ -298,7 +437,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             logger.warning(f"Developer email not in allowlist: {email}")
             raise credentials_exception
             
-        return SimpleNamespace(
+        return _remember_identity(request, SimpleNamespace(
             id=None,
             username=username,
             full_name=(payload.get("name") or "Developer Session"),
@@ -311,10 +450,10 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             token_version=0,
             profile=SimpleNamespace(email=email),
             is_developer=True
-        )
+        ))
 
     if role == "demo" and sub_status == "demo":
-        return SimpleNamespace(
+        return _remember_identity(request, SimpleNamespace(
             id=None,
             username=username,
             full_name=(payload.get("name") or "Demo Session"),
@@ -327,22 +466,41 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             token_version=0,
             profile=None,
             is_developer=False
-        )
+        ))
+
+    snapshot = resolve_identity(db, username, payload.get("tv"))
+    if snapshot is None:
+        raise credentials_exception
+    return _remember_identity(request, snapshot)
+
 
+def resolve_identity(db: Session, username: str, token_tv: Optional[int]) -> Optional[UserSnapshot]:
+    """
+    UserSnapshot for a token's subject and token version, from the identity
+    cache when it is current, else one query. None if the user is gone or the
+    token version was revoked.
+    """
+    key = (username, int(token_tv) if token_tv is not None else None)
+    snapshot = identity_cache.get(key)
+    if snapshot is not None:
+        # Another worker may have changed this user since it was cached
+        identity_epochs.refresh_if_due(db)
+        if identity_epochs.current(snapshot.id) <= snapshot.identity_version:
+            return snapshot
+
+    # User.profile is joined-eager, so the snapshot costs one query
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         logger.warning(f"User not found in DB: '{username}'")
-        raise credentials_exception
+        return None
 
-    token_tv = payload.get("tv")
     if token_tv is not None and int(token_tv) != int(getattr(user, "token_version", 0) or 0):
         logger.warning(f"Token version mismatch. Token: {token_tv}, DB: {getattr(user, 'token_version', 0)}")
-        raise credentials_exception
-    
-    user.is_developer = False
-    return user
+        return None
 
-from fastapi import Request
+    snapshot = UserSnapshot.from_user(user)
+    identity_cache.put(key, snapshot)
+    return snapshot
 
 async def get_token_optional(request: Request):
     auth_header = request.headers.get("Authorization")
@@ -350,18 +508,15 @@ async def get_token_optional(request: Request):
         return auth_header[7:]
     return None
 
-def get_current_user_optional(token: Optional[str] = Depends(get_token_optional), db: Session = Depends(database.get_db)):
+def get_current_user_optional(token: Optional[str] = Depends(get_token_optional), db: Session = Depends(database.get_db), request: Request = None):
     """Optional version of get_current_user for guest access."""
     if not token:
         return None
 
+    # Same verification, claims cache and identity cache as get_current_user
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return db.query(models.User).filter(models.User.username == username).first()
-    except:
+        return get_current_user(token=token, db=db, request=request)
+    except HTTPException:
         return None
 
 def get_current_active_user(current_user: models.User = Depends(get_current_user)):
@@ -369,6 +524,67 @@ def get_current_active_user(current_user: models.User = Depends(get_current_user
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account suspended")
     return current_user
 
+class Principal:
+    """
+    Read-only identity built from a token's signed entitlement claims. The
+    fields authorization needs are served from the claims; anything else
+    (profile, full_name, ...) loads the full snapshot on first access.
+    """
+
+    __slots__ = ("id", "username", "role", "school_id", "subscription_status", "subscription_expiry",
+                 "plan", "is_suspended", "identity_version", "is_developer", "_load", "_full")
+
+    def __init__(self, username: str, ent: Mapping[str, Any], load):
+        expiry = ent.get("x")
+        for name, value in (
+            ("id", ent.get("uid")),
+            ("username", username),
+            ("role", ent.get("role")),
+            ("school_id", ent.get("sc")),
+            ("subscription_status", ent.get("st")),
+            ("subscription_expiry", datetime.utcfromtimestamp(expiry) if expiry is not None else None),
+            ("plan", ent.get("plan")),
+            ("is_suspended", bool(ent.get("su"))),
+            ("identity_version", int(ent.get("ep") or 0)),
+            ("is_developer", False),
+            ("_load", load),
+            ("_full", None),
+        ):
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        full = self._full
+        if full is None:
+            full = self._load()
+            object.__setattr__(self, "_full", full)
+        return getattr(full, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Principal is read-only")
+
+
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db), request: Request = None):
+    """
+    Identity for authorization guards. A token whose entitlement claims are
+    not older than the user's revocation epoch is trusted as-is, so the guard
+    itself issues no queries; otherwise this is get_current_active_user.
+    """
+    try:
+        payload = decode_access_token(token)
+    except JWTError:
+        payload = {}
+    ent = payload.get("ent")
+    username = payload.get("sub")
+    if ent and username and ent.get("uid") is not None and not ent.get("su"):
+        identity_epochs.refresh_if_due(db)
+        if identity_epochs.current(ent["uid"]) <= int(ent.get("ep") or 0):
+            return _remember_identity(request, Principal(
+                username, ent, lambda: get_current_user(token=token, db=db, request=request)
+            ))
+    return get_current_active_user(get_current_user(token=token, db=db, request=request))
+
 def get_current_paid_user(current_user: models.User = Depends(get_current_active_user)):
     if not is_subscription_active(current_user):
         raise HTTPException(
@@ -381,7 +597,7 @@ class RoleChecker:
     def __init__(self, allowed_roles: List[str]):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, user: models.User = Depends(get_current_active_user)):
+    def __call__(self, user: models.User = Depends(get_current_principal)):
         if user.role not in self.allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN, 
@@ -428,63 +644,132 @@ class DemoWriteGuard:
         return user
 
 
+# Features open to demo sessions and users without an active subscription
+FREE_TIER_FEATURES = ("ai_chat", "students_self")
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    code: Optional[str]  # refusal reason, as sent in the 403 detail
+    daily_limit: Optional[int]  # None = not metered
+
+
+def entitlement_tier(user) -> str:
+    """The part of a user's state FeatureAccess decides on besides role."""
+    if is_developer_user(user):
+        return "developer"
+    if is_demo_user(user) or not is_subscription_active(user):
+        return "inactive"
+    return normalize_plan(user.plan)
+
+
+def _decide(feature: str, allowed_roles, role: str, tier: str) -> Decision:
+    if tier == "developer":
+        return Decision(True, None, None)
+    if tier == "inactive":
+        if feature in FREE_TIER_FEATURES:
+            return Decision(True, None, None)
+        return Decision(False, "PAID_SUBSCRIPTION_REQUIRED", None)
+    if allowed_roles and role not in allowed_roles:
+        return Decision(False, "ROLE_NOT_PERMITTED", None)
+    required_plan = FEATURE_MIN_PLAN.get(feature, "enterprise")
+    if PLAN_RANK.get(tier, 0) < PLAN_RANK.get(required_plan, 99):
+        return Decision(False, "PLAN_UPGRADE_REQUIRED", None)
+    return Decision(True, None, FEATURE_DAILY_LIMITS.get(feature, {}).get(tier))
+
+
+class EntitlementMatrix:
+    """
+    Every FeatureAccess decision, precomputed: guard -> (role, tier) ->
+    Decision. Roles no guard names share the "*" column. Guards created after
+    compilation are decided directly from the tables.
+    """
+
+    OTHER_ROLE = "*"
+    TIERS: Tuple[str, ...] = ("developer", "inactive", *PLAN_RANK)
+
+    def __init__(self, guards=()):
+        guard_keys = {(g.feature, _roles_key(g.allowed_roles)) for g in guards}
+        guard_keys |= {(f, None) for f in (*FEATURE_MIN_PLAN, *FEATURE_DAILY_LIMITS)
+                       if not any(k[0] == f for k in guard_keys)}
+        self.roles = frozenset(r for _, roles in guard_keys for r in (roles or ()))
+        columns = [(r, t) for r in (*sorted(self.roles), self.OTHER_ROLE) for t in self.TIERS]
+        self._by_guard = MappingProxyType({
+            key: MappingProxyType({(r, t): _decide(key[0], key[1], r, t) for r, t in columns})
+            for key in guard_keys
+        })
+        # A feature is available if any of its guards admits the user
+        by_feature: Dict[str, Dict] = {}
+        for (feature, _), table in sorted(self._by_guard.items(), key=lambda kv: (kv[0][0], sorted(kv[0][1] or ()))):
+            merged = by_feature.setdefault(feature, {})
+            for column, decision in table.items():
+                if column not in merged or (decision.allowed and not merged[column].allowed):
+                    merged[column] = decision
+        self._by_feature = MappingProxyType({f: MappingProxyType(d) for f, d in sorted(by_feature.items())})
+
+    def _column(self, user) -> Tuple[str, str]:
+        role = getattr(user, "role", None) or ""
+        return (role if role in self.roles else self.OTHER_ROLE), entitlement_tier(user)
+
+    def decide(self, feature: str, allowed_roles, user) -> Decision:
+        table = self._by_guard.get((feature, _roles_key(allowed_roles)))
+        role, tier = self._column(user)
+        if table is None:
+            return _decide(feature, allowed_roles, getattr(user, "role", None) or "", tier)
+        return table[(role, tier)]
+
+    def for_user(self, user) -> Mapping[str, Decision]:
+        column = self._column(user)
+        return MappingProxyType({feature: table[column] for feature, table in self._by_feature.items()})
+
+
+def _roles_key(allowed_roles):
+    return frozenset(allowed_roles) if allowed_roles else None
+
+
+_feature_guards: List["FeatureAccess"] = []
+entitlement_matrix = EntitlementMatrix()
+
+
+def compile_entitlements() -> EntitlementMatrix:
+    """Rebuild the matrix from the tables and every FeatureAccess created so far."""
+    global entitlement_matrix
+    entitlement_matrix = EntitlementMatrix(_feature_guards)
+    return entitlement_matrix
+
+
 class FeatureAccess:
     def __init__(self, feature: str, allowed_roles: Optional[List[str]] = None):
         self.feature = feature
         self.allowed_roles = allowed_roles
+        _feature_guards.append(self)
 
-    def __call__(self, user: models.User = Depends(get_current_active_user), db: Session = Depends(database.get_db)):
-        if is_developer_user(user):
-            return user
-
-        # FREE USER RESTRICTION: Only allow 'ai_chat' and 'students_self'
-        if is_demo_user(user) or not is_subscription_active(user):
-            if self.feature not in ["ai_chat", "students_self"]:
-                 raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=_error_detail("PAID_SUBSCRIPTION_REQUIRED", f"Feature '{self.feature}' requires an active subscription")
-                )
-            return user
-
-        if self.allowed_roles and (user.role or "") not in self.allowed_roles:
+    def __call__(self, user: models.User = Depends(get_current_principal), db: Session = Depends(database.get_db)):
+        decision = entitlement_matrix.decide(self.feature, self.allowed_roles, user)
+        if decision.code == "PAID_SUBSCRIPTION_REQUIRED":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=_error_detail("PAID_SUBSCRIPTION_REQUIRED", f"Feature '{self.feature}' requires an active subscription")
+            )
+        if decision.code == "ROLE_NOT_PERMITTED":
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation not permitted")
-
-        required_plan = FEATURE_MIN_PLAN.get(self.feature, "enterprise")
-        user_plan = effective_plan(user)
-        if PLAN_RANK.get(user_plan, 0) < PLAN_RANK.get(required_plan, 99):
+        if decision.code == "PLAN_UPGRADE_REQUIRED":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=_error_detail("PLAN_UPGRADE_REQUIRED", "Plan upgrade required"),
             )
 
-        limits_by_plan = FEATURE_DAILY_LIMITS.get(self.feature)
-        if limits_by_plan:
-            daily_limit = limits_by_plan.get(user_plan)
-            if daily_limit is not None:
-                if getattr(user, "id", None) is None:
-                    # If user has no ID (e.g. demo user), we might need a session-based limit
-                    # For now, demo users aren't counted in UsageCounter if they don't have ID
-                    return user
-                    
-                period = datetime.utcnow().strftime("%Y-%m-%d")
-                row = (
-                    db.query(models.UsageCounter)
-                    .filter(
-                        models.UsageCounter.user_id == user.id,
-                        models.UsageCounter.period == period,
-                        models.UsageCounter.feature == self.feature,
-                    )
-                    .first()
-                )
-                if not row:
-                    row = models.UsageCounter(user_id=user.id, period=period, feature=self.feature, count=0)
-                    db.add(row)
-                    db.flush()
-                if int(row.count or 0) >= int(daily_limit):
-                    raise HTTPException(status_code=429, detail=_error_detail("QUOTA_EXCEEDED", "Quota exceeded"))
-                row.count = int(row.count or 0) + 1
-                row.updated_at = datetime.utcnow()
-                db.commit()
+        if decision.daily_limit is not None:
+            if getattr(user, "id", None) is None:
+                # If user has no ID (e.g. demo user), we might need a session-based limit
+                # For now, demo users aren't counted in UsageCounter if they don't have ID
+                return user
+
+            period = datetime.utcnow().strftime("%Y-%m-%d")
+            # Served from this worker's lease; the DB is hit once per block
+            block = lease_block(entitlement_tier(user))
+            if not quota_leases.consume(db, user.id, self.feature, period, decision.daily_limit, block):
+                raise HTTPException(status_code=429, detail=_error_detail("QUOTA_EXCEEDED", "Quota exceeded"))
 
         return user
 
@@ -0,0 +1,136 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Refresh-token sessions.
+
+Each login opens one `auth_sessions` row per device, keyed by the keyed hash
+of its refresh token (unique index). /auth/refresh rotates a session with a
+single indexed UPDATE that also checks ownership and expiry, so neither login
+nor refresh writes to `users`, and signing in on a second device leaves the
+first one signed in. Logout still revokes every device (token_version bump).
+
+Expired rows are deleted by the sweeper in batches of AUTH_SESSION_SWEEP_BATCH,
+one short transaction each.
+
+Usage:
+    python -m backend.auth_sessions
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.orm import Session
+
+from . import database, models
+from .auth import _hash_refresh_token
+from .config import settings
+
+logger = logging.getLogger("lumios.auth")
+
+DEVICE_LABEL_MAX = 120
+
+
+def device_label(user_agent: Optional[str]) -> Optional[str]:
+    label = (user_agent or "").strip()
+    return label[:DEVICE_LABEL_MAX] or None
+
+
+def _expiry(now: datetime) -> datetime:
+    return now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+
+
+def open_session(db: Session, user_id: int, refresh_token: str, device: Optional[str] = None) -> models.AuthSession:
+    """Add a session for a freshly issued refresh token; committed by the caller."""
+    now = datetime.utcnow()
+    session = models.AuthSession(
+        user_id=user_id,
+        token_hash=_hash_refresh_token(refresh_token),
+        device=device,
+        created_at=now,
+        last_used_at=now,
+        expires_at=_expiry(now),
+    )
+    db.add(session)
+    return session
+
+
+def rotate_session(db: Session, user_id: int, old_token: str, new_token: str) -> bool:
+    """
+    Swap a live session's token for a new one in one statement. False if the
+    old token is unknown, already rotated, expired or belongs to someone else.
+    """
+    now = datetime.utcnow()
+    table = models.AuthSession.__table__
+    result = db.execute(
+        update(table)
+        .where(
+            table.c.token_hash == _hash_refresh_token(old_token),
+            table.c.user_id == user_id,
+            table.c.expires_at > now,
+        )
+        .values(token_hash=_hash_refresh_token(new_token), last_used_at=now, expires_at=_expiry(now))
+    )
+    return result.rowcount == 1
+
+
+def revoke_user_sessions(db: Session, user_id: int) -> int:
+    table = models.AuthSession.__table__
+    return db.execute(delete(table).where(table.c.user_id == user_id)).rowcount or 0
+
+
+def sweep_expired(engine=None, now: Optional[datetime] = None, batch_size: Optional[int] = None) -> int:
+    """Delete expired sessions in bounded batches. Returns rows deleted."""
+    engine = engine or database.engine
+    now = now or datetime.utcnow()
+    batch_size = batch_size or settings.AUTH_SESSION_SWEEP_BATCH
+    table = models.AuthSession.__table__
+    expired = select(table.c.id).where(table.c.expires_at <= now).limit(batch_size).scalar_subquery()
+
+    deleted = 0
+    while True:
+        # Short transactions: logins and refreshes never wait behind one big DELETE
+        with engine.begin() as conn:
+            batch = conn.execute(delete(table).where(table.c.id.in_(expired))).rowcount or 0
+        deleted += batch
+        if batch < batch_size:
+            break
+    if deleted:
+        logger.info(f"Swept {deleted} expired auth sessions")
+    return deleted
+
+
+def migrate_legacy_refresh_tokens(conn) -> int:
+    """Move live users.refresh_token_hash values into auth_sessions, once."""
+    now = datetime.utcnow()
+    moved = conn.execute(text("""
+        INSERT INTO auth_sessions (user_id, token_hash, device, created_at, last_used_at, expires_at)
+        SELECT id, refresh_token_hash, 'legacy', :now, :now, refresh_token_expires_at FROM users
+        WHERE refresh_token_hash IS NOT NULL AND refresh_token_expires_at > :now
+          AND NOT EXISTS (SELECT 1 FROM auth_sessions WHERE token_hash = users.refresh_token_hash)
+    """), {"now": now}).rowcount or 0
+    conn.execute(text(
+        "UPDATE users SET refresh_token_hash = NULL, refresh_token_expires_at = NULL "
+        "WHERE refresh_token_hash IS NOT NULL"
+    ))
+    return moved
+
+
+async def run_periodically(interval_seconds: float):
+    """Sweep on startup and then every `interval_seconds`, off the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(sweep_expired)
+        except Exception as e:
+            logger.error(f"Auth session sweep failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(sweep_expired())
@@ -0,0 +1,82 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+AI cache memory benchmark: stores --keys unique quiz-sized payloads and
+reports peak RSS. "unbounded" is the previous SimpleCache (a dict that only
+dropped an entry when the same key was read after expiry); "bounded" is
+MemoryCache with --max-entries and --max-mb.
+
+Each cache runs in a fresh process so peak RSS is not shared.
+
+Usage:
+    python -m backend.benchmarks.ai_cache_memory
+    python -m backend.benchmarks.ai_cache_memory --keys 1000000 --max-mb 64
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+
+from backend.ai_cache import MemoryCache
+
+
+def payload(i: int, size: int) -> list:
+    question = f"Question {i}: " + "x" * max(0, size - 60)
+    return [{"q": question, "options": ["A", "B", "C", "D"], "correct": i % 4}]
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def run(kind: str, keys: int, size: int, max_entries: int, max_mb: float, results):
+    baseline = rss_mb()
+    if kind == "unbounded":
+        cache = {}
+        store = lambda k, v: cache.__setitem__(k, {"value": v, "timestamp": time.time()})
+        entries = lambda: len(cache)
+    else:
+        cache = MemoryCache(max_entries=max_entries, max_bytes=int(max_mb * 1024 * 1024))
+        store = cache.set
+        entries = lambda: cache.get_stats()["entries"]
+
+    started = time.perf_counter()
+    for i in range(keys):
+        store(f"quiz:topic-{i}:5", payload(i, size))
+    elapsed = time.perf_counter() - started
+    results[kind] = {
+        "entries": entries(),
+        "rss_mb": rss_mb() - baseline,
+        "us_per_set": elapsed / keys * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--payload-bytes", type=int, default=200)
+    parser.add_argument("--max-entries", type=int, default=1_000_000)
+    parser.add_argument("--max-mb", type=float, default=64.0)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        results = manager.dict()
+        for kind in ("unbounded", "bounded"):
+            proc = ctx.Process(target=run, args=(kind, args.keys, args.payload_bytes, args.max_entries, args.max_mb, results))
+            proc.start()
+            proc.join()
+        results = dict(results)
+
+    print(f"{args.keys:,} unique keys, ~{args.payload_bytes} B payloads; bounded: {args.max_entries:,} entries / {args.max_mb:.0f} MB\n")
+    print(f"{'cache':10} {'entries':>10} {'peak RSS MB':>12} {'us/set':>8}")
+    for kind, r in results.items():
+        print(f"{kind:10} {r['entries']:>10,} {r['rss_mb']:12.1f} {r['us_per_set']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+AI in-flight benchmark: --calls concurrent POST /ai/landing-chat requests,
+each taking --latency seconds at a fake provider, while a probe polls an
+unrelated endpoint (GET /health). Compares a provider client that blocks the
+event loop for the round trip (the previous synchronous OpenAI client) with
+the async client.
+
+No provider is contacted; the fake completion only sleeps.
+
+Usage:
+    python -m backend.benchmarks.ai_inflight --calls 50 --latency 1.0
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from types import SimpleNamespace
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import database, main
+
+
+def _completion():
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=usage)
+
+
+def fake_client(latency: float, blocking: bool):
+    async def create(**kwargs):
+        if blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        return _completion()
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _setup():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Session = sessionmaker(bind=engine)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[database.get_db] = get_db
+    main.app.dependency_overrides[main.get_db] = get_db
+    main.limiter.enabled = False
+
+
+async def run(calls: int, latency: float):
+    transport = httpx.ASGITransport(app=main.app)
+    probe = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started_at = time.perf_counter()
+        pending = [asyncio.create_task(client.post("/ai/landing-chat", json={"prompt": f"q{i}"})) for i in range(calls)]
+
+        async def probe_loop():
+            await asyncio.sleep(0.05)  # let the calls reach the provider
+            while not all(t.done() for t in pending):
+                started = time.perf_counter()
+                await client.get("/health")
+                probe.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(probe_loop(), *pending)
+        elapsed = time.perf_counter() - started_at
+
+    probe.sort()
+    return {
+        "wall_s": elapsed,
+        "probes": len(probe),
+        "probe_p50_ms": statistics.median(probe) if probe else float("nan"),
+        "probe_p99_ms": probe[min(len(probe) - 1, int(len(probe) * 0.99))] if probe else float("nan"),
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per fake completion")
+    args = parser.parse_args()
+    logging.getLogger("lumios").setLevel(logging.ERROR)
+    logging.getLogger("ai_service").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _setup()
+    results = {}
+    for mode in ("blocking", "async"):
+        main.ai_service.client = fake_client(args.latency, blocking=mode == "blocking")
+        results[mode] = asyncio.run(run(args.calls, args.latency))
+
+    print(f"{args.calls} AI calls x {args.latency:.1f} s at the provider\n")
+    print(f"{'client':9} {'wall s':>7} {'probes':>7} {'probe p50 ms':>13} {'probe p99 ms':>13}")
+    for mode, r in results.items():
+        print(f"{mode:9} {r['wall_s']:7.1f} {r['probes']:7d} {r['probe_p50_ms']:13.1f} {r['probe_p99_ms']:13.1f}")
+
+
+if __name__ == "__main__":
+    main_()
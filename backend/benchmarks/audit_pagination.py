@@ -0,0 +1,117 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Audit listing benchmark: page latency at increasing depth for OFFSET paging
+(the old /system/audit-logs) versus keyset paging over (created_at, id) on the
+(school_id, created_at, id) index.
+
+Seeding 10M rows takes a few minutes and ~1.5 GB on SQLite; pass --db-path to
+reuse a seeded file between runs.
+
+Usage:
+    python -m backend.benchmarks.audit_pagination
+    python -m backend.benchmarks.audit_pagination --rows 1000000 --db-path /tmp/audit_pages.db
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, tuple_
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import Base
+
+SCHOOL = "bench_school"
+CHUNK = 100_000
+
+
+def seed(engine, rows: int):
+    log = models.AuditLog.__table__
+    base = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        existing = conn.execute(func.count(log.c.id).select()).scalar()
+    for start in range(existing, rows, CHUNK):
+        batch = [
+            {
+                # Two schools interleaved, several rows per second so (created_at, id) ties occur
+                "school_id": SCHOOL if i % 10 else "other_school",
+                "created_at": base + timedelta(seconds=i // 3),
+                "user_id": i % 500,
+                "method": "GET",
+                "path": f"/students/{i % 1000}",
+                "status_code": 200 if i % 20 else 404,
+                "ip": "127.0.0.1",
+            }
+            for i in range(start, min(start + CHUNK, rows))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(log), batch)
+        print(f"  seeded {start + len(batch):,} rows", end="\r", flush=True)
+    print()
+
+
+def listing(db):
+    log = models.AuditLog
+    return db.query(log).filter(log.school_id == SCHOOL).order_by(log.created_at.desc(), log.id.desc())
+
+
+def timed(fn, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--db-path", default="")
+    args = parser.parse_args()
+
+    db_path = args.db_path or os.path.join(tempfile.mkdtemp(), "audit_pages.db")
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine, tables=[models.User.__table__, models.AuditLog.__table__])
+    print(f"Seeding {args.rows:,} audit rows into {db_path}")
+    seed(engine, args.rows)
+
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    log = models.AuditLog
+    school_rows = db.query(func.count(log.id)).filter(log.school_id == SCHOOL).scalar()
+
+    depths = [0]
+    while depths[-1] * 10 < school_rows and len(depths) < 8:
+        depths.append(max(1000, depths[-1] * 10))
+    depths = [d for d in depths if d + args.page_size <= school_rows]
+    depths.append(school_rows - args.page_size)  # last page
+
+    print(f"{'depth':>12} {'offset ms':>10} {'keyset ms':>10}")
+    for depth in depths:
+        offset_ms = timed(lambda: listing(db).offset(depth).limit(args.page_size).all(), args.repeats)
+
+        if depth:
+            # The cursor a client would hold after walking `depth` rows (not timed)
+            anchor = listing(db).offset(depth - 1).limit(1).one()
+            after = tuple_(log.created_at, log.id) < tuple_(anchor.created_at, anchor.id)
+            keyset = lambda: listing(db).filter(after).limit(args.page_size + 1).all()
+        else:
+            keyset = lambda: listing(db).limit(args.page_size + 1).all()
+        keyset_ms = timed(keyset, args.repeats)
+        print(f"{depth:12,} {offset_ms:10.2f} {keyset_ms:10.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Audit pipeline benchmark: requests/sec with a commit-per-request audit row
+(the old middleware) versus the write-behind AuditWriter.
+
+Usage:
+    python -m backend.benchmarks.audit_writer
+    python -m backend.benchmarks.audit_writer --db-url postgresql://user:pw@localhost/lumios_bench
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.audit import AuditWriter
+from backend.database import Base
+
+
+def build_app(mode: str, SessionLocal, writer: AuditWriter) -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def audit(request: Request, call_next):
+        response = await call_next(request)
+        row = {
+            "ip": "127.0.0.1",
+            "method": request.method,
+            "path": request.url.path,
+            "status_code": response.status_code,
+            "user_agent": request.headers.get("user-agent", "")[:500],
+            "request_id": "bench",
+        }
+        if mode == "sync":
+            db = SessionLocal()
+            try:
+                db.add(models.AuditLog(**row))
+                db.commit()
+            finally:
+                db.close()
+        else:
+            writer.submit(row)
+        return response
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def run(mode: str, SessionLocal, requests: int, concurrency: int) -> float:
+    writer = AuditWriter(session_factory=SessionLocal, batch_size=500, flush_interval=0.25)
+    app = build_app(mode, SessionLocal, writer)
+    transport = httpx.ASGITransport(app=app)
+    sem = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with sem:
+                await client.get("/ping")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    # Rows still queued are written after the measured window, as in production
+    await writer.stop()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default=os.getenv("BENCH_DATABASE_URL", ""))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    db_url = args.db_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'audit_bench.db')}"
+    connect_args = {"check_same_thread": False} if db_url.startswith("sqlite") else {}
+    engine = create_engine(db_url, connect_args=connect_args)
+    Base.metadata.create_all(bind=engine, tables=[models.User.__table__, models.AuditLog.__table__])
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    print(f"Backend: {engine.url.get_backend_name()} | requests={args.requests} concurrency={args.concurrency}")
+    for mode in ("sync", "write_behind"):
+        rps = asyncio.run(run(mode, SessionLocal, args.requests, args.concurrency))
+        print(f"{mode:14} {rps:10.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
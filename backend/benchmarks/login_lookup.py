@@ -0,0 +1,120 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Login lookup benchmark: DB time to resolve a login identifier at growing
+table sizes. "old" is the previous /login path (username query, then an
+unindexed case-sensitive UserProfile.email query, then the user by id);
+"new" is the single UNION ALL over users.username and the unique
+(email_normalized, school_id) index.
+
+Password hashing is not measured; only identifier resolution.
+
+Usage:
+    python -m backend.benchmarks.login_lookup
+    python -m backend.benchmarks.login_lookup --sizes 10000,100000 --db-path /tmp/logins.db
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, insert, literal, select, union_all
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import Base
+
+CHUNK = 50_000
+
+
+def seed(engine, users: int):
+    with engine.begin() as conn:
+        existing = conn.execute(select(func.count(models.User.id))).scalar()
+    for start in range(existing, users, CHUNK):
+        ids = range(start + 1, min(start + CHUNK, users) + 1)
+        with engine.begin() as conn:
+            conn.execute(insert(models.User.__table__), [
+                {"id": i, "username": f"user{i}", "password_hash": "x", "role": "student", "school_id": f"school{i % 50}"}
+                for i in ids
+            ])
+            conn.execute(insert(models.UserProfile.__table__), [
+                {"id": i, "user_id": i, "school_id": f"school{i % 50}",
+                 "email": f"User{i}@Example.org", "email_normalized": f"user{i}@example.org"}
+                for i in ids
+            ])
+        print(f"  seeded {ids[-1]:,} users", end="\r", flush=True)
+    print()
+
+
+def old_lookup(db, identifier):
+    user = db.query(models.User).filter(models.User.username == identifier).first()
+    if not user:
+        profile = db.query(models.UserProfile).filter(models.UserProfile.email == identifier).first()
+        if profile:
+            user = db.query(models.User).filter(models.User.id == profile.user_id).first()
+    return user
+
+
+def new_lookup(db, identifier):
+    by_username = select(models.User.id.label("user_id"), literal(0).label("rank")).where(models.User.username == identifier)
+    by_email = select(models.UserProfile.user_id, literal(1)).where(
+        models.UserProfile.email_normalized == models.normalize_email(identifier)
+    )
+    matches = union_all(by_username, by_email).subquery()
+    return db.query(models.User).join(matches, models.User.id == matches.c.user_id).order_by(matches.c.rank, models.User.id).first()
+
+
+def measure(Session, lookup, identifiers):
+    samples = []
+    for identifier in identifiers:
+        db = Session()
+        started = time.perf_counter()
+        user = lookup(db, identifier)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert user is not None
+        db.close()
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--db-path", default=None)
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+
+    tmp = None
+    if args.db_path is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.db_path = os.path.join(tmp.name, "logins.db")
+    engine = create_engine(f"sqlite:///{args.db_path}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    print(f"{'users':>10} {'path':5} {'by':9} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in sizes:
+        seed(engine, size)
+        picks = [random.randint(1, size) for _ in range(args.lookups)]
+        cases = {
+            "username": [f"user{i}" for i in picks],
+            # Login forms send what the user typed; the old path only matched the stored casing
+            "email": [f"User{i}@Example.org" for i in picks],
+        }
+        for by, identifiers in cases.items():
+            for name, lookup in (("old", old_lookup), ("new", new_lookup)):
+                p50, p99 = measure(Session, lookup, identifiers)
+                print(f"{size:>10,} {name:5} {by:9} {p50:8.3f} {p99:8.3f}")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
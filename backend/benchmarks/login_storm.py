@@ -0,0 +1,127 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Login storm benchmark: many clients hammer POST /login while a probe polls an
+unrelated sync endpoint (GET /subscription/status). Compares hashing inline on
+the AnyIO threadpool (the previous behaviour) with the bounded process pool.
+
+Reports login throughput, how many logins were shed with 503, and the probe's
+p50/p99 latency during the storm.
+
+Usage:
+    python -m backend.benchmarks.login_storm --clients 64 --seconds 10
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import auth, database, main, models
+from backend.database import Base
+from backend.password_hasher import PasswordHasher
+
+
+def _setup(db_path: str):
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    auth.password_hasher = PasswordHasher(mode="inline")
+    with Session() as db:
+        db.add(models.User(
+            username="storm", password_hash=auth.get_password_hash("storm-password"),
+            role="teacher", subscription_status="active", plan="pro",
+        ))
+        db.commit()
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[database.get_db] = get_db
+    main.app.dependency_overrides[main.get_db] = get_db
+    main.limiter.enabled = False
+    return auth.create_access_token(data={"sub": "storm", "role": "teacher", "tv": 0})
+
+
+async def storm(clients: int, seconds: float, token: str):
+    transport = httpx.ASGITransport(app=main.app)
+    started_at = time.perf_counter()
+    deadline = started_at + seconds
+    counts = {"ok": 0, "shed": 0, "other": 0}
+    probe = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login_loop():
+            while time.perf_counter() < deadline:
+                r = await client.post("/login", json={"username": "storm", "password": "storm-password"})
+                key = "ok" if r.status_code == 200 else "shed" if r.status_code == 503 else "other"
+                counts[key] += 1
+                if r.status_code == 503:
+                    await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+
+        async def probe_loop():
+            headers = {"Authorization": f"Bearer {token}"}
+            await asyncio.sleep(0.5)  # let the storm build up
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await client.get("/subscription/status", headers=headers)
+                probe.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(probe_loop(), *(login_loop() for _ in range(clients)))
+    # Requests in flight at the deadline still count, so divide by the real wall time
+    elapsed = time.perf_counter() - started_at
+
+    probe.sort()
+    return {
+        "logins_per_s": counts["ok"] / elapsed,
+        "wall_s": elapsed,
+        "shed": counts["shed"],
+        "errors": counts["other"],
+        "probe_p50_ms": statistics.median(probe) if probe else float("nan"),
+        "probe_p99_ms": probe[min(len(probe) - 1, int(len(probe) * 0.99))] if probe else float("nan"),
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=0, help="hashing pool size (0 = default)")
+    args = parser.parse_args()
+    logging.getLogger("lumios").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        token = _setup(os.path.join(tmp, "storm.db"))
+        results = {}
+        for mode in ("inline", "process"):
+            hasher = PasswordHasher(mode=mode, max_workers=args.workers or None)
+            auth.password_hasher = hasher
+            if mode != "inline":
+                hasher.derive("sha256", b"warm", b"up", 1)  # start the pool outside the measurement
+            results[mode] = asyncio.run(storm(args.clients, args.seconds, token))
+            hasher.shutdown()
+
+    print(f"{'hashing':8} {'wall s':>7} {'logins/s':>9} {'shed 503':>9} {'errors':>7} {'probe p50 ms':>13} {'probe p99 ms':>13}")
+    for mode, r in results.items():
+        print(f"{mode:8} {r['wall_s']:7.1f} {r['logins_per_s']:9.1f} {r['shed']:9d} {r['errors']:7d} "
+              f"{r['probe_p50_ms']:13.1f} {r['probe_p99_ms']:13.1f}")
+
+
+if __name__ == "__main__":
+    main_()
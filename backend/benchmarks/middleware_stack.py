@@ -0,0 +1,151 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Middleware overhead microbenchmark: the former BaseHTTPMiddleware stack
+(security headers + PNA + audit, CORS registered twice) versus the single
+pure-ASGI CoreHTTPMiddleware with CORS registered once. Requests are driven
+straight through the ASGI interface, so the numbers are middleware cost only.
+
+Usage:
+    python -m backend.benchmarks.middleware_stack --requests 20000
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+
+from backend.config import settings
+from backend.middleware import CoreHTTPMiddleware
+from backend.security import add_security_headers
+
+logger = logging.getLogger("lumios")
+
+ORIGINS = [o.strip() for o in settings.CORS_ORIGINS if o.strip()]
+
+
+class NullWriter:
+    def submit(self, row):
+        return True
+
+
+def _base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def build_bare() -> FastAPI:
+    return _base_app()
+
+
+def build_old_stack() -> FastAPI:
+    app = _base_app()
+    writer = NullWriter()
+    app.add_middleware(CORSMiddleware, allow_origins=ORIGINS, allow_credentials=True,
+                       allow_methods=["*"], allow_headers=["*"])
+    app.middleware("http")(add_security_headers)
+
+    @app.middleware("http")
+    async def pna_middleware(request: Request, call_next):
+        response = await call_next(request)
+        if request.headers.get("Access-Control-Request-Private-Network") == "true":
+            response.headers["Access-Control-Allow-Private-Network"] = "true"
+        return response
+
+    @app.middleware("http")
+    async def audit_middleware(request: Request, call_next):
+        started = time.time()
+        response = await call_next(request)
+        response.headers["X-Created-By"] = "Faizain Murtuza"
+        response.headers["X-System-Architecture"] = "Asynchronous Intelligence-First SMS"
+        logger.info("Request processed", extra={"path": request.url.path, "status_code": response.status_code})
+        writer.submit({"path": request.url.path, "status_code": response.status_code})
+        response.headers["X-Request-ID"] = "bench"
+        response.headers["X-Response-Time-ms"] = str(int((time.time() - started) * 1000))
+        return response
+
+    app.add_middleware(CORSMiddleware, allow_origins=ORIGINS, allow_credentials=True,
+                       allow_methods=["*"], allow_headers=["*"], max_age=600)
+    return app
+
+
+def build_new_stack() -> FastAPI:
+    app = _base_app()
+    app.add_middleware(CORSMiddleware, allow_origins=frozenset(ORIGINS), allow_credentials=True,
+                       allow_methods=["*"], allow_headers=["*"], max_age=600)
+    app.add_middleware(CoreHTTPMiddleware, audit_writer=NullWriter())
+    return app
+
+
+async def measure(app, requests: int):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"origin", ORIGINS[0].encode()), (b"user-agent", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    def make_receive():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            return {"type": "http.disconnect"}
+
+        return receive
+
+    async def send(message):
+        pass
+
+    samples = []
+    for i in range(requests):
+        started = time.perf_counter()
+        await app(dict(scope, state={}), make_receive(), send)
+        if i >= requests // 10:  # discard warm-up
+            samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    # Keep access logging out of the measurement for both stacks
+    logger.setLevel(logging.WARNING)
+
+    results = {}
+    for name, build in (("bare", build_bare), ("old_stack", build_old_stack), ("new_stack", build_new_stack)):
+        results[name] = asyncio.run(measure(build(), args.requests))
+
+    bare_p50, bare_p99 = results["bare"]
+    print(f"{'stack':10} {'p50 us':>9} {'p99 us':>9} {'overhead p50':>13} {'overhead p99':>13}")
+    for name, (p50, p99) in results.items():
+        print(f"{name:10} {p50:9.1f} {p99:9.1f} {p50 - bare_p50:13.1f} {p99 - bare_p99:13.1f}")
+
+
+if __name__ == "__main__":
+    main()
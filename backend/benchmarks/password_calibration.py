@@ -0,0 +1,90 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Password hash cost calibration: finds PBKDF2 iterations and scrypt N that
+verify in about --target-ms on this machine, and prints the settings to use.
+Run it on production hardware; a verify costs the same as a hash.
+
+OWASP minimums: PBKDF2-SHA256 600,000 iterations; scrypt N=2^17, r=8, p=1 (or
+an equivalent such as N=2^15 with p=5). The tool never suggests PBKDF2 below
+600,000 iterations.
+
+Usage:
+    python -m backend.benchmarks.password_calibration --target-ms 250
+"""
+import argparse
+import hashlib
+import secrets
+import statistics
+import time
+
+from backend.auth import _scrypt_maxmem
+
+PBKDF2_FLOOR = 600_000
+
+
+def _time(fn, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def calibrate_pbkdf2(target: float, repeats: int) -> tuple:
+    salt = secrets.token_bytes(16)
+    probe = 100_000
+    per_iteration = _time(lambda: hashlib.pbkdf2_hmac("sha256", b"calibrate", salt, probe), repeats) / probe
+    iterations = max(PBKDF2_FLOOR, int(target / per_iteration) // 10_000 * 10_000)
+    measured = _time(lambda: hashlib.pbkdf2_hmac("sha256", b"calibrate", salt, iterations), repeats)
+    return iterations, measured
+
+
+def calibrate_scrypt(target: float, repeats: int, r: int = 8, p: int = 1) -> tuple:
+    salt = secrets.token_bytes(16)
+    best = None
+    n = 1 << 12
+    while n <= 1 << 20:
+        elapsed = _time(
+            lambda: hashlib.scrypt(b"calibrate", salt=salt, n=n, r=r, p=p, maxmem=_scrypt_maxmem(n, r, p), dklen=32),
+            repeats,
+        )
+        if elapsed > target and best is not None:
+            break
+        best = (n, elapsed)
+        if elapsed > target:
+            break
+        n <<= 1
+    return best[0], r, p, best[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    target = args.target_ms / 1000.0
+
+    iterations, pbkdf2_s = calibrate_pbkdf2(target, args.repeats)
+    n, r, p, scrypt_s = calibrate_scrypt(target, args.repeats)
+
+    print(f"target verify latency: {args.target_ms:.0f} ms\n")
+    print(f"pbkdf2-sha256  i={iterations:<10} {pbkdf2_s * 1000:7.1f} ms")
+    print(f"scrypt         n={n},r={r},p={p:<3} {scrypt_s * 1000:7.1f} ms  {128 * n * r / 2**20:.0f} MiB per hash\n")
+    print("# PBKDF2")
+    print("PASSWORD_HASH_ALGORITHM=pbkdf2-sha256")
+    print(f"PASSWORD_PBKDF2_ITERATIONS={iterations}")
+    print("# or scrypt (memory-hard; size PASSWORD_HASH_WORKERS for the memory above)")
+    print("PASSWORD_HASH_ALGORITHM=scrypt")
+    print(f"PASSWORD_SCRYPT_N={n}")
+    print(f"PASSWORD_SCRYPT_R={r}")
+    print(f"PASSWORD_SCRYPT_P={p}")
+
+
+if __name__ == "__main__":
+    main()
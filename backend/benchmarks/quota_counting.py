@@ -0,0 +1,147 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Quota counting benchmark: the original FeatureAccess path (SELECT the
+counter, INSERT + flush if missing, increment in Python, commit), the single
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING in quota_leases.reserve, and
+leased blocks (backend/quota_leases.py) that only hit the DB once per block.
+
+Reports per-call latency and statements per call, then fires concurrent
+calls at one user's counter and counts how many were admitted past the limit.
+
+Usage:
+    python -m backend.benchmarks.quota_counting
+    python -m backend.benchmarks.quota_counting --calls 2000 --threads 16 --limit 100 --block 10
+
+"stored" for the lease path includes units still held in the lease.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import Base
+from backend.quota_leases import QuotaLeases, reserve
+
+
+def old_consume(db, user_id, feature, period, limit):
+    row = (
+        db.query(models.UsageCounter)
+        .filter(
+            models.UsageCounter.user_id == user_id,
+            models.UsageCounter.period == period,
+            models.UsageCounter.feature == feature,
+        )
+        .first()
+    )
+    if not row:
+        row = models.UsageCounter(user_id=user_id, period=period, feature=feature, count=0)
+        db.add(row)
+        db.flush()
+    if int(row.count or 0) >= int(limit):
+        return None
+    row.count = int(row.count or 0) + 1
+    row.updated_at = datetime.utcnow()
+    return row.count
+
+
+def new_consume(db, user_id, feature, period, limit):
+    return reserve(db, user_id, feature, period, limit)
+
+
+def lease_consume(leases, block):
+    def consume(db, user_id, feature, period, limit):
+        return 1 if leases.consume(db, user_id, feature, period, limit, block) else None
+    return consume
+
+
+def latency(Session, consume, calls, counter):
+    samples = []
+    before = counter[0]
+    for i in range(calls):
+        db = Session()
+        started = time.perf_counter()
+        consume(db, i % 100, "ai_chat", "2025-01-01", calls)
+        db.commit()
+        samples.append((time.perf_counter() - started) * 1000)
+        db.close()
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))], (counter[0] - before) / calls
+
+
+def over_admission(Session, consume, threads, attempts, limit):
+    admitted = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        for _ in range(attempts):
+            db = Session()
+            try:
+                used = consume(db, 1, "ai_quiz", "2025-01-01", limit)
+                db.commit()
+            except Exception:
+                db.rollback()
+                used = None
+            finally:
+                db.close()
+            if used is not None:
+                with lock:
+                    admitted.append(used)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    db = Session()
+    stored = db.query(models.UsageCounter.count).filter(models.UsageCounter.feature == "ai_quiz").scalar()
+    db.close()
+    return len(admitted), stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=50, help="calls per thread in the concurrency run")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--block", type=int, default=10, help="lease block size")
+    args = parser.parse_args()
+
+    print(f"{'path':5} {'p50 ms':>8} {'p99 ms':>8} {'stmts/call':>10} {'admitted':>9} {'stored':>7} {'limit':>6}")
+    paths = (("old", old_consume), ("new", new_consume), ("lease", lease_consume(QuotaLeases(), args.block)))
+    for name, consume in paths:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(
+                f"sqlite:///{os.path.join(tmp, 'quota.db')}",
+                connect_args={"check_same_thread": False, "timeout": 30},
+            )
+            Base.metadata.create_all(bind=engine)
+            counter = [0]
+
+            @event.listens_for(engine, "before_cursor_execute")
+            def count(conn, cursor, statement, parameters, context, executemany):
+                counter[0] += 1
+
+            Session = sessionmaker(bind=engine)
+            p50, p99, per_call = latency(Session, consume, args.calls, counter)
+            admitted, stored = over_admission(Session, consume, args.threads, args.attempts, args.limit)
+            print(f"{name:5} {p50:8.3f} {p99:8.3f} {per_call:10.1f} {admitted:9} {stored:7} {args.limit:6}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
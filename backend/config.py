@@ -33,6 +33,65 @@ class Settings:
     }
     RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "10"))
     RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+
+    # Audit log write-behind pipeline (see backend/audit.py)
+    AUDIT_QUEUE_MAXSIZE = int(os.getenv("AUDIT_QUEUE_MAXSIZE", "10000"))
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+    AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "1000"))
+    AUDIT_OVERFLOW_POLICY = os.getenv("AUDIT_OVERFLOW_POLICY", "drop_newest")  # drop_newest, drop_oldest
+    AUDIT_READ_SAMPLE_RATE = float(os.getenv("AUDIT_READ_SAMPLE_RATE", "1.0"))  # share of successful GET/HEAD rows kept
+    AUDIT_SKIP_PATHS = os.getenv("AUDIT_SKIP_PATHS", "/health,/metrics,/favicon.ico,/@vite/*")  # never audited; "*" suffix = prefix
+
+    # Audit retention (see backend/audit_retention.py)
+    AUDIT_HOT_DAYS = int(os.getenv("AUDIT_HOT_DAYS", "31"))
+    AUDIT_RAW_RETENTION_DAYS = int(os.getenv("AUDIT_RAW_RETENTION_DAYS", "90"))
+    AUDIT_COMPACTION_INTERVAL_MINUTES = int(os.getenv("AUDIT_COMPACTION_INTERVAL_MINUTES", "360"))  # 0 disables
+
+    # /metrics (see backend/metrics.py). Required outside development; without it only local dev scrapes.
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+    METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+    METRICS_FLUSH_INTERVAL_S = float(os.getenv("METRICS_FLUSH_INTERVAL_S", "5"))
+
+    # SQL instrumentation (see backend/query_stats.py)
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+    SQL_STATS_MAX_SHAPES = int(os.getenv("SQL_STATS_MAX_SHAPES", "500"))
+    PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "30"))
+    # Event-loop stall detector (see backend/loop_monitor.py)
+    LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+    LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50"))
+    LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "100"))
+
+    # Password hashing pool (see backend/password_hasher.py)
+    PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process")  # process, thread, inline
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))  # 0 = min(4, CPUs)
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "0"))  # 0 = 2 per worker; beyond this, 503
+
+    # Password hash format and cost; older hashes are upgraded on login.
+    # Calibrate with: python -m backend.benchmarks.password_calibration
+    PASSWORD_HASH_ALGORITHM = os.getenv("PASSWORD_HASH_ALGORITHM", "pbkdf2-sha256")  # pbkdf2-sha256, scrypt
+    PASSWORD_PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+    PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", "32768"))
+    PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+    PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+
+    JWT_CLAIMS_CACHE_SIZE = int(os.getenv("JWT_CLAIMS_CACHE_SIZE", "4096"))  # verified access tokens kept until exp
+
+    # Authenticated identity cache (see backend/identity_cache.py)
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+    IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "300"))
+    IDENTITY_EPOCH_REFRESH_SECONDS = float(os.getenv("IDENTITY_EPOCH_REFRESH_SECONDS", "5"))  # cross-worker staleness bound
+
+    # Leased feature quota (see backend/quota_leases.py)
+    # plan=units reserved per DB write; never admits past the limit, but a user may be refused up to
+    # (units - 1) calls early per other worker while those units sit idle in its lease
+    QUOTA_LEASE_BLOCKS = os.getenv("QUOTA_LEASE_BLOCKS", "basic=5,pro=10,enterprise=50")
+    QUOTA_LEASE_IDLE_SECONDS = float(os.getenv("QUOTA_LEASE_IDLE_SECONDS", "60"))  # unused allowance returned after this
+    QUOTA_LEASE_RECONCILE_SECONDS = float(os.getenv("QUOTA_LEASE_RECONCILE_SECONDS", "15"))  # 0 disables the background pass
+
+    # Refresh-token sessions, one per device (see backend/auth_sessions.py)
+    AUTH_SESSION_SWEEP_INTERVAL_MINUTES = int(os.getenv("AUTH_SESSION_SWEEP_INTERVAL_MINUTES", "60"))  # 0 disables
+    AUTH_SESSION_SWEEP_BATCH = int(os.getenv("AUTH_SESSION_SWEEP_BATCH", "1000"))  # rows deleted per transaction
+
     ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
     ADMIN_INVITE_CODE = os.getenv("ADMIN_INVITE_CODE", "")
 
@@ -67,6 +126,37 @@ class Settings:
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
     GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+
+    # AI provider clients (see backend/ai_service.py); calls are async and pooled per worker
+    AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", "60"))  # whole call, per attempt
+    AI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("AI_CONNECT_TIMEOUT_SECONDS", "5"))
+    AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+    AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "100"))  # concurrent provider calls per worker
+    AI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+    # Provider order for every AI call (see backend/ai_providers.py): gemini, openai, stub.
+    # AI_PROVIDERS=stub serves canned payloads with no network, for load tests.
+    AI_PROVIDERS = os.getenv("AI_PROVIDERS", "gemini,openai")
+    AI_STUB_LATENCY_MS = float(os.getenv("AI_STUB_LATENCY_MS", "0"))  # mean latency per call
+    AI_STUB_LATENCY_DISTRIBUTION = os.getenv("AI_STUB_LATENCY_DISTRIBUTION", "fixed")  # fixed, uniform, exponential, lognormal
+    AI_STUB_LATENCY_SPREAD = float(os.getenv("AI_STUB_LATENCY_SPREAD", "0.5"))  # uniform: +/- fraction of mean; lognormal: sigma
+    AI_STUB_ERROR_RATE = float(os.getenv("AI_STUB_ERROR_RATE", "0"))  # fraction of calls that fail
+    AI_STUB_COMPLETION_TOKENS = int(os.getenv("AI_STUB_COMPLETION_TOKENS", "256"))
+    AI_STUB_SEED = int(os.getenv("AI_STUB_SEED", "0"))  # latency and error draws
+
+    # Generated-content cache per worker (see backend/ai_cache.py)
+    AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "10000"))
+    AI_CACHE_MAX_MB = float(os.getenv("AI_CACHE_MAX_MB", "64"))  # approximate; LRU entries go first
+    AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))  # namespaces without their own TTL
+    AI_CACHE_TTLS = os.getenv("AI_CACHE_TTLS", "syllabus=86400,flashcards=86400,quiz=3600")  # namespace=seconds
+    AI_CACHE_SWEEP_SECONDS = float(os.getenv("AI_CACHE_SWEEP_SECONDS", "60"))  # expired entries dropped at most this late
+    # Second tier in the main database (ai_cache_entries): shared by workers, kept across deploys
+    AI_CACHE_PERSISTENT = os.getenv("AI_CACHE_PERSISTENT", "true").lower() == "true"
+    AI_CACHE_DB_MAX_MB = float(os.getenv("AI_CACHE_DB_MAX_MB", "256"))  # compressed; soonest-expiring rows pruned first
+    AI_CACHE_DB_MAX_ENTRY_KB = int(os.getenv("AI_CACHE_DB_MAX_ENTRY_KB", "512"))  # larger payloads stay memory-only
+    AI_CACHE_DB_PRUNE_SECONDS = float(os.getenv("AI_CACHE_DB_PRUNE_SECONDS", "300"))  # 0 disables the background pass
+    AI_CACHE_COMPRESS_LEVEL = int(os.getenv("AI_CACHE_COMPRESS_LEVEL", "6"))  # zlib, 1 (fast) to 9 (small)
+    AI_CACHE_KEY_VERSION = os.getenv("AI_CACHE_KEY_VERSION", "1")  # bump to orphan stored content after prompt changes
     IS_VERCEL = os.getenv("VERCEL") == "1"
 
 settings = Settings()
@@ -121,13 +121,9 @@ class CrawlerService:
         """
 
         try:
-            # We use the existing vision_model (Gemini 3 Flash) but pass text
-            # AIService needs a generic 'generate' method or we use vision_model with just text parts
-            # Since Gemini 3 Flash is multimodal, it accepts text-only prompts too.
-            
-            response = await self.ai_service.vision_model.generate_content_async(prompt)
+            # Goes through the configured provider chain (AI_PROVIDERS)
+            text_resp = await self.ai_service.chat(prompt)
             # Extract JSON from response text (handle potential markdown formatting)
-            text_resp = response.text
             json_match = re.search(r"\{.*\}", text_resp, re.DOTALL)
             if json_match:
                 return json.loads(json_match.group())
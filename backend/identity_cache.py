@@ -0,0 +1,268 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+In-process cache of authenticated identities.
+
+get_current_user resolves a token to an immutable UserSnapshot (the user row
+plus its profile, loaded in one query) and keeps it here keyed by
+(username, token version). A cached snapshot is served without touching the
+database.
+
+Invalidation:
+- Same worker: a session hook bumps `users.identity_version` (and stamps
+  `identity_changed_at`) whenever a flush changes an identity field (role,
+  plan, subscription, suspension, token version, profile, ...) and evicts
+  that user once the transaction commits.
+- Other workers: every worker keeps an EpochTable, user id -> latest
+  identity_version, for users changed within the revocation window. It is
+  refreshed at most every IDENTITY_EPOCH_REFRESH_SECONDS with one indexed
+  query over identity_changed_at, whatever the number of users. A snapshot
+  (or a token's entitlement claims) older than the table's epoch for that
+  user is stale. Cross-worker staleness is bounded by the refresh interval;
+  TTL bounds memory for idle users.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+
+# User columns whose change must be visible to the next request
+IDENTITY_FIELDS = (
+    "username",
+    "full_name",
+    "role",
+    "school_id",
+    "subscription_status",
+    "subscription_expiry",
+    "plan",
+    "is_suspended",
+    "token_version",
+)
+
+
+@dataclass(frozen=True)
+class ProfileSnapshot:
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    grade_level: Optional[int] = None
+    class_name: Optional[str] = None
+    subject: Optional[str] = None
+    child_name: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: Optional[int]
+    username: str
+    full_name: Optional[str]
+    role: Optional[str]
+    school_id: Optional[str]
+    subscription_status: Optional[str]
+    subscription_expiry: Optional[datetime]
+    plan: Optional[str]
+    is_suspended: bool
+    token_version: int
+    identity_version: int
+    profile: Optional[ProfileSnapshot] = None
+    is_developer: bool = False
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "UserSnapshot":
+        profile = user.profile
+        return cls(
+            id=user.id,
+            username=user.username,
+            full_name=user.full_name,
+            role=user.role,
+            school_id=user.school_id,
+            subscription_status=user.subscription_status,
+            subscription_expiry=user.subscription_expiry,
+            plan=user.plan,
+            is_suspended=bool(user.is_suspended),
+            token_version=int(user.token_version or 0),
+            identity_version=int(user.identity_version or 0),
+            profile=(
+                ProfileSnapshot(**{f.name: getattr(profile, f.name, None) for f in fields(ProfileSnapshot)})
+                if profile is not None else None
+            ),
+        )
+
+
+Key = Tuple[str, Optional[int]]
+
+# identity_changed_at is naive UTC
+_EPOCH = datetime(1970, 1, 1)
+
+
+class IdentityCache:
+    """Bounded LRU of UserSnapshots with a hard TTL."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (snapshot, cached_at)
+        self._entries: "OrderedDict[Key, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Key) -> Optional[UserSnapshot]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] >= self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Key, snapshot: UserSnapshot):
+        with self._lock:
+            self._entries[key] = (snapshot, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None, username: Optional[str] = None):
+        with self._lock:
+            stale = [
+                k for k, (snap, _) in self._entries.items()
+                if (user_id is not None and snap.id == user_id) or (username is not None and k[0] == username)
+            ]
+            for k in stale:
+                del self._entries[k]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class EpochTable:
+    """
+    user id -> identity_version for users whose identity changed within
+    `window` seconds. Anything issued or cached before a change carries a
+    lower version and is therefore stale; entries older than the longest-lived
+    such thing (access token or cached snapshot) can be forgotten.
+    """
+
+    # Overlap between refreshes: covers commit latency and clock skew between workers
+    SLACK_SECONDS = 30.0
+
+    def __init__(self, refresh_interval: float = 5.0, window: float = 3600.0, clock=time.time):
+        self.refresh_interval = refresh_interval
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._epochs: Dict[int, Tuple[int, float]] = {}
+        self._refreshed_at: Optional[float] = None
+
+    def current(self, user_id: Optional[int]) -> int:
+        with self._lock:
+            entry = self._epochs.get(user_id)
+        return entry[0] if entry is not None else 0
+
+    def note(self, user_id: int, version: int, changed_at: Optional[float] = None):
+        changed_at = self._clock() if changed_at is None else changed_at
+        with self._lock:
+            known = self._epochs.get(user_id)
+            if known is None or version > known[0]:
+                self._epochs[user_id] = (version, changed_at)
+
+    def refresh_if_due(self, db) -> bool:
+        """One query per refresh_interval per worker; returns True if it ran."""
+        now = self._clock()
+        with self._lock:
+            if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return False
+            since = (self._refreshed_at - self.SLACK_SECONDS) if self._refreshed_at is not None else now - self.window
+            self._refreshed_at = now
+        rows = (
+            db.query(models.User.id, models.User.identity_version, models.User.identity_changed_at)
+            .filter(models.User.identity_changed_at >= datetime.utcfromtimestamp(since))
+            .all()
+        )
+        for user_id, version, changed_at in rows:
+            self.note(user_id, int(version or 0), (changed_at - _EPOCH).total_seconds())
+        with self._lock:
+            cutoff = now - self.window
+            for user_id in [k for k, (_, changed) in self._epochs.items() if changed < cutoff]:
+                del self._epochs[user_id]
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._epochs.clear()
+            self._refreshed_at = None
+
+
+identity_cache = IdentityCache(
+    max_entries=settings.IDENTITY_CACHE_MAX_ENTRIES,
+    ttl=settings.IDENTITY_CACHE_TTL_SECONDS,
+)
+identity_epochs = EpochTable(
+    refresh_interval=settings.IDENTITY_EPOCH_REFRESH_SECONDS,
+    window=max(settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, settings.IDENTITY_CACHE_TTL_SECONDS) + EpochTable.SLACK_SECONDS,
+)
+
+
+# --- invalidation hooks (every Session, including test sessionmakers) ---
+
+def _bump(session: Session, user: models.User):
+    user.identity_version = int(user.identity_version or 0) + 1
+    user.identity_changed_at = datetime.utcnow()
+    if user.id is not None:
+        session.info.setdefault("identity_invalidations", {})[user.id] = user.identity_version
+
+
+@event.listens_for(Session, "before_flush")
+def _version_identity_changes(session, flush_context, instances):
+    for obj in session.dirty:
+        if isinstance(obj, models.User):
+            state = sa_inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in IDENTITY_FIELDS):
+                _bump(session, obj)
+        elif isinstance(obj, models.UserProfile) and obj.user_id is not None:
+            if session.is_modified(obj, include_collections=False):
+                with session.no_autoflush:
+                    owner = session.get(models.User, obj.user_id)
+                if owner is not None:
+                    _bump(session, owner)
+    for obj in session.deleted:
+        if isinstance(obj, models.User) and obj.id is not None:
+            # No row left for other workers to read; revoke locally
+            session.info.setdefault("identity_invalidations", {})[obj.id] = sys.maxsize
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_committed(session):
+    for user_id, version in session.info.pop("identity_invalidations", {}).items():
+        identity_epochs.note(user_id, version)
+        identity_cache.invalidate(user_id=user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("identity_invalidations", None)
@@ -0,0 +1,177 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Event-loop stall detector.
+
+A heartbeat task sleeps for a fixed interval and records how late it wakes up
+(loop lag). A watchdog thread checks the heartbeat: once it is overdue by more
+than the stall threshold, the loop thread is blocked, so the watchdog captures
+that thread's stack while the blocking call is still on it. When the heartbeat
+finally runs, the stall is recorded against the captured stack with its full
+duration.
+
+Stalls are aggregated by stack and by the innermost backend/ frame, which is
+normally the handler line that made the blocking call.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger("lumios")
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def _stack(frame) -> Tuple[str, str]:
+    """(collapsed stack root-first, innermost application frame)"""
+    frames: List[str] = []
+    app_frame = None
+    while frame is not None:
+        code = frame.f_code
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        frames.append(label)
+        if app_frame is None and code.co_filename.startswith(_BACKEND_DIR) and code.co_filename != _THIS_FILE:
+            app_frame = f"{os.path.relpath(code.co_filename, os.path.dirname(_BACKEND_DIR))}:{frame.f_lineno} in {code.co_name}"
+        frame = frame.f_back
+    return ";".join(reversed(frames)), app_frame or "unknown"
+
+
+class LoopMonitor:
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, max_stacks: int = 200):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_stacks = max_stacks
+
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self._beat_seq = 0
+        self._beat_at = time.perf_counter()
+        # (beat_seq, stack, app_frame) captured by the watchdog for the current stall
+        self._pending: Optional[Tuple[int, str, str]] = None
+
+        self._lock = threading.Lock()
+        self._stalls: Dict[Tuple[str, str], List[Any]] = {}
+        self.stall_count = 0
+        self.max_lag = 0.0
+
+    # --- lifecycle ---
+
+    def start(self):
+        """Start on the running loop. Safe to call again on a new loop."""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat_at = time.perf_counter()
+        self._task = loop.create_task(self._heartbeat())
+        if self._watchdog is not None and self._stop.is_set():
+            # A previous stop() is still winding the old watchdog down
+            self._watchdog.join()
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # --- loop side ---
+
+    async def _heartbeat(self):
+        while True:
+            self._beat_seq += 1
+            beat = self._beat_seq
+            self._beat_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - self._beat_at - self.interval)
+            metrics.EVENT_LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                pending = self._pending
+                if pending is not None and pending[0] == beat:
+                    self._record(pending[1], pending[2], lag)
+                else:
+                    # Blocked and released between two watchdog checks
+                    self._record("<not captured>", "unknown", lag)
+            self._pending = None
+
+    # --- watchdog side ---
+
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            beat = self._beat_seq
+            overdue = time.perf_counter() - self._beat_at - self.interval
+            if overdue < self.threshold or (self._pending is not None and self._pending[0] == beat):
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack, app_frame = _stack(frame)
+            self._pending = (beat, stack, app_frame)
+
+    # --- reporting ---
+
+    def _record(self, stack: str, app_frame: str, lag: float):
+        metrics.EVENT_LOOP_STALLS.inc()
+        logger.warning("Event loop stall", extra={"duration_ms": int(lag * 1000), "frame": app_frame})
+        with self._lock:
+            self.stall_count += 1
+            self.max_lag = max(self.max_lag, lag)
+            key = (app_frame, stack)
+            entry = self._stalls.get(key)
+            if entry is None:
+                if len(self._stalls) >= self.max_stacks:
+                    del self._stalls[min(self._stalls, key=lambda k: self._stalls[k][1])]
+                entry = self._stalls[key] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += lag
+            entry[2] = max(entry[2], lag)
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            items = sorted(self._stalls.items(), key=lambda kv: kv[1][1], reverse=True)[:limit]
+            return {
+                "threshold_ms": self.threshold * 1000,
+                "stalls": self.stall_count,
+                "max_stall_ms": round(self.max_lag * 1000, 1),
+                "offenders": [
+                    {
+                        "frame": app_frame,
+                        "count": count,
+                        "total_ms": round(total * 1000, 1),
+                        "max_ms": round(longest * 1000, 1),
+                        "stack": stack,
+                    }
+                    for (app_frame, stack), (count, total, longest) in items
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stalls.clear()
+            self.stall_count = 0
+            self.max_lag = 0.0
+
+
+loop_monitor = LoopMonitor(
+    threshold=settings.LOOP_STALL_THRESHOLD_MS / 1000.0,
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000.0,
+)
@@ -10,16 +10,19 @@ Created by: Faizain Murtuza
 © 2025 Faizain Murtuza. All Rights Reserved.
 System: LumiX OS v1.0.0
 """
-from fastapi import FastAPI, Depends, HTTPException, Request, Response, Header, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, Header, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func
+from sqlalchemy import literal, select, text, func, tuple_, union_all
 from sqlalchemy.exc import IntegrityError
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta, timezone
 from types import SimpleNamespace
 import os
+import asyncio
+import threading
+import base64
 import time
 import secrets
 import re
@@ -44,11 +47,17 @@ logger.setLevel(logging.INFO if settings.ENVIRONMENT == "production" else loggin
 
 from backend import models, schemas, database, auth
 from backend.ai_service import ai_service
+from backend.audit import audit_policy, audit_writer
+from backend import audit_retention, auth_sessions, metrics, profiler, query_stats
+from backend.loop_monitor import loop_monitor
+from backend.password_hasher import HasherSaturated, password_hasher
+from backend.quota_leases import quota_leases
 from backend.crawler_service import CrawlerService
 
 crawler_service = CrawlerService(ai_service)
 
-from backend.security import add_security_headers, sanitize_input, validate_email, validate_password_strength, validate_username
+from backend.middleware import CoreHTTPMiddleware
+from backend.security import sanitize_input, validate_email, validate_password_strength, validate_username
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -63,23 +72,21 @@ from jose import jwt, JWTError
 
 app = FastAPI() 
 
-# Read CORS origins from env 
-origins = os.getenv("CORS_ORIGINS", "").split(",") 
-
-app.add_middleware( 
-    CORSMiddleware, 
-    allow_origins=origins, 
-    allow_credentials=True, 
-    allow_methods=["*"], 
-    allow_headers=["*"], 
-) 
-
 # Initialize Rate Limiter
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 
+@app.exception_handler(HasherSaturated)
+async def _password_hashing_saturated(request: Request, exc: HasherSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": auth._error_detail("AUTH_BUSY", "Sign-in is busy, please retry shortly")},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.get("/")
 async def root():
     return {
@@ -119,9 +126,46 @@ async def health(db: Session = Depends(database.get_db)):
         "mode": "production" if settings.ENVIRONMENT == "production" else "development"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request, authorization: Optional[str] = Header(None)):
+    """
+    Prometheus scrape target. Bearer METRICS_TOKEN; without a token, only in
+    development and only to loopback clients (behind a same-host proxy every
+    client looks like loopback).
+    """
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not authorization or not secrets.compare_digest(authorization, expected):
+            raise HTTPException(status_code=401, detail="Metrics token required")
+    elif settings.ENVIRONMENT != "development":
+        raise HTTPException(status_code=403, detail="Set METRICS_TOKEN to serve metrics outside development")
+    elif not request.client or request.client.host not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="Metrics are only served to loopback clients")
+    # Reads, merges and compacts the other workers' snapshot files: keep it off the loop
+    text = await asyncio.to_thread(metrics.registry.render)
+    return Response(content=text, media_type=metrics.CONTENT_TYPE)
+
 # --- DEVELOPER & ADMIN ENDPOINTS ---
 dev_guard = auth.DeveloperGuard()
 
+@app.get("/internal/system/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    order_by: str = Query("total", pattern="^(total|max|count)$"),
+    current_user: models.User = Depends(dev_guard)
+):
+    """Developer: Slowest SQL statement shapes seen by this worker."""
+    return {
+        "slow_query_ms": settings.SLOW_QUERY_MS,
+        "statements": query_stats.statement_stats.top(limit, order_by),
+    }
+
+@app.delete("/internal/system/slow-queries")
+async def reset_slow_queries(current_user: models.User = Depends(dev_guard)):
+    """Developer: Clear the statement shape table."""
+    query_stats.statement_stats.reset()
+    return {"status": "ok"}
+
 @app.get("/internal/system/settings")
 async def get_system_settings(
     db: Session = Depends(database.get_db),
@@ -186,127 +230,122 @@ async def get_system_stats(
         "developer_session": getattr(current_user, "username", "anonymous")
     }
 
+@app.get("/internal/system/profile")
+async def profile_worker(
+    seconds: float = Query(5.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    all_threads: bool = False,
+    current_user: models.User = Depends(dev_guard)
+):
+    """Developer: Sample this worker's stacks and return a collapsed (flamegraph) profile."""
+    seconds = min(seconds, settings.PROFILER_MAX_SECONDS)
+    loop_thread = threading.get_ident()
+    try:
+        stacks = await asyncio.to_thread(
+            profiler.sample_stacks, seconds, interval_ms / 1000.0, loop_thread, all_threads
+        )
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker")
+    logger.info(f"Profile captured by {current_user.username}: {seconds}s, {sum(stacks.values())} samples")
+    return Response(content=profiler.collapsed(stacks), media_type="text/plain")
+
+@app.get("/internal/system/loop-stalls")
+async def get_loop_stalls(
+    limit: int = Query(20, ge=1, le=200),
+    current_user: models.User = Depends(dev_guard)
+):
+    """Developer: Event-loop stalls on this worker, grouped by the blocking frame."""
+    return loop_monitor.report(limit)
+
+@app.delete("/internal/system/loop-stalls")
+async def reset_loop_stalls(current_user: models.User = Depends(dev_guard)):
+    """Developer: Clear recorded stalls (e.g. after deploying an async fix)."""
+    loop_monitor.reset()
+    return {"status": "ok"}
+
 # ----------------------------
 # SECURITY MIDDLEWARE
 # ----------------------------
 # NOTE: Vercel/Cloudflare handles HTTPS redirection at the edge. 
 # Internal HTTPS redirection can cause issues on serverless platforms.
 
-# Add security headers to all responses
-app.middleware("http")(add_security_headers)
+_audit_compaction_task: Optional[asyncio.Task] = None
+_session_sweep_task: Optional[asyncio.Task] = None
+_quota_reconcile_task: Optional[asyncio.Task] = None
+_ai_cache_prune_task: Optional[asyncio.Task] = None
 
 
-@app.middleware("http")
-async def pna_middleware(request: Request, call_next):
-    """
-    Adds support for Private Network Access (PNA) to all responses.
-    """
-    response = await call_next(request)
-    if request.headers.get("Access-Control-Request-Private-Network") == "true":
-        response.headers["Access-Control-Allow-Private-Network"] = "true"
-    return response
+metrics.instrument_engine(database.engine)
+query_stats.instrument_engine(database.engine)
 
-@app.middleware("http")
-async def audit_middleware(request: Request, call_next):
-    request_id = secrets.token_urlsafe(12)
-    started = time.time()
-    response = None
 
-    try:
-        response = await call_next(request)
-        duration_ms = int((time.time() - started) * 1000)
-        
-        # Add creator attribution to all API responses
-        response.headers["X-Created-By"] = "Faizain Murtuza"
-        response.headers["X-System-Architecture"] = "Asynchronous Intelligence-First SMS"
-        
-        # Structured logging with creator attribution
-        logger.info(
-            "Request processed",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "status_code": response.status_code,
-                "duration_ms": duration_ms,
-                "ip": get_remote_address(request),
-                "creator": "Faizain Murtuza"
-            }
+@app.on_event("startup")
+async def start_metrics_snapshots():
+    """Multi-worker deployments share metrics through METRICS_MULTIPROC_DIR."""
+    metrics.start_multiprocess_if_configured()
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    """Watch for handlers that block the event loop."""
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
+
+@app.on_event("startup")
+async def start_audit_compaction():
+    """Archive, roll up and drop aged audit rows in the background."""
+    global _audit_compaction_task
+    if settings.AUDIT_COMPACTION_INTERVAL_MINUTES > 0:
+        _audit_compaction_task = asyncio.create_task(
+            audit_retention.run_periodically(settings.AUDIT_COMPACTION_INTERVAL_MINUTES * 60)
         )
-        return response
-    except Exception as e:
-        import traceback
-        traceback.print_exc() # Print full traceback to console
-        duration_ms = int((time.time() - started) * 1000)
-        logger.error(
-            "Request failed",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "status_code": 500,
-                "duration_ms": duration_ms,
-                "error": str(e)
-            }
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    """Delete expired refresh-token sessions in the background."""
+    global _session_sweep_task
+    if settings.AUTH_SESSION_SWEEP_INTERVAL_MINUTES > 0:
+        _session_sweep_task = asyncio.create_task(
+            auth_sessions.run_periodically(settings.AUTH_SESSION_SWEEP_INTERVAL_MINUTES * 60)
         )
-        return JSONResponse(
-            status_code=500,
-            content={"detail": "Internal Server Error", "request_id": request_id}
+
+
+@app.on_event("startup")
+async def start_quota_reconcile():
+    """Return idle quota leases to the shared counters in the background."""
+    global _quota_reconcile_task
+    if settings.QUOTA_LEASE_RECONCILE_SECONDS > 0:
+        _quota_reconcile_task = asyncio.create_task(
+            quota_leases.run_periodically(settings.QUOTA_LEASE_RECONCILE_SECONDS)
         )
-    finally:
-        # Save to AuditLog (optional for every request, but kept here as per original)
-        try:
-            status_code = getattr(response, "status_code", 500)
-            auth_header = request.headers.get("authorization") or ""
 
-            user_id = None
-            school_id = None
-            if auth_header.lower().startswith("bearer "):
-                token = auth_header.split(" ", 1)[1].strip()
-                try:
-                    payload = jwt.decode(
-                        token,
-                        settings.SECRET_KEY,
-                        algorithms=[settings.ALGORITHM],
-                        audience="lumios-frontend",
-                        issuer="lumios-api",
-                    )
-                    username = payload.get("sub")
-                    school_id = payload.get("school_id") or school_id
-                    if username:
-                        db = database.SessionLocal()
-                        try:
-                            user = db.query(models.User).filter(models.User.username == username).first()
-                            if user:
-                                user_id = user.id
-                                school_id = getattr(user, "school_id", None)
-                        finally:
-                            db.close()
-                except Exception:
-                    user_id = None
-                    school_id = None
 
-            db = database.SessionLocal()
-            try:
-                db.add(models.AuditLog(
-                    user_id=user_id,
-                    school_id=school_id,
-                    ip=get_remote_address(request),
-                    method=request.method,
-                    path=request.url.path,
-                    status_code=status_code,
-                    user_agent=(request.headers.get("user-agent") or "")[:500],
-                    request_id=request_id,
-                ))
-                db.commit()
-            finally:
-                db.close()
-        except Exception:
-            pass
+@app.on_event("startup")
+async def start_ai_cache_prune():
+    """Drop expired and over-budget rows from the shared AI cache in the background."""
+    global _ai_cache_prune_task
+    if ai_service.cache.persistent is not None and settings.AI_CACHE_DB_PRUNE_SECONDS > 0:
+        _ai_cache_prune_task = asyncio.create_task(
+            ai_service.cache.persistent.run_periodically(settings.AI_CACHE_DB_PRUNE_SECONDS)
+        )
+
 
-        if response is not None:
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Response-Time-ms"] = str(int((time.time() - started) * 1000))
+@app.on_event("shutdown")
+async def flush_audit_log():
+    """Drain queued audit rows before the worker exits."""
+    for task in (_audit_compaction_task, _session_sweep_task, _quota_reconcile_task, _ai_cache_prune_task):
+        if task is not None:
+            task.cancel()
+    try:
+        await asyncio.to_thread(quota_leases.release_all)
+    except Exception as e:
+        logger.error(f"Returning quota leases failed: {e}")
+    loop_monitor.stop()
+    password_hasher.shutdown()
+    await ai_service.aclose()
+    await audit_writer.stop()
 
 # CORS CONFIG - Handle both list and string from settings
 if isinstance(settings.CORS_ORIGINS, list):
@@ -316,9 +355,10 @@ else:
 
 # If we're in production, we might want to restrict this more carefully,
 # but for now, we ensure current origin is allowed if it's a known domain.
+# Registered exactly once; a frozenset makes the per-request origin check O(1).
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=cors_origins,
+    allow_origins=frozenset(cors_origins),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -326,6 +366,11 @@ app.add_middleware(
     max_age=600,
 )
 
+# Outermost layer: security/attribution/request-id/timing headers, Private
+# Network Access and auditing in a single pure-ASGI pass (backend/middleware.py).
+# Wrapping CORS means preflights it answers get the PNA and security headers too.
+app.add_middleware(CoreHTTPMiddleware, audit_writer=audit_writer, audit_policy=audit_policy)
+
 # FIX: allow OPTIONS (CORS preflight) for all routes including Private Network Access
 @app.options("/{path:path}")
 @limiter.exempt
@@ -404,12 +449,15 @@ try:
                     "plan": "ALTER TABLE users ADD COLUMN plan VARCHAR",
                     "is_suspended": "ALTER TABLE users ADD COLUMN is_suspended BOOLEAN DEFAULT 0",
                     "token_version": "ALTER TABLE users ADD COLUMN token_version INTEGER DEFAULT 0",
+                    "identity_version": "ALTER TABLE users ADD COLUMN identity_version INTEGER DEFAULT 0",
+                    "identity_changed_at": "ALTER TABLE users ADD COLUMN identity_changed_at DATETIME",
                     "refresh_token_hash": "ALTER TABLE users ADD COLUMN refresh_token_hash VARCHAR",
                     "refresh_token_expires_at": "ALTER TABLE users ADD COLUMN refresh_token_expires_at DATETIME",
                     "school_id": "ALTER TABLE users ADD COLUMN school_id VARCHAR",
                 },
                 "user_profiles": {
                     "school_id": "ALTER TABLE user_profiles ADD COLUMN school_id VARCHAR",
+                    "email_normalized": "ALTER TABLE user_profiles ADD COLUMN email_normalized VARCHAR",
                 },
                 "students": {
                     "school_id": "ALTER TABLE students ADD COLUMN school_id VARCHAR",
@@ -425,6 +473,7 @@ try:
                 },
                 "audit_logs": {
                     "school_id": "ALTER TABLE audit_logs ADD COLUMN school_id VARCHAR",
+                    "sample_rate": "ALTER TABLE audit_logs ADD COLUMN sample_rate FLOAT DEFAULT 1.0",
                 },
                 "school_config": {
                     "name": "ALTER TABLE school_config ADD COLUMN name VARCHAR",
@@ -457,9 +506,68 @@ try:
                     conn.execute(text(f"UPDATE {table} SET school_id = COALESCE(school_id, 'default')"))
                 except Exception:
                     pass
+            conn.commit()
+except Exception:
+    pass
+
+# create_all() does not add columns or indexes to tables that already exist
+try:
+    with database.engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS sample_rate FLOAT DEFAULT 1.0"))
+            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS identity_version INTEGER DEFAULT 0"))
+            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS identity_changed_at TIMESTAMP"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_identity_changed_at ON users (identity_changed_at)"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_audit_logs_school_created"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_school_created_id ON audit_logs (school_id, created_at, id)"))
 except Exception:
     pass
 
+
+def backfill_profile_emails(conn) -> int:
+    """
+    Fill user_profiles.email_normalized for rows written before the column
+    existed. When several profiles in a school share an email, only the oldest
+    gets it (the others keep logging in by username). Creates the unique index
+    first so the collision check below is an index probe.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS email_normalized VARCHAR"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_user_profiles_email_school "
+        "ON user_profiles (email_normalized, school_id)"
+    ))
+    return conn.execute(text("""
+        UPDATE user_profiles SET email_normalized = lower(trim(email))
+        WHERE id IN (
+            SELECT min(id) FROM user_profiles
+            WHERE email_normalized IS NULL AND trim(coalesce(email, '')) <> ''
+            GROUP BY school_id, lower(trim(email))
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM user_profiles AS taken
+            WHERE taken.school_id = user_profiles.school_id
+              AND taken.email_normalized = lower(trim(user_profiles.email))
+        )
+    """)).rowcount or 0
+
+
+try:
+    with database.engine.begin() as conn:
+        backfilled = backfill_profile_emails(conn)
+        if backfilled:
+            logger.info(f"Backfilled normalized email for {backfilled} profiles")
+except Exception as e:
+    logger.error(f"Profile email backfill failed: {e}")
+
+try:
+    with database.engine.begin() as conn:
+        moved = auth_sessions.migrate_legacy_refresh_tokens(conn)
+        if moved:
+            logger.info(f"Moved {moved} refresh tokens into auth_sessions")
+except Exception as e:
+    logger.error(f"Refresh token migration failed: {e}")
+
 # --- AUTO-SEEDING (Self-Healing) ---
 # Ensure at least one admin exists if the DB is empty (common on cold starts)
 try:
@@ -712,6 +820,8 @@ def register(user: schemas.UserCreate, request: Request, response: Response, db:
         db.rollback()
         if "UNIQUE constraint failed" in str(e) and "user_profiles.user_id" in str(e):
             raise HTTPException(status_code=400, detail="Profile already exists for this user")
+        elif "email_normalized" in str(e) or "ux_user_profiles_email_school" in str(e):
+            raise HTTPException(status_code=400, detail="Email already registered")
         elif "UNIQUE constraint failed" in str(e):
             raise HTTPException(status_code=400, detail="Username already registered")
         else:
@@ -728,12 +838,12 @@ def register(user: schemas.UserCreate, request: Request, response: Response, db:
             "plan": getattr(new_user, "plan", None),
             "school_id": getattr(new_user, "school_id", None),
             "tv": int(getattr(new_user, "token_version", 0) or 0),
+            "ent": auth.entitlement_claims(new_user),
         }
     )
 
     refresh_token = auth.create_refresh_token_jwt(new_user)
-    new_user.refresh_token_hash = auth._hash_refresh_token(refresh_token)
-    new_user.refresh_token_expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    auth_sessions.open_session(db, new_user.id, refresh_token, auth_sessions.device_label(request.headers.get("user-agent")))
     db.commit()
 
     response.set_cookie(
@@ -760,18 +870,31 @@ def register(user: schemas.UserCreate, request: Request, response: Response, db:
 @app.post("/login", response_model=schemas.Token)
 @limiter.limit("10/minute")
 def login(creds: schemas.UserLogin, request: Request, response: Response, db: Session = Depends(get_db)):
-    # Try username first, then try email
-    user = db.query(models.User).filter(models.User.username == creds.username).first()
-    
-    if not user:
-        # Check if username provided is actually an email in user_profiles
-        profile = db.query(models.UserProfile).filter(models.UserProfile.email == creds.username).first()
-        if profile:
-            user = db.query(models.User).filter(models.User.id == profile.user_id).first()
+    # Username or email, resolved in one round-trip; an exact username wins
+    by_username = select(models.User.id.label("user_id"), literal(0).label("rank")).where(
+        models.User.username == creds.username
+    )
+    by_email = select(models.UserProfile.user_id, literal(1)).where(
+        models.UserProfile.email_normalized == models.normalize_email(creds.username)
+    )
+    matches = union_all(by_username, by_email).subquery()
+    user = (
+        db.query(models.User)
+        .join(matches, models.User.id == matches.c.user_id)
+        .order_by(matches.c.rank, models.User.id)
+        .first()
+    )
 
     if not user or not auth.verify_password(creds.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    if auth.password_needs_rehash(user.password_hash):
+        # Upgrade to the configured algorithm and cost while we hold the plaintext
+        try:
+            user.password_hash = auth.get_password_hash(creds.password)
+        except HasherSaturated:
+            pass  # retried on a later login
+
     is_demo_login = (getattr(user, "subscription_status", "") or "").lower() == "demo" or (getattr(user, "role", "") or "").lower() == "demo"
     if is_demo_login:
         access_token = auth.create_demo_access_token(
@@ -789,12 +912,13 @@ def login(creds: schemas.UserLogin, request: Request, response: Response, db: Se
                 "plan": getattr(user, "plan", None),
                 "school_id": getattr(user, "school_id", None),
                 "tv": int(getattr(user, "token_version", 0) or 0),
+                "ent": auth.entitlement_claims(user),
             }
         )
 
+    # A new session per device; other devices stay signed in
     refresh_token = auth.create_refresh_token_jwt(user)
-    user.refresh_token_hash = auth._hash_refresh_token(refresh_token)
-    user.refresh_token_expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    auth_sessions.open_session(db, user.id, refresh_token, auth_sessions.device_label(request.headers.get("user-agent")))
     db.commit()
 
     response.set_cookie(
@@ -854,18 +978,18 @@ def refresh_auth(req: schemas.RefreshRequest, request: Request, response: Respon
     if not username:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    user = db.query(models.User).filter(models.User.username == username).first()
+    # Cached identity when current; the session rotation is the only write
+    user = auth.resolve_identity(db, username, int(payload.get("tv") or 0))
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     if getattr(user, "is_suspended", False):
         raise HTTPException(status_code=403, detail="Account suspended")
 
-    if int(payload.get("tv") or 0) != int(getattr(user, "token_version", 0) or 0):
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    if not user.refresh_token_hash or user.refresh_token_hash != auth._hash_refresh_token(raw_refresh):
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    if user.refresh_token_expires_at and user.refresh_token_expires_at < datetime.now(timezone.utc):
+    new_refresh = auth.create_refresh_token_jwt(user)
+    if not auth_sessions.rotate_session(db, user.id, raw_refresh, new_refresh):
+        db.rollback()
         raise HTTPException(status_code=401, detail="Not authenticated")
+    db.commit()
 
     access_token = auth.create_access_token(
         data={
@@ -876,14 +1000,10 @@ def refresh_auth(req: schemas.RefreshRequest, request: Request, response: Respon
             "plan": getattr(user, "plan", None),
             "school_id": getattr(user, "school_id", None),
             "tv": int(getattr(user, "token_version", 0) or 0),
+            "ent": auth.entitlement_claims(user),
         }
     )
 
-    new_refresh = auth.create_refresh_token_jwt(user)
-    user.refresh_token_hash = auth._hash_refresh_token(new_refresh)
-    user.refresh_token_expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    db.commit()
-
     response.set_cookie(
         key="refresh_token",
         value=new_refresh,
@@ -911,10 +1031,13 @@ def logout_auth(response: Response, db: Session = Depends(get_db), current_user:
         response.delete_cookie(key="refresh_token", path="/auth/refresh")
         return {"status": "ok"}
 
-    current_user.refresh_token_hash = None
-    current_user.refresh_token_expires_at = None
-    current_user.token_version = int(getattr(current_user, "token_version", 0) or 0) + 1
-    db.commit()
+    # current_user is a cached snapshot; write through the row
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    if user is not None:
+        # Signs out every device: their refresh sessions and access tokens
+        auth_sessions.revoke_user_sessions(db, user.id)
+        user.token_version = int(getattr(user, "token_version", 0) or 0) + 1
+        db.commit()
 
     response.delete_cookie(key="refresh_token", path="/auth/refresh")
     return {"status": "ok"}
@@ -1077,6 +1200,9 @@ allow_ai_report = auth.FeatureAccess("ai_report", allowed_roles=["parent", "admi
 allow_assignments_upload = auth.FeatureAccess("assignments_upload", allowed_roles=["teacher", "admin"])
 allow_system_config = auth.FeatureAccess("system_config", allowed_roles=["admin"])
 
+# Every guard is defined above; precompute their decisions for /me/entitlements
+auth.compile_entitlements()
+
 @app.get("/students/", response_model=List[schemas.StudentResponse])
 def read_students(skip: int = 0, limit: int = 100,
                   db: Session = Depends(get_db),
@@ -1232,6 +1358,46 @@ def delete_student(student_id: str,
     return {"status": "deleted"}
 
 
+@app.get("/me/entitlements", response_model=schemas.Entitlements)
+def get_entitlements(response: Response,
+                     db: Session = Depends(get_db),
+                     current_user: models.User = Depends(auth.get_current_principal)):
+    """Everything the user may use and today's remaining quota, in one call."""
+    decisions = auth.entitlement_matrix.for_user(current_user)
+    period = datetime.utcnow().strftime("%Y-%m-%d")
+    used: Dict[str, int] = {}
+    user_id = getattr(current_user, "id", None)
+    if user_id is not None and any(d.allowed and d.daily_limit is not None for d in decisions.values()):
+        used = dict(
+            db.query(models.UsageCounter.feature, models.UsageCounter.count)
+            .filter(models.UsageCounter.user_id == user_id, models.UsageCounter.period == period)
+            .all()
+        )
+
+    features = {}
+    for feature, decision in decisions.items():
+        remaining = None
+        if decision.allowed and decision.daily_limit is not None and user_id is not None:
+            # The counter includes units leased to workers; this worker's unspent lease is still available.
+            # Other workers' idle leases are not, so this can read slightly low.
+            held = quota_leases.held((user_id, feature, period))
+            remaining = max(0, decision.daily_limit - int(used.get(feature) or 0) + held)
+        features[feature] = {
+            "allowed": decision.allowed,
+            "reason": decision.code,
+            "daily_limit": decision.daily_limit,
+            "remaining": remaining,
+        }
+
+    response.headers["Cache-Control"] = "private, max-age=60"
+    return {
+        "role": current_user.role,
+        "plan": auth.effective_plan(current_user),
+        "subscription_active": auth.is_subscription_active(current_user),
+        "features": features,
+    }
+
+
 @app.get("/subscription/status")
 def get_subscription_status(current_user: models.User = Depends(auth.get_current_active_user)):
     return {
@@ -1260,21 +1426,77 @@ def get_ai_kill_switch(school_id: Optional[str] = None,
     }
 
 
-@app.get("/system/audit-logs", response_model=List[schemas.AuditLogResponse])
-def get_audit_logs(skip: int = 0, limit: int = 100,
+AUDIT_STATUS_CLASSES = {"1xx": 100, "2xx": 200, "3xx": 300, "4xx": 400, "5xx": 500}
+AUDIT_PAGE_COLUMNS = ("id", "created_at", "user_id", "school_id", "ip", "method", "path", "status_code", "user_agent")
+
+
+def encode_audit_cursor(created_at: datetime, log_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), log_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_audit_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, log_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/system/audit-logs", response_model=schemas.AuditLogPage)
+def get_audit_logs(limit: int = Query(100, ge=1, le=500),
+                   cursor: Optional[str] = None,
+                   user_id: Optional[int] = None,
+                   path_prefix: Optional[str] = Query(None, max_length=256),
+                   status_class: Optional[str] = Query(None, pattern=r"^[1-5]xx$"),
+                   since: Optional[datetime] = None,
+                   until: Optional[datetime] = None,
                    db: Session = Depends(get_db),
                    current_user: models.User = Depends(allow_system_config)):
+    """
+    Newest-first keyset pagination over (created_at, id). Pass `next_cursor`
+    back as `cursor` for the next page; every page costs the same index walk
+    on (school_id, created_at, id) no matter how deep it is. Rows already
+    moved into month archives are read from there (see audit_retention).
+    """
     school_id = normalize_school_id(getattr(current_user, "school_id", None))
-    logs = (
-        db.query(models.AuditLog)
-        .filter(models.AuditLog.school_id == school_id)
-        .order_by(models.AuditLog.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    cursor_key = decode_audit_cursor(cursor) if cursor else None
+    tables = audit_retention.readable_tables(
+        db.connection(), since=since, until=until, before=cursor_key[0] if cursor_key else None,
     )
-    # Ensure created_at is handled by Pydantic (it usually is)
-    return logs
+
+    # Same keyset walk on the hot table and on every archived month in range;
+    # each branch stops at limit + 1 rows, so a page never reads more than that per table
+    branches = []
+    for table in tables:
+        log = table.c
+        query = select(*(log[name] for name in AUDIT_PAGE_COLUMNS)).where(log.school_id == school_id)
+        if user_id is not None:
+            query = query.where(log.user_id == user_id)
+        if path_prefix:
+            escaped = path_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.where(log.path.like(f"{escaped}%", escape="\\"))
+        if status_class:
+            low = AUDIT_STATUS_CLASSES[status_class]
+            query = query.where(log.status_code >= low, log.status_code < low + 100)
+        if since is not None:
+            query = query.where(log.created_at >= since)
+        if until is not None:
+            query = query.where(log.created_at < until)
+        if cursor_key:
+            query = query.where(tuple_(log.created_at, log.id) < tuple_(*cursor_key))
+        branch = query.order_by(log.created_at.desc(), log.id.desc()).limit(limit + 1).subquery()
+        branches.append(select(branch))
+
+    # Fetch one extra row to learn whether another page exists
+    page = (union_all(*branches) if len(branches) > 1 else branches[0]).subquery()
+    logs = db.execute(select(page).order_by(page.c.created_at.desc(), page.c.id.desc()).limit(limit + 1)).all()
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_audit_cursor(logs[-1].created_at, logs[-1].id)
+    return {"items": logs, "next_cursor": next_cursor}
 
 
 @app.post("/system/ai-kill-switch")
@@ -0,0 +1,502 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms keep their values in plain dicts keyed by the
+label tuple; an update is a dict lookup plus a couple of additions under an
+uncontended lock, so it is safe to call on the request path and from the
+threadpool that runs sync endpoints.
+
+Multiprocess mode (METRICS_MULTIPROC_DIR): every worker snapshots its registry
+to `<dir>/<worker id>.json` once per METRICS_FLUSH_INTERVAL_S from a daemon
+thread, and whichever worker serves /metrics merges all snapshots. A worker id
+is "<pid>-<random>", so a recycled PID never overwrites an exited worker's
+file. Each worker holds an flock on `<worker id>.lock` for its lifetime; a
+lock that can be taken means the worker is gone (on platforms without fcntl
+the PID is probed instead).
+
+Counters and histograms from exited workers keep counting toward the totals;
+gauges only include workers that are still alive. The serving worker folds
+exited workers' files into `archive.json` (under `.compact.lock`) and deletes
+them, so the directory does not grow with every restart. The archive lists
+the ids it has absorbed, and those files are skipped if still present, so
+totals never drop or double count mid-compaction.
+"""
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: liveness falls back to PID probes and files are never compacted
+    fcntl = None
+
+logger = logging.getLogger("lumios")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AI_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+ARCHIVE_FILE = "archive.json"  # counters and histograms of exited workers
+COMPACT_LOCK = ".compact.lock"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(k), self._copy(v)] for k, v in self._values.items()]
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self, samples) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in samples]
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1.0):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues: str):
+        # Per-bucket (non-cumulative) counts; cumulated at render time
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+    def render(self, samples) -> List[str]:
+        lines = []
+        for key, (counts, total) in samples:
+            running = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                running += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._multiproc_dir: Optional[str] = None
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+        self._worker_lock = threading.Lock()
+        self._worker_id: Optional[str] = None
+        self._worker_pid: Optional[int] = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    # --- multiprocess mode ---
+
+    def start_multiprocess(self, directory: str, interval: float = 5.0):
+        """Begin snapshotting this worker's values into `directory`. Call once per worker process."""
+        os.makedirs(directory, exist_ok=True)
+        self._multiproc_dir = directory
+        if self._flusher is not None and self._flusher.is_alive() and self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def flush_forever():
+            while True:
+                time.sleep(interval)
+                self.write_snapshot()
+
+        self._flusher = threading.Thread(target=flush_forever, name="metrics-flusher", daemon=True)
+        self._flusher.start()
+
+    def worker_id(self) -> str:
+        """This process's snapshot id; a forked child gets its own (and its own liveness lock)."""
+        with self._worker_lock:
+            if self._worker_pid != os.getpid():
+                worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+                if fcntl is not None:
+                    # Held until the process exits; the descriptor is deliberately never closed
+                    fd = os.open(os.path.join(self._multiproc_dir, f"{worker_id}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                self._worker_id, self._worker_pid = worker_id, os.getpid()
+            return self._worker_id
+
+    def write_snapshot(self):
+        if not self._multiproc_dir:
+            return
+        path = os.path.join(self._multiproc_dir, f"{self.worker_id()}.json")
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w") as fh:
+                json.dump(self.snapshot(), fh)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Metrics snapshot failed: {e}")
+
+    def _worker_files(self) -> Dict[str, str]:
+        """worker id -> snapshot path, excluding the archive."""
+        return {
+            filename[:-5]: os.path.join(self._multiproc_dir, filename)
+            for filename in os.listdir(self._multiproc_dir)
+            if filename.endswith(".json") and filename != ARCHIVE_FILE
+        }
+
+    def _read_archive(self) -> dict:
+        try:
+            with open(os.path.join(self._multiproc_dir, ARCHIVE_FILE)) as fh:
+                return json.load(fh)
+        except (ValueError, OSError):
+            return {"merged": [], "metrics": {}}
+
+    def _merge_into(self, merged: Dict[str, Dict[Tuple[str, ...], object]], snapshot: dict, gauges: bool):
+        for name, samples in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is None or (isinstance(metric, Gauge) and not gauges):
+                continue
+            bucket = merged.setdefault(name, {})
+            for key, value in samples:
+                key = tuple(key)
+                bucket[key] = metric.merge(bucket[key], value) if key in bucket else value
+
+    def compact(self):
+        """Fold exited workers' snapshots into the archive and delete them. No-op while another worker compacts."""
+        if fcntl is None or not self._multiproc_dir:
+            return
+        own = self.worker_id()
+        guard = os.open(os.path.join(self._multiproc_dir, COMPACT_LOCK), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            try:
+                fcntl.flock(guard, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            files = self._worker_files()
+            dead = [w for w in files if w != own and not _worker_alive(self._multiproc_dir, w)]
+            if not dead:
+                return
+            archive = self._read_archive()
+            absorbed: Set[str] = set(archive.get("merged", []))
+            totals: Dict[str, Dict[Tuple[str, ...], object]] = {}
+            self._merge_into(totals, archive.get("metrics", {}), gauges=False)
+            for worker_id in dead:
+                if worker_id in absorbed:
+                    continue  # merged by a compaction that stopped before deleting the file
+                try:
+                    with open(files[worker_id]) as fh:
+                        self._merge_into(totals, json.load(fh), gauges=False)
+                except (ValueError, OSError):
+                    continue
+                absorbed.add(worker_id)
+
+            # Keep only ids whose files may still exist, so the list stays short
+            archive = {
+                "merged": sorted(absorbed & set(files)),
+                "metrics": {name: [[list(k), v] for k, v in samples.items()] for name, samples in totals.items()},
+            }
+            path = os.path.join(self._multiproc_dir, ARCHIVE_FILE)
+            with open(f"{path}.tmp", "w") as fh:
+                json.dump(archive, fh)
+            os.replace(f"{path}.tmp", path)
+            for worker_id in dead:
+                for suffix in (".json", ".lock"):
+                    try:
+                        os.remove(os.path.join(self._multiproc_dir, worker_id + suffix))
+                    except FileNotFoundError:
+                        pass
+        except OSError as e:
+            logger.error(f"Metrics compaction failed: {e}")
+        finally:
+            os.close(guard)
+
+    def _collect_multiprocess(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        self.write_snapshot()
+        self.compact()
+        own = self.worker_id()
+        merged: Dict[str, Dict[Tuple[str, ...], object]] = {name: {} for name in self._metrics}
+        archive = self._read_archive()
+        absorbed = set(archive.get("merged", []))
+        self._merge_into(merged, archive.get("metrics", {}), gauges=False)
+        for worker_id, path in self._worker_files().items():
+            if worker_id in absorbed:
+                continue
+            try:
+                with open(path) as fh:
+                    snapshot = json.load(fh)
+            except (ValueError, OSError):
+                continue
+            alive = worker_id == own or _worker_alive(self._multiproc_dir, worker_id)
+            self._merge_into(merged, snapshot, gauges=alive)
+        return merged
+
+    # --- exposition ---
+
+    def render(self) -> str:
+        if self._multiproc_dir:
+            collected = {name: sorted(samples.items()) for name, samples in self._collect_multiprocess().items()}
+        else:
+            collected = {name: sorted((tuple(k), v) for k, v in metric.snapshot()) for name, metric in self._metrics.items()}
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric.header())
+            lines.extend(metric.render(collected.get(name, [])))
+        return "\n".join(lines) + "\n"
+
+
+def _worker_alive(directory: str, worker_id: str) -> bool:
+    if fcntl is None:
+        try:
+            return _pid_alive(int(worker_id.split("-", 1)[0]))
+        except ValueError:
+            return False
+    try:
+        fd = os.open(os.path.join(directory, f"{worker_id}.lock"), os.O_RDWR)
+    except FileNotFoundError:
+        return False  # no lock: written by a worker that is gone (or predates worker ids)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)  # also releases the probe's lock
+    return False
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "lumios_http_request_duration_seconds",
+    "HTTP request latency by route template, method and status class.",
+    ("route", "method", "status_class"),
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    "lumios_http_requests_in_flight",
+    "HTTP requests currently being served.",
+)
+DB_CONNECTIONS_IN_USE = registry.gauge(
+    "lumios_db_connections_in_use",
+    "Database connections checked out of the pool by sessions.",
+)
+DB_CONNECTION_CHECKOUTS = registry.counter(
+    "lumios_db_connection_checkouts_total",
+    "Database connection checkouts, one per session transaction.",
+)
+AI_PROVIDER_DURATION = registry.histogram(
+    "lumios_ai_provider_call_duration_seconds",
+    "Successful AI provider call latency by provider.",
+    ("provider",),
+    buckets=AI_BUCKETS,
+)
+AI_PROVIDER_ERRORS = registry.counter(
+    "lumios_ai_provider_errors_total",
+    "Failed AI provider calls by provider.",
+    ("provider",),
+)
+AI_PROVIDER_TOKENS = registry.counter(
+    "lumios_ai_provider_tokens_total",
+    "Tokens reported by AI providers.",
+    ("provider",),
+)
+EVENT_LOOP_LAG = registry.histogram(
+    "lumios_event_loop_lag_seconds",
+    "How late the event loop heartbeat woke up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+EVENT_LOOP_STALLS = registry.counter(
+    "lumios_event_loop_stalls_total",
+    "Event loop stalls longer than LOOP_STALL_THRESHOLD_MS.",
+)
+
+PASSWORD_HASH_PENDING = registry.gauge(
+    "lumios_password_hash_pending",
+    "Password derivations queued or running in the hashing pool.",
+)
+PASSWORD_HASH_DURATION = registry.histogram(
+    "lumios_password_hash_duration_seconds",
+    "Password derivation latency including time queued for the pool.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+PASSWORD_HASH_REJECTED = registry.counter(
+    "lumios_password_hash_rejected_total",
+    "Password derivations refused because the hashing pool was saturated.",
+)
+PASSWORD_HASH_POOL_RESTARTS = registry.counter(
+    "lumios_password_hash_pool_restarts_total",
+    "Hashing pools discarded after a worker died; the next derivation starts a new one.",
+)
+
+JWT_CLAIMS_CACHE_LOOKUPS = registry.counter(
+    "lumios_jwt_claims_cache_lookups_total",
+    "Access-token claim lookups by result (hit skips signature verification).",
+    ("result",),
+)
+
+QUOTA_LEASE_DECISIONS = registry.counter(
+    "lumios_quota_lease_decisions_total",
+    "Quota checks by outcome: lease (in memory), acquired (DB block reserved) or denied.",
+    ("result",),
+)
+
+AI_CACHE_LOOKUPS = registry.counter(
+    "lumios_ai_cache_lookups_total",
+    "Generated-content cache lookups by namespace and result (hit or miss).",
+    ("namespace", "result"),
+)
+AI_CACHE_EVICTIONS = registry.counter(
+    "lumios_ai_cache_evictions_total",
+    "Generated-content cache removals by namespace and reason (capacity or expired).",
+    ("namespace", "reason"),
+)
+AI_CACHE_ENTRIES = registry.gauge(
+    "lumios_ai_cache_entries",
+    "Entries held by the in-process generated-content cache.",
+)
+AI_CACHE_BYTES = registry.gauge(
+    "lumios_ai_cache_bytes",
+    "Approximate bytes held by the in-process generated-content cache.",
+)
+AI_CACHE_PERSISTENT_LOOKUPS = registry.counter(
+    "lumios_ai_cache_persistent_lookups_total",
+    "Shared (database) generated-content cache lookups by namespace and result (hit, miss or error).",
+    ("namespace", "result"),
+)
+AI_CACHE_PERSISTENT_PRUNED = registry.counter(
+    "lumios_ai_cache_persistent_pruned_total",
+    "Rows pruned from the shared generated-content cache by reason (expired or capacity).",
+    ("reason",),
+)
+AI_CACHE_PERSISTENT_BYTES = registry.gauge(
+    "lumios_ai_cache_persistent_bytes",
+    "Compressed payload bytes in the shared generated-content cache, as of the last prune.",
+)
+AI_SINGLE_FLIGHT = registry.counter(
+    "lumios_ai_single_flight_total",
+    "Cache-missing generations by namespace and outcome: started a provider call, or coalesced onto one in flight.",
+    ("namespace", "outcome"),
+)
+AI_INFLIGHT_GENERATIONS = registry.gauge(
+    "lumios_ai_inflight_generations",
+    "Distinct generations currently in flight in this process.",
+)
+
+
+def instrument_engine(engine):
+    """Track pool checkouts for `engine` (every ORM session goes through one)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        DB_CONNECTION_CHECKOUTS.inc()
+        DB_CONNECTIONS_IN_USE.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, record):
+        DB_CONNECTIONS_IN_USE.dec()
+
+
+def start_multiprocess_if_configured():
+    if settings.METRICS_MULTIPROC_DIR:
+        registry.start_multiprocess(settings.METRICS_MULTIPROC_DIR, settings.METRICS_FLUSH_INTERVAL_S)
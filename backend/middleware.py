@@ -0,0 +1,187 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Core HTTP middleware (pure ASGI).
+
+One pass per request replaces the former add_security_headers, pna_middleware
+and audit_middleware BaseHTTPMiddleware layers: no per-layer task, no response
+stream wrapping, and the static header block is encoded once at startup.
+"""
+import json
+import logging
+import secrets
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+from .query_stats import RequestQueryStats, current_request_stats
+from .audit import AuditPolicy, AuditWriter, audit_policy as default_audit_policy, audit_writer as default_audit_writer
+from .security import SECURITY_RESPONSE_HEADERS
+
+logger = logging.getLogger("lumios")
+
+ATTRIBUTION_HEADERS: Dict[str, str] = {
+    "X-Created-By": "Faizain Murtuza",
+    "X-System-Architecture": "Asynchronous Intelligence-First SMS",
+}
+
+PNA_REQUEST_HEADER = b"access-control-request-private-network"
+PNA_RESPONSE_HEADER = (b"access-control-allow-private-network", b"true")
+
+
+def _encode_headers(headers: Dict[str, str]) -> List[Tuple[bytes, bytes]]:
+    return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+
+
+class CoreHTTPMiddleware:
+    def __init__(
+        self,
+        app,
+        audit_writer: Optional[AuditWriter] = None,
+        audit_policy: Optional[AuditPolicy] = None,
+        static_headers: Optional[Dict[str, str]] = None,
+        expose_query_stats: Optional[bool] = None,
+    ):
+        self.app = app
+        self.audit_writer = audit_writer or default_audit_writer
+        self.audit_policy = audit_policy or default_audit_policy
+        # Query counts in response headers are a development aid only
+        if expose_query_stats is None:
+            expose_query_stats = settings.ENVIRONMENT != "production"
+        self.expose_query_stats = expose_query_stats
+        headers = dict(SECURITY_RESPONSE_HEADERS if static_headers is None else static_headers)
+        headers.update(ATTRIBUTION_HEADERS)
+        self.static_headers = _encode_headers(headers)
+        # endpoint -> route template, so latency metrics are labelled by
+        # "/students/{student_id}" rather than one series per concrete URL
+        self._route_templates: Dict[object, str] = {}
+
+    def route_template(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "path", "<unmatched>")
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "<unmatched>"
+        template = self._route_templates.get(endpoint)
+        if template is None:
+            for candidate in getattr(scope.get("app"), "routes", ()):
+                if getattr(candidate, "endpoint", None) is not None:
+                    self._route_templates.setdefault(candidate.endpoint, candidate.path)
+            template = self._route_templates.setdefault(endpoint, getattr(endpoint, "__name__", "<unmatched>"))
+        return template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = secrets.token_urlsafe(12)
+        started = time.perf_counter()
+        scope.setdefault("state", {})
+
+        wants_pna = False
+        user_agent = b""
+        for name, value in scope.get("headers") or ():
+            if name == PNA_REQUEST_HEADER:
+                wants_pna = value == b"true"
+            elif name == b"user-agent":
+                user_agent = value
+
+        request_id_header = (b"x-request-id", request_id.encode("latin-1"))
+        query_stats = RequestQueryStats()
+        query_stats_token = current_request_stats.set(query_stats)
+        status_code = 500
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                headers = list(message.get("headers") or ())
+                headers.extend(self.static_headers)
+                if wants_pna:
+                    headers.append(PNA_RESPONSE_HEADER)
+                headers.append(request_id_header)
+                headers.append((b"x-response-time-ms", str(int((time.perf_counter() - started) * 1000)).encode("latin-1")))
+                if self.expose_query_stats:
+                    headers.append((b"x-db-queries", str(query_stats.queries).encode("latin-1")))
+                    headers.append((b"x-db-time-ms", f"{query_stats.seconds * 1000:.1f}".encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        method = scope.get("method", "")
+        path = scope.get("path", "")
+        client = scope.get("client")
+        ip = client[0] if client else "127.0.0.1"
+
+        metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+            logger.info(
+                "Request processed",
+                extra={
+                    "request_id": request_id,
+                    "method": method,
+                    "path": path,
+                    "status_code": status_code,
+                    "duration_ms": int((time.perf_counter() - started) * 1000),
+                    "ip": ip,
+                    "creator": "Faizain Murtuza"
+                }
+            )
+        except Exception as e:
+            traceback.print_exc()
+            status_code = 500
+            logger.error(
+                "Request failed",
+                extra={
+                    "request_id": request_id,
+                    "method": method,
+                    "path": path,
+                    "status_code": 500,
+                    "duration_ms": int((time.perf_counter() - started) * 1000),
+                    "error": str(e)
+                }
+            )
+            if response_started:
+                raise
+            body = json.dumps({"detail": "Internal Server Error", "request_id": request_id}).encode("utf-8")
+            await send_wrapper({
+                "type": "http.response.start",
+                "status": 500,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))],
+            })
+            await send({"type": "http.response.body", "body": body})
+        finally:
+            # Reset before auditing so the writer task never inherits this request's stats
+            current_request_stats.reset(query_stats_token)
+            metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+            metrics.HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started, self.route_template(scope), method, f"{status_code // 100}xx"
+            )
+            # Identity was shared on request.state by auth.get_current_user
+            state = scope.get("state") or {}
+            try:
+                sample_rate = self.audit_policy.sample_rate(method, path, status_code)
+                if sample_rate is not None:
+                    self.audit_writer.submit({
+                        "user_id": state.get("user_id"),
+                        "school_id": state.get("school_id"),
+                        "ip": ip,
+                        "method": method,
+                        "path": path,
+                        "status_code": status_code,
+                        "user_agent": user_agent.decode("latin-1")[:500],
+                        "request_id": request_id,
+                        "sample_rate": sample_rate,
+                    })
+            except Exception:
+                pass
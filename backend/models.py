@@ -4,8 +4,8 @@ Created by: Faizain Murtuza
 © 2025 Faizain Murtuza. All Rights Reserved.
 """
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, UniqueConstraint, Index, LargeBinary
+from sqlalchemy.orm import relationship, validates
 from .database import Base
 from datetime import datetime
 
@@ -31,10 +31,26 @@ class User(Base):
     is_suspended = Column(Boolean, default=False)
 
     token_version = Column(Integer, default=0)
+    identity_version = Column(Integer, default=0)  # bumped on identity changes; checked by the identity cache
+    identity_changed_at = Column(DateTime, nullable=True, index=True)  # read by the revocation epoch table
+    # Legacy single-device refresh state; moved into auth_sessions at startup
     refresh_token_hash = Column(String, nullable=True)
     refresh_token_expires_at = Column(DateTime, nullable=True)
 
-    profile = relationship("UserProfile", uselist=False, back_populates="user")
+    # Joined so an identity snapshot (backend/identity_cache.py) is a single query
+    profile = relationship("UserProfile", uselist=False, back_populates="user", lazy="joined")
+
+
+class AuthSession(Base):
+    # One row per signed-in device; /auth/refresh rotates token_hash in place (see backend/auth_sessions.py)
+    __tablename__ = "auth_sessions"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String, nullable=False, unique=True, index=True)
+    device = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 class AuditLog(Base):
@@ -50,6 +66,27 @@ class AuditLog(Base):
     status_code = Column(Integer, nullable=True)
     user_agent = Column(String, nullable=True)
     request_id = Column(String, nullable=True, index=True)
+    sample_rate = Column(Float, nullable=True, default=1.0)  # < 1.0 for sampled reads; weight = 1 / rate
+
+    # Admin listings filter by school and page by (created_at, id): one index walk per page.
+    # AUTOINCREMENT on SQLite: ids of rows moved to month archives must never be handed out again.
+    __table_args__ = (
+        Index("ix_audit_logs_school_created_id", "school_id", "created_at", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class AuditDailyRollup(Base):
+    # Raw audit rows past retention are folded in here (see backend/audit_retention.py)
+    __tablename__ = "audit_daily_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(String, nullable=False, index=True)  # YYYY-MM-DD
+    school_id = Column(String, nullable=False, default="")
+    path = Column(String, nullable=False, default="")
+    status_code = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint("day", "school_id", "path", "status_code", name="uq_audit_rollup_day_school_path_status"),)
 
 
 class UsageCounter(Base):
@@ -117,12 +154,29 @@ class AIRequestLog(Base):
     error_message = Column(Text, nullable=True)
     duration_ms = Column(Integer, nullable=True)
 
+
+class AICacheEntry(Base):
+    # Second tier of the generated-content cache, shared by every worker (see backend/ai_cache.py)
+    __tablename__ = "ai_cache_entries"
+    key_hash = Column(String(64), primary_key=True)  # sha256 of version + normalized key
+    namespace = Column(String, nullable=False, index=True)
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+def normalize_email(value: str):
+    """Login/lookup form of an email: trimmed, lower-cased, None when blank."""
+    return (value or "").strip().lower() or None
+
+
 class UserProfile(Base):
     __tablename__ = "user_profiles"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
     school_id = Column(String, default="default", index=True)
     email = Column(String, nullable=True)
+    email_normalized = Column(String, nullable=True)  # kept in sync with email; used by /login
     phone = Column(String, nullable=True)
     grade_level = Column(Integer, nullable=True)
     class_name = Column(String, nullable=True)
@@ -130,6 +184,14 @@ class UserProfile(Base):
     child_name = Column(String, nullable=True)
     user = relationship("User", back_populates="profile")
 
+    # NULLs never collide, so profiles without an email are unaffected
+    __table_args__ = (Index("ux_user_profiles_email_school", "email_normalized", "school_id", unique=True),)
+
+    @validates("email")
+    def _sync_email_normalized(self, key, value):
+        self.email_normalized = normalize_email(value)
+        return value
+
 class Student(Base):
     __tablename__ = "students"
     id = Column(String, primary_key=True, index=True)
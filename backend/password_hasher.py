@@ -0,0 +1,152 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Bounded executor for password key derivation.
+
+PBKDF2 at 600k iterations costs hundreds of milliseconds of CPU. Run on the
+AnyIO threadpool, a login burst occupies most of the pool's threads and every
+core at once, and every other sync endpoint queues behind it. Derivations go
+to a small process pool instead, so hashing never uses more than
+PASSWORD_HASH_WORKERS cores; the calling thread only waits on the future.
+
+Admission is capped at PASSWORD_HASH_MAX_PENDING derivations (queued plus
+running). Past that, `derive` raises HasherSaturated immediately and the API
+answers 503 with Retry-After, so a storm cannot pile up waiting threads.
+
+A pool whose worker died (OOM kill, segfault) is broken for good: every later
+submit fails. The derivation that found it broken raises HasherUnavailable
+(also a 503, never a failed password check) and the next one gets a new pool.
+The same goes for a pool that refuses work (OSError starting a worker,
+RuntimeError after shutdown). Where a process pool cannot be built at all
+(no /dev/shm for its semaphores, sandboxed or serverless runtimes) the hasher
+falls back to thread mode once and says so in the log.
+
+Modes (PASSWORD_HASH_EXECUTOR): "process" (default), "thread" (same bounds,
+in-process; for platforms without multiprocessing) and "inline" (no pool, no
+bounds; the previous behaviour).
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger("lumios.auth")
+
+# Raised by a pool that cannot take work; BrokenExecutor is a RuntimeError
+POOL_FAILURES = (OSError, RuntimeError, NotImplementedError)
+
+
+class HasherSaturated(Exception):
+    """Too many derivations in flight; retry later."""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Password hashing capacity exhausted")
+        self.retry_after = retry_after
+
+
+class HasherUnavailable(HasherSaturated):
+    """The pool broke under this derivation; it is rebuilt for the next one."""
+
+
+class PasswordHasher:
+    def __init__(self, mode: str = "process", max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        if mode not in ("process", "thread", "inline"):
+            raise ValueError(f"Unknown password hash executor: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.max_workers * 2
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor: Optional[Executor] = None
+        self._executor_pid: Optional[int] = None
+
+    def _get_executor(self) -> Executor:
+        # Created lazily and per process: a forked worker must not reuse its parent's pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                if self.mode == "process":
+                    try:
+                        # spawn: never fork a process that is already running threads
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                        )
+                    except (ImportError,) + POOL_FAILURES as e:
+                        logger.warning(f"Password hashing: no process pool ({e!r}); using threads")
+                        self.mode = "thread"
+                if self.mode == "thread":
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def derive(self, name: str, password: bytes, salt: bytes, iterations: int) -> bytes:
+        """hashlib.pbkdf2_hmac on the pool; raises HasherSaturated when full."""
+        return self.run(hashlib.pbkdf2_hmac, name, password, salt, iterations)
+
+    def run(self, kdf: Callable[..., bytes], *args, **kwargs) -> bytes:
+        """Any picklable KDF (e.g. hashlib.scrypt) on the pool; raises HasherSaturated when full."""
+        if self.mode == "inline":
+            return kdf(*args, **kwargs)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.PASSWORD_HASH_REJECTED.inc()
+                raise HasherSaturated(retry_after=max(1, self._pending // self.max_workers))
+            self._pending += 1
+        metrics.PASSWORD_HASH_PENDING.inc()
+        started = time.perf_counter()
+        executor = None
+        try:
+            try:
+                executor = self._get_executor()
+                future = executor.submit(kdf, *args, **kwargs)
+            except POOL_FAILURES as e:
+                # Only pool trouble: errors from the KDF itself arrive via result()
+                if executor is not None:
+                    self._discard(executor)
+                raise HasherUnavailable() from e
+            try:
+                return future.result()
+            except BrokenExecutor as e:
+                self._discard(executor)
+                raise HasherUnavailable() from e
+        finally:
+            metrics.PASSWORD_HASH_DURATION.observe(time.perf_counter() - started)
+            metrics.PASSWORD_HASH_PENDING.dec()
+            with self._lock:
+                self._pending -= 1
+
+    def _discard(self, executor: Executor):
+        with self._lock:
+            if self._executor is not executor:
+                return  # another caller already replaced it
+            self._executor = None
+        metrics.PASSWORD_HASH_POOL_RESTARTS.inc()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._executor_pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    mode=settings.PASSWORD_HASH_EXECUTOR,
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
@@ -0,0 +1,81 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+On-demand statistical stack sampler.
+
+A sampler thread snapshots `sys._current_frames()` at a fixed interval for a
+bounded duration and counts identical stacks. Output is the collapsed-stack
+format used by flamegraph.pl, speedscope and inferno: one line per stack,
+frames root-first separated by ";", then the sample count.
+
+Only the event loop thread and AnyIO worker threads (where sync endpoints,
+PBKDF2 hashing, sync provider SDK calls and SQLAlchemy sessions run) are
+sampled unless `all_threads` is requested.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+ANYIO_WORKER_PREFIX = "AnyIO worker thread"
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_label(ident: int, names: Dict[int, str], loop_thread: Optional[int]) -> str:
+    if ident == loop_thread:
+        return "event-loop"
+    name = names.get(ident, f"thread-{ident}")
+    return "anyio-worker" if name.startswith(ANYIO_WORKER_PREFIX) else name.replace(";", ":").replace(" ", "_")
+
+
+def sample_stacks(
+    duration: float,
+    interval: float = 0.01,
+    loop_thread: Optional[int] = None,
+    all_threads: bool = False,
+) -> Counter:
+    """Sample for `duration` seconds; returns Counter of collapsed stack -> samples."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        deadline = time.perf_counter() + duration
+        while True:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if not all_threads and ident != loop_thread and not names.get(ident, "").startswith(ANYIO_WORKER_PREFIX):
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_label(frame))
+                    frame = frame.f_back
+                frames.append(_thread_label(ident, names, loop_thread))
+                stacks[";".join(reversed(frames))] += 1
+            if time.perf_counter() >= deadline:
+                return stacks
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,157 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+SQL instrumentation for database.engine.
+
+- Per request: the core middleware opens a RequestQueryStats in a context
+  variable; cursor events add to it, including statements run from the
+  threadpool (Starlette copies the context into it). Non-production responses
+  carry the totals as X-DB-Queries / X-DB-Time-ms.
+- Slow queries: statements over SLOW_QUERY_MS are logged with normalized SQL
+  and the first application frame that issued them.
+- Statement shapes: every statement is folded into a bounded table keyed by
+  its normalized SQL, so developers can list the slowest shapes.
+"""
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+from .config import settings
+
+logger = logging.getLogger("lumios.sql")
+
+_THIS_FILE = os.path.abspath(__file__)
+_BACKEND_DIR = os.path.dirname(_THIS_FILE)
+
+
+class RequestQueryStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+current_request_stats: contextvars.ContextVar[Optional[RequestQueryStats]] = contextvars.ContextVar(
+    "current_request_stats", default=None
+)
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Collapse literals and parameter lists so equivalent statements share one shape."""
+    sql = _STRING.sub("?", statement)
+    sql = _NUMBER.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"%\(\w+\)s|:\w+", "?", sql)
+    sql = _PARAM_LIST.sub("(?, ...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def _call_site() -> str:
+    # Innermost frame from our own code, skipping this module
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if frame.filename.startswith(_BACKEND_DIR) and frame.filename != _THIS_FILE:
+            return f"{os.path.relpath(frame.filename, os.path.dirname(_BACKEND_DIR))}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+class StatementStats:
+    """Bounded per-shape aggregate: count, total, max and the last slow call site."""
+
+    def __init__(self, max_shapes: int = 500):
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, List[Any]] = {}
+
+    def record(self, shape: str, seconds: float, call_site: Optional[str] = None):
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                if len(self._shapes) >= self.max_shapes:
+                    # Evict the cheapest shape; the table exists to find expensive ones
+                    cheapest = min(self._shapes, key=lambda k: self._shapes[k][1])
+                    del self._shapes[cheapest]
+                entry = self._shapes[shape] = [0, 0.0, 0.0, None]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+            if call_site:
+                entry[3] = call_site
+
+    def top(self, n: int = 20, order_by: str = "total") -> List[Dict[str, Any]]:
+        key = {"total": 1, "max": 2, "count": 0}.get(order_by, 1)
+        with self._lock:
+            items = sorted(self._shapes.items(), key=lambda kv: kv[1][key], reverse=True)[:n]
+        return [
+            {
+                "statement": shape,
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total * 1000 / count, 3),
+                "max_ms": round(longest * 1000, 3),
+                "last_slow_call_site": call_site,
+            }
+            for shape, (count, total, longest, call_site) in items
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+
+
+statement_stats = StatementStats(max_shapes=settings.SQL_STATS_MAX_SHAPES)
+
+
+def instrument_engine(engine, slow_query_ms: Optional[float] = None, stats: StatementStats = statement_stats):
+    threshold = (settings.SLOW_QUERY_MS if slow_query_ms is None else slow_query_ms) / 1000.0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        elapsed = time.perf_counter() - started
+
+        request_stats = current_request_stats.get()
+        if request_stats is not None:
+            request_stats.queries += 1
+            request_stats.seconds += elapsed
+
+        shape = normalize_sql(statement)
+        call_site = None
+        if elapsed >= threshold:
+            call_site = _call_site()
+            logger.warning(
+                "Slow query",
+                extra={"duration_ms": int(elapsed * 1000), "statement": shape, "call_site": call_site},
+            )
+        stats.record(shape, elapsed, call_site)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        # after_cursor_execute does not fire for failed statements
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
@@ -0,0 +1,177 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+Leased feature quota.
+
+`usage_counters.count` is the allowance handed out for a (user, feature, day),
+not only the allowance used. A worker reserves a block of it in one atomic
+upsert (never past the daily limit) and then serves calls from memory until
+the block is spent, so most quota-limited calls cost a dict decrement instead
+of a write.
+
+Block sizes come from QUOTA_LEASE_BLOCKS (per plan) and are the accuracy
+bound: a user is never admitted past the limit, but may be refused early by
+up to (block - 1) units held idle in each other worker. Idle leases are
+returned every QUOTA_LEASE_RECONCILE_SECONDS, and all of them on shutdown; a
+crashed worker's remainder stays counted until the day rolls over. Near the
+limit blocks shrink to single units, so the last calls are exact.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import database, metrics, models
+from .config import settings
+
+logger = logging.getLogger("lumios.quota")
+
+Key = Tuple[int, str, str]  # user_id, feature, period
+
+
+def parse_blocks(spec: str) -> Dict[str, int]:
+    """'basic=5,pro=10' -> {'basic': 5, 'pro': 10}"""
+    blocks = {}
+    for item in spec.split(","):
+        if item.strip():
+            plan, _, units = item.partition("=")
+            blocks[plan.strip()] = max(1, int(units))
+    return blocks
+
+
+LEASE_BLOCKS = parse_blocks(settings.QUOTA_LEASE_BLOCKS)
+
+
+def lease_block(plan: str) -> int:
+    """Units a worker reserves at a time for `plan`; plans not listed lease one unit (exact counting)."""
+    return LEASE_BLOCKS.get(plan, 1)
+
+
+def reserve(db: Session, user_id: int, feature: str, period: str, limit: int, amount: int = 1) -> Optional[int]:
+    """
+    Take `amount` units of a daily allowance in one atomic statement:
+    INSERT ... ON CONFLICT DO UPDATE ... WHERE count + amount <= limit
+    RETURNING count. Returns the new count, or None if the units do not fit
+    (the row is left untouched). Same semantics on SQLite and Postgres.
+    """
+    if amount <= 0 or amount > limit:
+        return None
+    table = models.UsageCounter.__table__
+    now = datetime.utcnow()
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(table).values(user_id=user_id, period=period, feature=feature, count=amount, updated_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "period", "feature"],
+        set_={"count": table.c.count + amount, "updated_at": stmt.excluded.updated_at},
+        where=table.c.count + amount <= limit,
+    ).returning(table.c.count)
+    return db.execute(stmt).scalar_one_or_none()
+
+
+def release(conn, key: Key, amount: int) -> int:
+    """Hand `amount` unused units back to the shared counter."""
+    user_id, feature, period = key
+    table = models.UsageCounter.__table__
+    return conn.execute(
+        update(table)
+        .where(
+            table.c.user_id == user_id,
+            table.c.feature == feature,
+            table.c.period == period,
+            table.c.count >= amount,
+        )
+        .values(count=table.c.count - amount, updated_at=datetime.utcnow())
+    ).rowcount or 0
+
+
+class QuotaLeases:
+    """Per-worker leases: key -> [units left, last used (monotonic)]."""
+
+    def __init__(self, idle_seconds: float = 60.0, clock=time.monotonic):
+        self.idle_seconds = idle_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._leases: Dict[Key, List] = {}
+
+    def consume(self, db: Session, user_id: int, feature: str, period: str, limit: int, block: int = 1) -> bool:
+        """Admit one call. Touches the database only when this worker's lease is spent."""
+        key = (user_id, feature, period)
+        now = self._clock()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] > 0:
+                lease[0] -= 1
+                lease[1] = now
+                metrics.QUOTA_LEASE_DECISIONS.inc("lease")
+                return True
+
+        granted = 0
+        for amount in sorted({max(1, min(block, limit)), 1}, reverse=True):
+            if reserve(db, user_id, feature, period, limit, amount) is not None:
+                granted = amount
+                break
+        db.commit()
+        if not granted:
+            metrics.QUOTA_LEASE_DECISIONS.inc("denied")
+            return False
+
+        with self._lock:
+            lease = self._leases.setdefault(key, [0, now])
+            lease[0] += granted - 1
+            lease[1] = now
+        metrics.QUOTA_LEASE_DECISIONS.inc("acquired")
+        return True
+
+    def held(self, key: Key) -> int:
+        with self._lock:
+            lease = self._leases.get(key)
+            return lease[0] if lease is not None else 0
+
+    def reconcile(self, engine=None, idle_seconds: Optional[float] = None) -> int:
+        """Return the unused part of leases idle for `idle_seconds`. Returns units released."""
+        idle_seconds = self.idle_seconds if idle_seconds is None else idle_seconds
+        cutoff = self._clock() - idle_seconds
+        with self._lock:
+            expired = [(key, lease[0]) for key, lease in self._leases.items() if lease[1] <= cutoff]
+            for key, _ in expired:
+                del self._leases[key]
+        unused = [(key, left) for key, left in expired if left > 0]
+        if not unused:
+            return 0
+        released = 0
+        with (engine or database.engine).begin() as conn:
+            for key, left in unused:
+                if release(conn, key, left):
+                    released += left
+        return released
+
+    def release_all(self, engine=None) -> int:
+        """Shutdown: give every unused unit back."""
+        return self.reconcile(engine, idle_seconds=float("-inf"))
+
+    def clear(self):
+        """Forget all leases without releasing them."""
+        with self._lock:
+            self._leases.clear()
+
+    async def run_periodically(self, interval_seconds: float):
+        """Return idle leases every `interval_seconds`, off the event loop."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.reconcile)
+            except Exception as e:
+                logger.error(f"Quota lease reconcile failed: {e}")
+
+
+quota_leases = QuotaLeases(idle_seconds=settings.QUOTA_LEASE_IDLE_SECONDS)
@@ -44,6 +44,18 @@ class Token(BaseModel):
     plan: Optional[str] = None
     school_id: Optional[str] = None
 
+class FeatureEntitlement(BaseModel):
+    allowed: bool
+    reason: Optional[str] = None  # PAID_SUBSCRIPTION_REQUIRED, ROLE_NOT_PERMITTED, PLAN_UPGRADE_REQUIRED
+    daily_limit: Optional[int] = None  # None = not metered
+    remaining: Optional[int] = None  # today's allowance left; None when not metered
+
+class Entitlements(BaseModel):
+    role: Optional[str] = None
+    plan: str
+    subscription_active: bool
+    features: Dict[str, FeatureEntitlement]
+
 class SubscriptionUpdate(BaseModel):
     plan: str # monthly | yearly | enterprise (also accepts legacy plan names)
 
@@ -209,3 +221,7 @@ class AuditLogResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogResponse]
+    next_cursor: Optional[str] = None
@@ -66,19 +66,23 @@ def validate_username(username: str) -> bool:
         return False
     return True
 
+# Security headers applied to every response (precomputed once)
+SECURITY_RESPONSE_HEADERS = {
+    **settings.SECURITY_HEADERS,
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Permissions-Policy": "geolocation=(), microphone=(), camera=()",
+}
+
 # Security headers middleware
+# NOTE: backend.main uses middleware.CoreHTTPMiddleware, which injects the same
+# header block without a BaseHTTPMiddleware layer. Kept for standalone apps.
 async def add_security_headers(request: Request, call_next):
     """Add security headers to all responses"""
     response = await call_next(request)
     
-    # Add security headers
-    for header, value in settings.SECURITY_HEADERS.items():
+    for header, value in SECURITY_RESPONSE_HEADERS.items():
         response.headers[header] = value
     
-    # Additional security headers
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
-    
     return response
 
 # Rate limiting error handler
@@ -0,0 +1,73 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+"""
+In-flight deduplication for identical AI generations.
+
+The first caller for a key starts the work as a task; callers arriving while
+it runs await the same task instead of starting their own, and all of them
+get its result or its exception. Nothing is remembered once the task ends:
+the next caller after a failure starts afresh, and successes are the
+cache's business.
+
+Each caller awaits through asyncio.shield, so one cancelled caller (a client
+disconnect) leaves the others waiting; the shared work is cancelled only when
+its last caller has gone. Deduplication is per process; across workers the
+shared cache tier absorbs repeats once the first result lands.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from . import metrics
+from .ai_cache import namespace_of
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent `do(key, fn)` calls with the same key share one run of `fn`."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        namespace = namespace_of(key)
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+            self.started += 1
+            metrics.AI_SINGLE_FLIGHT.inc(namespace, "started")
+            metrics.AI_INFLIGHT_GENERATIONS.set(len(self._calls))
+        else:
+            self.coalesced += 1
+            metrics.AI_SINGLE_FLIGHT.inc(namespace, "coalesced")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Everyone gave up; callers arriving from now on start afresh
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+            metrics.AI_INFLIGHT_GENERATIONS.set(len(self._calls))
@@ -0,0 +1,27 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import os
+
+# Generated content must not carry over between runs through the dev database
+os.environ.setdefault("AI_CACHE_PERSISTENT", "false")
+
+import pytest
+
+from backend.identity_cache import identity_cache, identity_epochs
+from backend.quota_leases import quota_leases
+
+
+@pytest.fixture(autouse=True)
+def _fresh_identity_cache():
+    # Test modules reuse usernames across separate databases
+    identity_cache.clear()
+    identity_epochs.clear()
+    quota_leases.clear()
+    yield
+    identity_cache.clear()
+    identity_epochs.clear()
+    quota_leases.clear()
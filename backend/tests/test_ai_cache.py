@@ -0,0 +1,219 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from unittest.mock import patch
+
+from backend import metrics, models
+from backend.ai_cache import MemoryCache, PersistentCache, TieredCache, cache_key, estimate_size, parse_ttls
+from backend.ai_providers import STUB_PAYLOADS
+from backend.ai_service import AIService
+from backend.database import Base
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_by_entry_count():
+    cache = MemoryCache(max_entries=2)
+    cache.set("quiz:a", [1])
+    cache.set("quiz:b", [2])
+    assert cache.get("quiz:a") == [1]  # b is now least recently used
+    cache.set("quiz:c", [3])
+
+    assert cache.get("quiz:b") is None
+    assert cache.get("quiz:a") == [1] and cache.get("quiz:c") == [3]
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_byte_budget_is_enforced():
+    value = {"text": "x" * 1000}
+    cache = MemoryCache(max_entries=1000, max_bytes=estimate_size("syllabus:0", value) * 3)
+    for i in range(10):
+        cache.set(f"syllabus:{i}", value)
+
+    stats = cache.get_stats()
+    assert stats["entries"] == 3
+    assert stats["bytes"] <= cache.max_bytes
+    assert [cache.get(f"syllabus:{i}") is not None for i in (6, 7, 8, 9)] == [False, True, True, True]
+
+    cache.set("syllabus:huge", "y" * cache.max_bytes)
+    assert cache.get("syllabus:huge") is None
+
+
+def test_per_namespace_ttl_and_sweep_of_unread_entries():
+    clock = Clock()
+    cache = MemoryCache(default_ttl=100, ttls=parse_ttls("quiz=10, syllabus=1000"), sweep_interval=5, clock=clock)
+    cache.set("quiz:cells", ["q"])
+    cache.set("syllabus:cells", {"weeks": []})
+    cache.set("flashcards:cells", [{"term": "t"}])
+
+    clock.now += 11
+    assert cache.get("quiz:cells") is None
+    assert cache.get("flashcards:cells") is not None
+
+    # Never read again, but swept once due
+    clock.now += 100
+    cache.get("syllabus:cells")
+    stats = cache.get_stats()
+    assert stats["namespaces"] == {"syllabus": 1}
+    assert stats["expired"] == 2
+
+
+def test_shortened_ttl_is_swept_on_time():
+    clock = Clock()
+    cache = MemoryCache(ttls={"quiz": 100}, sweep_interval=1, clock=clock)
+    cache.set("quiz:long", ["a"])
+    cache.set("quiz:short", ["b"], ttl=10)  # e.g. read through with 10 s left
+    cache.set("quiz:shortened-then-reset", ["c"], ttl=5)
+    cache.set("quiz:shortened-then-reset", ["c"])
+
+    clock.now += 11
+    assert cache.sweep() == 1
+    assert cache.get_stats()["namespaces"] == {"quiz": 2}
+    assert cache.get("quiz:long") == ["a"] and cache.get("quiz:shortened-then-reset") == ["c"]
+
+
+def test_overwrite_keeps_accounting_exact():
+    clock = Clock()
+    cache = MemoryCache(default_ttl=10, clock=clock)
+    cache.set("quiz:a", "short")
+    cache.set("quiz:a", "a much longer value")
+    assert cache.get_stats()["bytes"] == estimate_size("quiz:a", "a much longer value")
+
+    clock.now += 5
+    cache.set("quiz:a", "refreshed")  # restarts its TTL
+    clock.now += 6
+    assert cache.get("quiz:a") == "refreshed"
+    assert cache.sweep(clock.now + 10) == 1
+    assert cache.get_stats()["bytes"] == 0
+
+
+def test_stats_reach_metrics_endpoint():
+    cache = MemoryCache()
+    cache.set("quiz:m", [1])
+    cache.get("quiz:m")
+    cache.get("quiz:missing")
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    text = metrics.registry.render()
+    assert 'lumios_ai_cache_lookups_total{namespace="quiz",result="hit"}' in text
+    assert f"lumios_ai_cache_bytes {stats['bytes']}" in text
+
+
+class UtcClock:
+    def __init__(self):
+        self.now = datetime(2025, 1, 1)
+
+    def __call__(self):
+        return self.now
+
+
+def _engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _worker(engine) -> AIService:
+    """A fresh AIService (own memory tier, stub provider) sharing `engine`, as another worker would."""
+    with patch('google.generativeai.configure'):
+        service = AIService(openai_api_key="k", gemini_api_key="k", providers="stub")
+    service.cache = TieredCache(MemoryCache(), PersistentCache(engine=engine))
+    return service
+
+
+def test_cache_key_normalizes_request():
+    assert cache_key("quiz", "  Photo\tSynthesis ", 5) == cache_key("quiz", "photo synthesis", "5")
+    assert cache_key("quiz", "a:b", "c") != cache_key("quiz", "a", "b:c")
+
+
+def test_persistent_roundtrip_ttl_and_version():
+    engine, clock = _engine(), UtcClock()
+    store = PersistentCache(engine=engine, ttls={"quiz": 60}, clock=clock)
+    value = [{"q": "Why " * 200, "options": ["A", "B", "C", "D"], "correct": 1}]
+    assert store.set("quiz:cells", value)
+
+    with engine.connect() as conn:
+        row = conn.execute(models.AICacheEntry.__table__.select()).one()
+    assert row.namespace == "quiz" and row.size_bytes == len(row.payload) < 200
+
+    clock.now += timedelta(seconds=20)
+    assert store.get("quiz:cells") == (value, 40.0)
+    assert PersistentCache(engine=engine, version="2", clock=clock).get("quiz:cells") is None
+    clock.now += timedelta(seconds=41)
+    assert store.get("quiz:cells") is None
+
+    assert not PersistentCache(engine=engine, max_entry_bytes=10).set("quiz:big", value)
+
+
+def test_prune_drops_expired_then_soonest_expiring_over_budget():
+    engine, clock = _engine(), UtcClock()
+    store = PersistentCache(engine=engine, default_ttl=100, batch_size=2, clock=clock)
+    for i in range(6):
+        store.set(f"quiz:{i}", {"n": i})
+        clock.now += timedelta(seconds=10)
+    store.ttls = {"quiz": 1}
+    store.set("quiz:short", {"n": -1})
+
+    clock.now += timedelta(seconds=2)
+    with engine.connect() as conn:
+        sizes = [r.size_bytes for r in conn.execute(models.AICacheEntry.__table__.select())]
+    store.max_bytes = sum(sizes[:3])
+    assert store.prune() == 4  # quiz:short expired, quiz:0..2 over budget
+
+    assert [store.get(f"quiz:{i}") is not None for i in range(6)] == [False] * 3 + [True] * 3
+
+
+@pytest.mark.asyncio
+async def test_hits_are_shared_across_workers():
+    engine = _engine()
+    first, second = _worker(engine), _worker(engine)
+
+    quiz = await first.generate_quiz("Cells", count=3)
+    assert await second.generate_quiz("  cells ", count=3) == quiz
+    assert (first.metrics["stub_requests"], second.metrics["stub_requests"]) == (1, 0)
+
+    # Promoted into the second worker's memory tier: no database round trip next time
+    second.cache.persistent = PersistentCache(engine=create_engine("sqlite://"))
+    assert await second.generate_quiz("Cells", count=3) == quiz
+    assert second.metrics["stub_requests"] == 0
+
+
+@pytest.mark.asyncio
+async def test_unreachable_shared_tier_only_costs_the_second_tier():
+    service = _worker(create_engine("sqlite://"))  # no ai_cache_entries table
+    cards = await service.generate_flashcards("Cells", count=2)
+    assert await service.generate_flashcards("Cells", count=2) == cards
+    assert service.metrics["stub_requests"] == 1
+    assert 'lumios_ai_cache_persistent_lookups_total{namespace="flashcards",result="error"}' in metrics.registry.render()
+
+
+@pytest.mark.asyncio
+async def test_unparseable_generation_is_not_cached(monkeypatch):
+    engine = _engine()
+    service = _worker(engine)
+    monkeypatch.setitem(STUB_PAYLOADS, "quiz", lambda p: "Sorry, here is your quiz: [{q: oops")
+
+    assert await service.generate_quiz("Cells", count=3) == []
+    assert service.cache.memory.get(cache_key("quiz", "Cells", 3)) is None
+    with engine.connect() as conn:
+        assert conn.execute(models.AICacheEntry.__table__.select()).first() is None
+
+    # The next request tries the provider again rather than replaying the failure
+    monkeypatch.undo()
+    assert len(await service.generate_quiz("Cells", count=3)) == 3
+    assert service.metrics["stub_requests"] == 1
@@ -0,0 +1,97 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import statistics
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from backend.ai_providers import AIRequest, ProviderError, StubProvider
+from backend.ai_service import AIService
+
+
+def _service(providers: str) -> AIService:
+    with patch('google.generativeai.configure'):
+        return AIService(openai_api_key="test_openai_key", gemini_api_key="test_gemini_key", providers=providers)
+
+
+@pytest.mark.asyncio
+async def test_stub_payloads_match_each_schema():
+    service = _service("stub")
+
+    syllabus = await service.generate_syllabus("Fractions", "5", weeks=3)
+    assert [w["week"] for w in syllabus["weeks"]] == [1, 2, 3]
+    assert {"title", "objectives", "concepts", "activity"} <= set(syllabus["weeks"][0])
+
+    quiz = await service.generate_quiz("Fractions", count=7)
+    assert len(quiz) == 7
+    assert all(len(q["options"]) == 4 and 0 <= q["correct"] <= 3 for q in quiz)
+
+    cards = await service.generate_flashcards("Fractions", count=3)
+    assert [set(c) for c in cards] == [{"term", "def"}] * 3
+
+    grading = await service.process_vision_grading(b"image", "image/png", reference_data={"total_marks": 40})
+    assert grading["score"] <= 40
+    assert {"student", "feedback", "annotations", "insights", "reference_match_score"} <= set(grading)
+
+    solved = await service.solve_educational_problem("Mathematics", "Addition", "easy", "3", "10 + 10")
+    assert solved["subject"] == "Mathematics"
+    assert solved["steps"] and solved["final_answer"]
+
+    assert "Ada" in await service.generate_report({"name": "Ada"})
+    assert (await service.generate_landing_chat_response("Hi"))["model"] == "stub"
+    assert service.metrics["stub_requests"] == 7
+
+
+@pytest.mark.asyncio
+async def test_stub_is_deterministic_per_seed():
+    a = StubProvider(latency_ms=100, distribution="lognormal", seed=7)
+    b = StubProvider(latency_ms=100, distribution="lognormal", seed=7)
+    assert [a.latency() for _ in range(20)] == [b.latency() for _ in range(20)]
+
+    request = AIRequest(task="quiz", prompt="p", params={"topic": "Cells", "count": 2})
+    assert (await a.generate_json(request)).data == (await b.generate_json(request)).data
+
+
+@pytest.mark.parametrize("distribution", ["fixed", "uniform", "exponential", "lognormal"])
+def test_stub_latency_mean(distribution):
+    stub = StubProvider(latency_ms=200, distribution=distribution, spread=0.5, seed=1)
+    assert statistics.mean(stub.latency() for _ in range(5000)) == pytest.approx(0.2, rel=0.1)
+
+
+@pytest.mark.asyncio
+async def test_stub_error_rate_and_tokens():
+    stub = StubProvider(error_rate=1.0, completion_tokens=50)
+    with pytest.raises(ProviderError):
+        await stub.generate_text(AIRequest(task="chat", prompt="x" * 40))
+
+    completion = await StubProvider(completion_tokens=50).generate_text(AIRequest(task="chat", prompt="x" * 40))
+    assert (completion.prompt_tokens, completion.completion_tokens, completion.tokens) == (10, 50, 60)
+
+
+@pytest.mark.asyncio
+async def test_failing_provider_falls_through_in_order():
+    service = _service("gemini,stub")
+    service.vision_model = MagicMock(generate_content_async=AsyncMock(side_effect=RuntimeError("down")))
+
+    assert "stub" in await service.chat("hello")
+    service.vision_model.generate_content_async.assert_awaited_once()
+    assert service.metrics["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_all_providers_failing_returns_fallback():
+    service = _service("stub")
+    service.stub.error_rate = 1.0
+    assert await service.generate_quiz("Cells") == []
+    assert "error" in await service.solve_educational_problem("Physics", "Motion", "easy", "9", "v = d / t")
+
+
+def test_unknown_provider_or_distribution_rejected():
+    with pytest.raises(ValueError):
+        _service("gemini,llama")
+    with pytest.raises(ValueError):
+        StubProvider(distribution="pareto")
@@ -4,8 +4,18 @@ Created by: Faizain Murtuza
 © 2025 Faizain Murtuza. All Rights Reserved.
 """
 
+import asyncio
+import time
+
+import httpx
 import pytest
 from unittest.mock import MagicMock, patch, AsyncMock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import database, main
+from backend.ai_providers import AIRequest
 from backend.ai_service import AIService
 
 @pytest.fixture
@@ -25,12 +35,13 @@ async def test_generate_landing_chat_response_openai(ai_service):
     mock_response.choices = [MagicMock(message=MagicMock(content="Hello from NOVA"))]
     
     # Correct way to mock the nested call
-    ai_service.client.chat.completions.create = MagicMock(return_value=mock_response)
+    ai_service.client.chat.completions.create = AsyncMock(return_value=mock_response)
 
     response_data = await ai_service.generate_landing_chat_response("Hi")
     assert "response" in response_data
     assert response_data["response"] == "Hello from NOVA"
     ai_service.client.chat.completions.create.assert_called_once()
+    assert ai_service.client.chat.completions.create.call_args.kwargs["timeout"] == ai_service.request_timeout
 
 @pytest.mark.asyncio
 async def test_generate_syllabus_gemini(ai_service):
@@ -66,3 +77,78 @@ def test_parse_json(ai_service):
     text_no_markdown = "{\"key\": \"value\"}"
     result = ai_service._parse_json(text_no_markdown)
     assert result == {"key": "value"}
+
+
+@pytest.mark.asyncio
+async def test_gemini_call_times_out(ai_service):
+    async def hang(contents):
+        await asyncio.sleep(10)
+
+    ai_service.vision_model = MagicMock(generate_content_async=hang)
+    ai_service.gemini.timeout = 0.05
+    with pytest.raises(asyncio.TimeoutError):
+        await ai_service.gemini.generate_text(AIRequest(task="chat", prompt="prompt"))
+
+
+@pytest.mark.asyncio
+async def test_cancellation_propagates_without_fallback(ai_service):
+    started = asyncio.Event()
+
+    async def hang(**kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    ai_service.client.chat.completions.create = hang
+    ai_service.vision_model = MagicMock(generate_content_async=AsyncMock())
+    task = asyncio.create_task(ai_service.generate_landing_chat_response("Hi"))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    ai_service.vision_model.generate_content_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unrelated_endpoint_unaffected_by_inflight_ai_calls(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Session = sessionmaker(bind=engine)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    inflight = []
+    release = asyncio.Event()
+
+    async def slow_completion(**kwargs):
+        inflight.append(1)
+        await release.wait()
+        return MagicMock(choices=[MagicMock(message=MagicMock(content="ok"))])
+
+    client = MagicMock()
+    client.chat.completions.create = slow_completion
+    monkeypatch.setattr(main.ai_service, "client", client)
+    monkeypatch.setattr(main.limiter, "enabled", False)
+    monkeypatch.setitem(main.app.dependency_overrides, database.get_db, get_db)
+    monkeypatch.setitem(main.app.dependency_overrides, main.get_db, get_db)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        calls = [asyncio.create_task(client.post("/ai/landing-chat", json={"prompt": f"q{i}"})) for i in range(50)]
+        while len(inflight) < 50:
+            await asyncio.sleep(0.01)
+
+        probe = []
+        for _ in range(10):
+            started = time.perf_counter()
+            assert (await client.get("/health")).status_code == 200
+            probe.append(time.perf_counter() - started)
+
+        release.set()
+        responses = await asyncio.gather(*calls)
+
+    # All 50 completions were pending while the probe ran
+    assert all(r.json()["response"] == "ok" for r in responses)
+    assert max(probe) < 0.5
@@ -0,0 +1,297 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend import audit_retention, auth, database, models
+from backend.audit import AuditPolicy, AuditWriter, audit_writer
+from backend.database import Base
+from backend.main import app, get_db as main_get_db
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def _row(i: int):
+    return {"method": "GET", "path": f"/items/{i}", "status_code": 200, "request_id": f"req-{i}"}
+
+
+def _count() -> int:
+    db = TestingSessionLocal()
+    try:
+        return db.query(models.AuditLog).count()
+    finally:
+        db.close()
+
+
+@pytest.mark.asyncio
+async def test_size_triggered_flush_writes_in_batches():
+    writer = AuditWriter(session_factory=TestingSessionLocal, batch_size=10, flush_interval=5.0)
+    for i in range(25):
+        assert writer.submit(_row(i)) is True
+
+    # Two full batches go out without waiting for the interval
+    for _ in range(50):
+        if writer.metrics["written"] >= 20:
+            break
+        await asyncio.sleep(0.01)
+    assert writer.metrics["written"] == 20
+    assert writer.metrics["batches"] == 2
+
+    await writer.stop()
+    assert _count() == 25
+    assert writer.get_stats()["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_time_triggered_flush():
+    writer = AuditWriter(session_factory=TestingSessionLocal, batch_size=100, flush_interval=0.05)
+    writer.submit(_row(1))
+    await asyncio.sleep(0.2)
+    assert _count() == 1
+    assert writer.metrics["batches"] == 1
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_overflow_drop_newest_counts_drops():
+    writer = AuditWriter(session_factory=TestingSessionLocal, max_queue=3, batch_size=10, flush_interval=5.0)
+    results = [writer.submit(_row(i)) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert writer.metrics["dropped"] == 2
+
+    await writer.stop()
+    db = TestingSessionLocal()
+    paths = sorted(r.path for r in db.query(models.AuditLog).all())
+    db.close()
+    assert paths == ["/items/0", "/items/1", "/items/2"]
+
+
+@pytest.mark.asyncio
+async def test_overflow_drop_oldest_keeps_latest():
+    writer = AuditWriter(session_factory=TestingSessionLocal, max_queue=3, batch_size=10, flush_interval=5.0,
+                         overflow_policy="drop_oldest")
+    for i in range(5):
+        assert writer.submit(_row(i)) is True
+    assert writer.metrics["dropped"] == 2
+
+    await writer.stop()
+    db = TestingSessionLocal()
+    paths = sorted(r.path for r in db.query(models.AuditLog).all())
+    db.close()
+    assert paths == ["/items/2", "/items/3", "/items/4"]
+
+
+def test_rows_survive_event_loop_teardown():
+    writer = AuditWriter(session_factory=TestingSessionLocal, batch_size=100, flush_interval=5.0)
+
+    async def one_request(i):
+        writer.submit(_row(i))
+
+    # Each asyncio.run() mimics a per-invocation loop (serverless, TestClient)
+    asyncio.run(one_request(1))
+    asyncio.run(one_request(2))
+    assert _count() == 2
+
+
+def test_invalid_overflow_policy_rejected():
+    with pytest.raises(ValueError):
+        AuditWriter(overflow_policy="block")
+
+
+def test_audit_middleware_adds_no_identity_queries(monkeypatch):
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    # Route the audit writer's batches to the test database as well
+    monkeypatch.setattr(database, "SessionLocal", TestingSessionLocal)
+
+    db = TestingSessionLocal()
+    user = models.User(username="audited", password_hash="x", full_name="Audited", role="teacher", school_id="school_a")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    token = auth.create_access_token(data={"sub": "audited", "role": "teacher", "school_id": "school_a", "tv": 0})
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        response = TestClient(app).get("/teacher/classes", headers={"Authorization": f"Bearer {token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        event.remove(database.engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    user_selects = [s for s in statements if s.lstrip().upper().startswith("SELECT") and "FROM users" in s]
+    # Exactly one user lookup: the one get_current_user needs; auditing adds none
+    assert len(user_selects) == 1
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 2  # user + teacher_classes
+    inserts = [s for s in statements if s.lstrip().startswith("INSERT INTO audit_logs")]
+    assert len(inserts) == 1
+
+    db = TestingSessionLocal()
+    row = db.query(models.AuditLog).filter(models.AuditLog.path == "/teacher/classes").one()
+    db.close()
+    assert row.user_id == user_id
+    assert row.school_id == "school_a"
+
+
+@pytest.fixture
+def admin_client(monkeypatch):
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    # Keep the listing requests themselves out of the rows under test
+    monkeypatch.setattr(audit_writer, "submit", lambda row: True)
+
+    db = TestingSessionLocal()
+    db.add(models.User(
+        username="auditor", password_hash="x", full_name="Auditor", role="admin", school_id="school_a",
+        subscription_status="active", subscription_expiry=datetime.utcnow() + timedelta(days=30), plan="enterprise",
+    ))
+    db.commit()
+    db.close()
+    token = auth.create_access_token(data={"sub": "auditor", "role": "admin", "school_id": "school_a", "tv": 0})
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client
+
+
+def _seed_logs(rows):
+    db = TestingSessionLocal()
+    db.execute(insert(models.AuditLog), rows)
+    db.commit()
+    db.close()
+
+
+def test_audit_logs_keyset_pagination_walks_every_row_once(admin_client):
+    base = datetime(2026, 10, 1)
+    # Pairs of rows share a timestamp so the id tie-breaker matters
+    _seed_logs([
+        {"school_id": "school_a", "path": f"/p/{i}", "status_code": 200, "created_at": base + timedelta(minutes=i // 2)}
+        for i in range(25)
+    ] + [{"school_id": "school_b", "path": "/other", "status_code": 200, "created_at": base}])
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        page = admin_client.get("/system/audit-logs", params=params).json()
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 25
+    assert len(set(seen)) == 25
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_audit_logs_filters(admin_client):
+    base = datetime(2026, 10, 1)
+    _seed_logs([
+        {"school_id": "school_a", "user_id": 7, "path": "/system/settings", "status_code": 200, "created_at": base},
+        {"school_id": "school_a", "user_id": 7, "path": "/system/audit-logs", "status_code": 403, "created_at": base + timedelta(hours=1)},
+        {"school_id": "school_a", "user_id": 8, "path": "/students", "status_code": 404, "created_at": base + timedelta(hours=2)},
+        {"school_id": "school_a", "user_id": 8, "path": "/system_x", "status_code": 500, "created_at": base + timedelta(hours=3)},
+    ])
+
+    def paths(**params):
+        response = admin_client.get("/system/audit-logs", params=params)
+        assert response.status_code == 200
+        return [item["path"] for item in response.json()["items"]]
+
+    assert paths(user_id=7) == ["/system/audit-logs", "/system/settings"]
+    # "_" is matched literally, not as a LIKE wildcard
+    assert paths(path_prefix="/system/") == ["/system/audit-logs", "/system/settings"]
+    assert paths(status_class="4xx") == ["/students", "/system/audit-logs"]
+    assert paths(since=(base + timedelta(hours=1)).isoformat(), until=(base + timedelta(hours=3)).isoformat()) == [
+        "/students", "/system/audit-logs",
+    ]
+
+
+def test_audit_logs_read_archived_months(admin_client):
+    months = [datetime(2026, 8, 20), datetime(2026, 9, 20), datetime(2026, 10, 10)]
+    _seed_logs([
+        {"school_id": "school_a", "path": f"/p/{day:%m}/{i}", "status_code": 200, "created_at": day + timedelta(hours=i)}
+        for day in months for i in range(2)
+    ])
+    audit_retention.compact(engine, now=datetime(2026, 10, 16), hot_days=10, retention_days=365)
+    try:
+        assert _count() == 2  # August and September are archived
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            page = admin_client.get("/system/audit-logs", params=params).json()
+            seen.extend(item["path"] for item in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == ["/p/10/1", "/p/10/0", "/p/09/1", "/p/09/0", "/p/08/1", "/p/08/0"]
+
+        september = admin_client.get("/system/audit-logs", params={"since": "2026-09-01T00:00:00", "until": "2026-10-01T00:00:00"})
+        assert [item["path"] for item in september.json()["items"]] == ["/p/09/1", "/p/09/0"]
+    finally:
+        with engine.begin() as conn:
+            for name in audit_retention.list_buckets(conn).values():
+                conn.exec_driver_sql(f"DROP TABLE {name}")
+
+
+def test_audit_logs_rejects_bad_cursor_and_status_class(admin_client):
+    assert admin_client.get("/system/audit-logs", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert admin_client.get("/system/audit-logs", params={"status_class": "6xx"}).status_code == 422
+
+
+def test_audit_policy_route_classes():
+    policy = AuditPolicy(read_sample_rate=0.25, skip_paths=["/health", "/@vite/*"], rng=lambda: 0.5)
+
+    # Preflights and liveness are never logged, even when they fail
+    assert policy.sample_rate("OPTIONS", "/students", 200) is None
+    assert policy.sample_rate("GET", "/health", 503) is None
+    assert policy.sample_rate("GET", "/@vite/client", 200) is None
+    # Writes and errors are always logged at full weight
+    assert policy.sample_rate("POST", "/students", 201) == 1.0
+    assert policy.sample_rate("GET", "/students", 403) == 1.0
+    # Successful reads are sampled; rng 0.5 >= 0.25 drops this one
+    assert policy.sample_rate("GET", "/students", 200) is None
+    assert AuditPolicy(read_sample_rate=0.25, rng=lambda: 0.1).sample_rate("GET", "/students", 200) == 0.25
+    assert AuditPolicy(read_sample_rate=0).sample_rate("HEAD", "/students", 200) is None
@@ -0,0 +1,171 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend import audit_retention, models
+from backend.database import Base
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime(2026, 10, 16, 12, 0, 0)
+
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        for name in audit_retention.list_buckets(conn).values():
+            conn.exec_driver_sql(f"DROP TABLE {name}")
+
+
+def _insert(*rows):
+    with engine.begin() as conn:
+        conn.execute(insert(models.AuditLog), [
+            {"method": "GET", "school_id": "school_a", "status_code": 200, **row} for row in rows
+        ])
+
+
+def _rollups():
+    db = TestingSessionLocal()
+    try:
+        return {
+            (r.day, r.school_id, r.path, r.status_code): r.count
+            for r in db.query(models.AuditDailyRollup).all()
+        }
+    finally:
+        db.close()
+
+
+def _hot_count():
+    db = TestingSessionLocal()
+    try:
+        return db.query(models.AuditLog).count()
+    finally:
+        db.close()
+
+
+def test_hot_rows_move_into_month_buckets():
+    _insert(
+        {"path": "/a", "created_at": NOW - timedelta(days=1)},
+        {"path": "/b", "created_at": datetime(2026, 8, 20)},
+        {"path": "/c", "created_at": datetime(2026, 7, 3)},
+    )
+    stats = audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=365)
+
+    assert stats == {"archived": 2, "rolled_up": 0, "buckets_dropped": 0}
+    assert _hot_count() == 1
+    with engine.connect() as conn:
+        buckets = audit_retention.list_buckets(conn)
+        assert sorted(buckets.values()) == ["audit_logs_202607", "audit_logs_202608"]
+        assert conn.exec_driver_sql("SELECT path FROM audit_logs_202608").scalars().all() == ["/b"]
+
+
+def test_expired_buckets_roll_up_and_drop():
+    _insert(
+        {"path": "/a", "created_at": datetime(2026, 6, 1, 9)},
+        {"path": "/a", "created_at": datetime(2026, 6, 1, 17)},
+        {"path": "/a", "status_code": 403, "created_at": datetime(2026, 6, 1, 18)},
+        {"path": "/b", "school_id": None, "created_at": datetime(2026, 6, 2)},
+        {"path": "/recent", "created_at": NOW - timedelta(days=40)},
+    )
+    stats = audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=90)
+
+    assert stats["archived"] == 5
+    assert stats["rolled_up"] == 4
+    assert stats["buckets_dropped"] == 1
+    assert _rollups() == {
+        ("2026-06-01", "school_a", "/a", 200): 2,
+        ("2026-06-01", "school_a", "/a", 403): 1,
+        ("2026-06-02", "", "/b", 200): 1,
+    }
+    with engine.connect() as conn:
+        # September is still inside retention and keeps its raw rows
+        assert list(audit_retention.list_buckets(conn).values()) == ["audit_logs_202609"]
+
+
+def test_compaction_is_incremental_and_idempotent():
+    _insert({"path": "/a", "created_at": datetime(2026, 5, 10)})
+    audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=90)
+    assert audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=90) == {
+        "archived": 0, "rolled_up": 0, "buckets_dropped": 0,
+    }
+
+    # A later run folds a second bucket for the same key into the existing count
+    _insert({"path": "/a", "created_at": datetime(2026, 5, 10, 23)})
+    audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=90)
+    assert _rollups() == {("2026-05-10", "school_a", "/a", 200): 2}
+    assert _hot_count() == 0
+
+
+def test_archived_ids_are_never_reused():
+    _insert({"path": "/old", "created_at": datetime(2026, 7, 3)})
+    audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=365)
+    assert _hot_count() == 0
+    _insert({"path": "/new", "created_at": NOW})
+    with engine.connect() as conn:
+        archived = conn.exec_driver_sql("SELECT id FROM audit_logs_202607").scalar()
+        assert conn.exec_driver_sql("SELECT id FROM audit_logs").scalar() > archived
+
+
+def test_table_without_autoincrement_keeps_its_highest_id():
+    # Databases created before audit_logs declared AUTOINCREMENT
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE audit_logs")
+        conn.exec_driver_sql(
+            "CREATE TABLE audit_logs (id INTEGER PRIMARY KEY, created_at DATETIME, user_id INTEGER, "
+            "school_id VARCHAR, ip VARCHAR, method VARCHAR, path VARCHAR, status_code INTEGER, "
+            "user_agent VARCHAR, request_id VARCHAR, sample_rate FLOAT)"
+        )
+    _insert({"path": "/a", "created_at": datetime(2026, 7, 3)}, {"path": "/b", "created_at": datetime(2026, 7, 4)})
+
+    assert audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=365)["archived"] == 1
+    _insert({"path": "/new", "created_at": NOW})
+    with engine.connect() as conn:
+        ids = conn.exec_driver_sql("SELECT id FROM audit_logs UNION ALL SELECT id FROM audit_logs_202607").scalars().all()
+    assert sorted(ids) == [1, 2, 3]
+
+    # Once a newer row exists, the held-back one follows on the next pass
+    assert audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=365)["archived"] == 1
+
+
+def test_audit_listing_uses_school_created_index():
+    with engine.connect() as conn:
+        indexes = {ix["name"]: ix["column_names"] for ix in inspect(conn).get_indexes("audit_logs")}
+        assert indexes["ix_audit_logs_school_created_id"] == ["school_id", "created_at", "id"]
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM audit_logs WHERE school_id = 'x' ORDER BY created_at DESC LIMIT 50"
+        ).all()
+    detail = " ".join(str(row[-1]) for row in plan)
+    assert "ix_audit_logs_school_created_id" in detail
+    assert "TEMP B-TREE" not in detail
+
+
+def test_rollups_reweight_sampled_rows():
+    _insert(
+        {"path": "/a", "sample_rate": 0.25, "created_at": datetime(2026, 5, 10, 1)},
+        {"path": "/a", "sample_rate": 0.25, "created_at": datetime(2026, 5, 10, 2)},
+        {"path": "/a", "status_code": 500, "sample_rate": 1.0, "created_at": datetime(2026, 5, 10, 3)},
+        {"path": "/a", "status_code": 500, "sample_rate": None, "created_at": datetime(2026, 5, 10, 4)},
+    )
+    stats = audit_retention.compact(engine, now=NOW, hot_days=31, retention_days=90)
+
+    assert stats["rolled_up"] == 4
+    assert _rollups() == {
+        ("2026-05-10", "school_a", "/a", 200): 8,
+        ("2026-05-10", "school_a", "/a", 500): 2,
+    }
@@ -56,3 +56,87 @@ def test_is_demo_user():
     assert auth.is_demo_user(models.User(role="demo")) is True
     assert auth.is_demo_user(models.User(subscription_status="demo")) is True
     assert auth.is_demo_user(models.User(role="student", subscription_status="active")) is False
+
+def test_password_hash_is_self_describing():
+    hashed = auth.get_password_hash("pw")
+    _, algorithm, params, salt_hex, digest_hex = hashed.split("$")
+    assert algorithm == "pbkdf2-sha256"
+    assert params == f"i={settings.PASSWORD_PBKDF2_ITERATIONS}"
+    assert len(bytes.fromhex(salt_hex)) == 16 and len(bytes.fromhex(digest_hex)) == 32
+    assert auth.password_needs_rehash(hashed) is False
+
+def test_legacy_hash_verifies_and_needs_rehash():
+    import hashlib
+    salt = bytes(range(16))
+    legacy = f"{salt.hex()}:{hashlib.pbkdf2_hmac('sha256', b'old-pw', salt, 600000).hex()}"
+    assert auth.verify_password("old-pw", legacy) is True
+    assert auth.verify_password("other", legacy) is False
+    assert auth.password_needs_rehash(legacy) is True
+
+def test_scrypt_and_cost_changes(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_ALGORITHM", "scrypt")
+    monkeypatch.setattr(settings, "PASSWORD_SCRYPT_N", 1024)
+    hashed = auth.get_password_hash("pw")
+    assert hashed.startswith("$scrypt$n=1024,r=8,p=1$")
+    assert auth.verify_password("pw", hashed) is True
+    assert auth.password_needs_rehash(hashed) is False
+
+    # Raising the cost marks existing hashes as outdated; they still verify
+    monkeypatch.setattr(settings, "PASSWORD_SCRYPT_N", 2048)
+    assert auth.password_needs_rehash(hashed) is True
+    assert auth.verify_password("pw", hashed) is True
+
+def test_unknown_hash_algorithm_is_refused(monkeypatch):
+    for bad in ("scyrpt", "argon2", "pbkdf2_sha256"):
+        monkeypatch.setattr(settings, "PASSWORD_HASH_ALGORITHM", bad)
+        with pytest.raises(ValueError, match="PASSWORD_HASH_ALGORITHM"):
+            auth.get_password_hash("pw")
+        with pytest.raises(ValueError):
+            auth.password_needs_rehash("$pbkdf2-sha256$i=600000$00$00")
+
+def test_malformed_hashes_are_rejected():
+    for bad in ("", "nonsense", "$pbkdf2-sha256$i=x$00$00", "$md5$i=1$00$00", None):
+        assert auth.verify_password("pw", bad) is False
+
+def test_claims_cache_verifies_each_token_once(monkeypatch):
+    calls = []
+    real_decode = auth.jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *a, **kw: calls.append(1) or real_decode(*a, **kw))
+    cache = auth.ClaimsCache(max_entries=2)
+    token = auth.create_access_token({"sub": "cached", "role": "student"})
+
+    first = cache.decode(token)
+    assert cache.decode(token) is first
+    assert first["sub"] == "cached"
+    assert len(calls) == 1
+    with pytest.raises(TypeError):
+        first["role"] = "admin"
+
+    for sub in ("b", "c"):
+        cache.decode(auth.create_access_token({"sub": sub}))
+    cache.decode(token)  # evicted by the two newer tokens
+    assert len(calls) == 4
+
+def test_claims_cache_rechecks_expired_tokens(monkeypatch):
+    calls = []
+    real_decode = auth.jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *a, **kw: calls.append(1) or real_decode(*a, **kw))
+    now = [datetime.utcnow().timestamp()]
+    cache = auth.ClaimsCache(clock=lambda: now[0])
+    token = auth.create_access_token({"sub": "short"}, expires_delta=timedelta(seconds=5))
+    cache.decode(token)
+    cache.decode(token)
+    assert len(calls) == 1
+
+    # Past exp the entry is ignored and jose gets to reject the token
+    now[0] += 60
+    cache.decode(token)
+    assert len(calls) == 2
+
+def test_claims_cache_rejects_bad_tokens():
+    cache = auth.ClaimsCache()
+    with pytest.raises(auth.JWTError):
+        cache.decode("not-a-token")
+    forged = jwt.encode({"sub": "x", "aud": "lumios-frontend", "iss": "lumios-api"}, "wrong-key", algorithm=settings.ALGORITHM)
+    with pytest.raises(auth.JWTError):
+        cache.decode(forged)
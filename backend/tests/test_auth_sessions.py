@@ -0,0 +1,160 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import auth, auth_sessions, database, models
+from backend.database import Base
+from backend.identity_cache import identity_epochs
+from backend.main import app, get_db as main_get_db, limiter
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    monkeypatch.setattr(limiter, "enabled", False)
+    db = TestingSessionLocal()
+    db.add(models.User(username="multi", password_hash=auth.get_password_hash("secret123"),
+                       role="teacher", subscription_status="active", plan="pro"))
+    db.commit()
+    db.close()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def statements():
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(" ".join(statement.split()))
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield recorded
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def _login(device):
+    client = TestClient(app, headers={"User-Agent": device})
+    response = client.post("/login", json={"username": "multi", "password": "secret123"})
+    assert response.status_code == 200
+    return response.cookies["refresh_token"]
+
+
+def _refresh(token):
+    return TestClient(app).post("/auth/refresh", json={"refresh_token": token})
+
+
+def test_second_device_keeps_the_first_signed_in():
+    laptop = _login("laptop")
+    phone = _login("phone")
+
+    assert _refresh(laptop).status_code == 200
+    assert _refresh(phone).status_code == 200
+
+    db = TestingSessionLocal()
+    assert sorted(s.device for s in db.query(models.AuthSession).all()) == ["laptop", "phone"]
+    db.close()
+
+
+def test_login_and_refresh_do_not_write_users(statements):
+    token = _login("laptop")
+    assert _refresh(token).status_code == 200
+    assert not [s for s in statements if s.startswith("UPDATE users")]
+
+
+def test_refresh_rotates_with_one_statement(statements):
+    token = _login("laptop")
+    token = _refresh(token).cookies["refresh_token"]  # warms the identity cache
+    db = TestingSessionLocal()
+    identity_epochs.refresh_if_due(db)
+    db.close()
+
+    statements.clear()
+    response = _refresh(token)
+    assert response.status_code == 200
+    assert [s.split(" SET ")[0] for s in statements] == ["UPDATE auth_sessions"]
+    assert "auth_sessions.token_hash = ?" in statements[0]
+
+
+def test_rotated_token_cannot_be_replayed():
+    token = _login("laptop")
+    assert _refresh(token).status_code == 200
+    assert _refresh(token).status_code == 401
+
+
+def test_expired_session_is_rejected():
+    token = _login("laptop")
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE auth_sessions SET expires_at = :past"), {"past": datetime.utcnow() - timedelta(seconds=1)})
+    assert _refresh(token).status_code == 401
+
+
+def test_logout_revokes_every_device():
+    laptop = _login("laptop")
+    phone = _login("phone")
+    access = _refresh(laptop).json()["access_token"]
+
+    assert TestClient(app).post("/auth/logout", headers={"Authorization": f"Bearer {access}"}).status_code == 200
+    assert _refresh(phone).status_code == 401
+    db = TestingSessionLocal()
+    assert db.query(models.AuthSession).count() == 0
+    db.close()
+
+
+def test_sweeper_deletes_expired_sessions_in_batches(statements):
+    now = datetime.utcnow()
+    db = TestingSessionLocal()
+    for i in range(7):
+        db.add(models.AuthSession(user_id=1, token_hash=f"old{i}", expires_at=now - timedelta(days=1)))
+    db.add(models.AuthSession(user_id=1, token_hash="live", expires_at=now + timedelta(days=1)))
+    db.commit()
+    db.close()
+
+    statements.clear()
+    assert auth_sessions.sweep_expired(engine, now=now, batch_size=3) == 7
+    assert len([s for s in statements if s.startswith("DELETE")]) == 3
+
+    db = TestingSessionLocal()
+    assert [s.token_hash for s in db.query(models.AuthSession).all()] == ["live"]
+    db.close()
+
+
+def test_legacy_refresh_token_survives_migration():
+    legacy = auth.create_refresh_token_jwt(models.User(username="multi", token_version=0))
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE users SET refresh_token_hash = :h, refresh_token_expires_at = :exp"),
+            {"h": auth._hash_refresh_token(legacy), "exp": datetime.utcnow() + timedelta(days=1)},
+        )
+        assert auth_sessions.migrate_legacy_refresh_tokens(conn) == 1
+        assert auth_sessions.migrate_legacy_refresh_tokens(conn) == 0
+        assert conn.execute(text("SELECT refresh_token_hash FROM users")).scalar() is None
+
+    assert _refresh(legacy).status_code == 200
@@ -0,0 +1,124 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import auth, database, models
+from backend.database import Base
+from backend.main import app, get_db as main_get_db
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def _user(role, status="active", plan="pro", expiry_days=30):
+    return SimpleNamespace(
+        id=None, role=role, plan=plan, subscription_status=status, is_suspended=False,
+        subscription_expiry=datetime.utcnow() + timedelta(days=expiry_days),
+    )
+
+
+def _outcome(guard, user):
+    try:
+        guard(user=user, db=MagicMock())
+    except HTTPException as exc:
+        detail = exc.detail
+        return detail["code"] if isinstance(detail, dict) else "ROLE_NOT_PERMITTED"
+    return None
+
+
+def test_matrix_agrees_with_every_guard():
+    users = [
+        _user(role, status, plan, expiry)
+        for role in ("admin", "teacher", "student", "parent", "librarian", "developer", "demo")
+        for status, plan, expiry in (
+            ("active", "basic", 30), ("active", "pro", 30), ("active", "enterprise", 30), ("active", "free", 30),
+            ("active", "pro", -1), ("expired", "pro", 30), ("demo", None, 30),
+        )
+    ]
+    for guard in auth._feature_guards:
+        for user in users:
+            decision = auth.entitlement_matrix.decide(guard.feature, guard.allowed_roles, user)
+            assert decision.code == _outcome(guard, user), (guard.feature, guard.allowed_roles, user)
+
+
+def test_matrix_is_immutable():
+    table = auth.entitlement_matrix.for_user(_user("teacher"))
+    with pytest.raises(TypeError):
+        table["ai_chat"] = auth.Decision(False, None, None)
+    with pytest.raises(AttributeError):
+        table["ai_chat"].allowed = False
+
+
+def test_feature_is_allowed_when_any_of_its_guards_admits():
+    # students_read has a teacher+admin read guard and an admin-only write guard
+    assert auth.entitlement_matrix.for_user(_user("teacher"))["students_read"].allowed is True
+    assert auth.entitlement_matrix.for_user(_user("parent"))["students_read"].code == "ROLE_NOT_PERMITTED"
+
+
+def _token(plan="basic", status="active"):
+    db = TestingSessionLocal()
+    user = models.User(username="ent", password_hash="x", role="teacher", plan=plan, subscription_status=status,
+                       subscription_expiry=datetime.utcnow() + timedelta(days=30))
+    db.add(user)
+    db.commit()
+    db.add(models.UsageCounter(user_id=user.id, period=datetime.utcnow().strftime("%Y-%m-%d"), feature="ai_chat", count=12))
+    db.commit()
+    token = auth.create_access_token(data={"sub": "ent", "tv": 0, "ent": auth.entitlement_claims(user)})
+    db.close()
+    return token
+
+
+def test_entitlements_endpoint_reports_features_and_remaining_quota():
+    response = TestClient(app).get("/me/entitlements", headers={"Authorization": f"Bearer {_token()}"})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, max-age=60"
+    body = response.json()
+    assert (body["plan"], body["subscription_active"]) == ("basic", True)
+
+    features = body["features"]
+    assert features["ai_chat"] == {"allowed": True, "reason": None, "daily_limit": 50, "remaining": 38}
+    assert features["library_read"] == {"allowed": True, "reason": None, "daily_limit": None, "remaining": None}
+    assert features["ai_finance"]["reason"] == "PLAN_UPGRADE_REQUIRED"
+    assert features["nexus_upload"]["reason"] == "ROLE_NOT_PERMITTED"  # roles are checked before plan
+    assert set(features) >= set(auth.FEATURE_MIN_PLAN)
+
+
+def test_entitlements_for_an_inactive_subscription():
+    response = TestClient(app).get("/me/entitlements", headers={"Authorization": f"Bearer {_token(status='expired')}"})
+    features = response.json()["features"]
+    assert {f for f, e in features.items() if e["allowed"]} == set(auth.FREE_TIER_FEATURES)
+    assert features["library_read"]["reason"] == "PAID_SUBSCRIPTION_REQUIRED"
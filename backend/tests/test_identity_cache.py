@@ -0,0 +1,284 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import dataclasses
+import time
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import auth, database, models
+from backend.database import Base
+from backend.identity_cache import EpochTable, IdentityCache, UserSnapshot, identity_cache, identity_epochs
+from backend.main import app, get_db as main_get_db
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def user_token():
+    db = TestingSessionLocal()
+    user = models.User(
+        username="cached", password_hash="x", full_name="Cached", role="teacher",
+        school_id="school_a", subscription_status="active", plan="pro",
+    )
+    db.add(user)
+    db.flush()
+    db.add(models.UserProfile(user_id=user.id, school_id="school_a", email="cached@example.com"))
+    db.commit()
+    db.close()
+    return auth.create_access_token(data={"sub": "cached", "role": "teacher", "tv": 0})
+
+
+@pytest.fixture
+def user_selects():
+    statements = []
+    # The epoch refresh runs once per interval per worker, not per request
+    db = TestingSessionLocal()
+    identity_epochs.refresh_if_due(db)
+    db.close()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def _status(token):
+    return TestClient(app).get("/subscription/status", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_repeat_requests_issue_no_user_queries(user_token, user_selects):
+    assert _status(user_token).status_code == 200
+    assert len(user_selects) == 1  # user + profile in one statement
+
+    for _ in range(3):
+        assert _status(user_token).json()["role"] == "teacher"
+    assert len(user_selects) == 1
+
+
+def test_snapshot_is_immutable_and_carries_profile(user_token):
+    _status(user_token)
+    snapshot = identity_cache.get(("cached", 0))
+    assert isinstance(snapshot, UserSnapshot)
+    assert snapshot.profile.email == "cached@example.com"
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        snapshot.role = "admin"
+
+
+def test_commit_in_this_worker_evicts_and_bumps_version(user_token):
+    assert _status(user_token).json()["status"] == "active"
+
+    db = TestingSessionLocal()
+    user = db.query(models.User).filter(models.User.username == "cached").one()
+    user.subscription_status = "expired"
+    db.commit()
+    assert user.identity_version == 1
+    db.close()
+
+    assert _status(user_token).json()["status"] == "expired"
+
+
+def test_unrelated_column_change_keeps_snapshot(user_token, user_selects):
+    _status(user_token)
+    db = TestingSessionLocal()
+    user = db.query(models.User).filter(models.User.username == "cached").one()
+    user.refresh_token_hash = "rotated"
+    db.commit()
+    assert user.identity_version == 0
+    db.close()
+
+    user_selects.clear()
+    _status(user_token)
+    assert user_selects == []
+
+
+def test_profile_change_evicts_owner(user_token):
+    _status(user_token)
+    db = TestingSessionLocal()
+    profile = db.query(models.UserProfile).one()
+    profile.email = "new@example.com"
+    db.commit()
+    db.close()
+
+    assert identity_cache.get(("cached", 0)) is None
+
+
+def test_other_worker_change_is_seen_after_epoch_refresh(user_token, user_selects, monkeypatch):
+    _status(user_token)
+    # A write from another process: no local eviction, only the version bump
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE users SET is_suspended = 1, identity_version = identity_version + 1, identity_changed_at = :now"),
+            {"now": datetime.utcnow()},
+        )
+
+    assert _status(user_token).status_code == 200  # until this worker's next epoch refresh
+
+    monkeypatch.setattr(identity_epochs, "refresh_interval", 0.0)
+    assert _status(user_token).status_code == 403
+
+
+def test_logout_revokes_cached_token(user_token):
+    assert _status(user_token).status_code == 200
+    client = TestClient(app)
+    assert client.post("/auth/logout", headers={"Authorization": f"Bearer {user_token}"}).status_code == 200
+    assert _status(user_token).status_code == 401
+
+
+def test_cache_is_bounded_and_expires():
+    now = [0.0]
+    cache = IdentityCache(max_entries=2, ttl=10.0, clock=lambda: now[0])
+
+    def snap(name, uid):
+        return UserSnapshot(
+            id=uid, username=name, full_name=None, role="student", school_id="default",
+            subscription_status="active", subscription_expiry=None, plan=None,
+            is_suspended=False, token_version=0, identity_version=0,
+        )
+
+    cache.put(("a", 0), snap("a", 1))
+    cache.put(("b", 0), snap("b", 2))
+    cache.get(("a", 0))
+    cache.put(("c", 0), snap("c", 3))
+    assert cache.get(("b", 0)) is None  # least recently used went first
+    assert cache.get(("a", 0)) == snap("a", 1)
+
+    now[0] = 11.0
+    assert cache.get(("c", 0)) is None
+
+    cache.invalidate(user_id=1)
+    assert cache.get(("a", 0)) is None
+
+
+def test_epoch_table_reads_only_recent_changes_and_forgets_old_ones(user_token, user_selects):
+    now = [time.time()]
+    epochs = EpochTable(refresh_interval=5.0, window=60.0, clock=lambda: now[0])
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE users SET identity_version = 4, identity_changed_at = :at"),
+                     {"at": datetime.utcfromtimestamp(now[0] - 10)})
+    db = TestingSessionLocal()
+    try:
+        user_selects.clear()
+        assert epochs.refresh_if_due(db) is True
+        assert epochs.refresh_if_due(db) is False  # inside the interval
+        assert len(user_selects) == 1 and "identity_changed_at" in user_selects[0]
+        uid = db.query(models.User.id).scalar()
+        assert epochs.current(uid) == 4
+
+        epochs.note(uid, 3)  # never goes backwards
+        assert epochs.current(uid) == 4
+
+        now[0] += 120
+        epochs.refresh_if_due(db)
+        assert epochs.current(uid) == 0  # older than any token it could revoke
+    finally:
+        db.close()
+
+
+def test_optional_user_shares_the_cached_identity(user_token, user_selects):
+    db = TestingSessionLocal()
+    try:
+        user = auth.get_current_user_optional(token=user_token, db=db)
+        assert user is not None and user.username == "cached"
+        assert auth.get_current_user_optional(token=user_token, db=db) is user
+        assert auth.get_current_user_optional(token="garbage", db=db) is None
+    finally:
+        db.close()
+    assert len(user_selects) == 1
+
+
+def _entitled_token():
+    db = TestingSessionLocal()
+    user = db.query(models.User).filter(models.User.username == "cached").one()
+    token = auth.create_access_token(data={"sub": "cached", "tv": 0, "ent": auth.entitlement_claims(user)})
+    db.close()
+    return token
+
+
+def test_entitlement_claims_authorize_without_user_queries(user_token, user_selects):
+    token = _entitled_token()
+    user_selects.clear()
+    # Cold identity cache: the guard decides from the token alone
+    assert TestClient(app).get("/library/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert user_selects == []
+    assert identity_cache.stats()["entries"] == 0
+
+
+def test_stale_entitlements_fall_back_to_the_database(user_token, monkeypatch):
+    token = _entitled_token()
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE users SET plan = 'free', identity_version = identity_version + 1, identity_changed_at = :now"),
+            {"now": datetime.utcnow()},
+        )
+    monkeypatch.setattr(identity_epochs, "refresh_interval", 0.0)
+
+    response = TestClient(app).get("/library/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+    assert response.json()["detail"]["code"] == "PLAN_UPGRADE_REQUIRED"
+
+
+def test_principal_is_read_only_and_loads_the_rest_lazily(user_token, user_selects):
+    token = _entitled_token()
+    db = TestingSessionLocal()
+    try:
+        user_selects.clear()
+        principal = auth.get_current_principal(token=token, db=db)
+        assert isinstance(principal, auth.Principal)
+        assert (principal.role, principal.plan, principal.school_id) == ("teacher", "pro", "school_a")
+        assert user_selects == []
+        with pytest.raises(AttributeError):
+            principal.role = "admin"
+
+        assert principal.profile.email == "cached@example.com"
+        assert len(user_selects) == 1
+    finally:
+        db.close()
+
+
+def test_suspension_in_this_worker_revokes_entitlements_immediately(user_token):
+    token = _entitled_token()
+    client = TestClient(app)
+    assert client.get("/library/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    db = TestingSessionLocal()
+    db.query(models.User).filter(models.User.username == "cached").one().is_suspended = True
+    db.commit()
+    db.close()
+
+    response = client.get("/library/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Account suspended"
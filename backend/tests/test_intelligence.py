@@ -50,7 +50,7 @@ async def test_contextual_reasoning_chat(ai_service):
     if not ai_service.client:
         pytest.skip("OpenAI client not initialized")
 
-    with patch.object(ai_service.client.chat.completions, 'create') as mock_create:
+    with patch.object(ai_service.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
         # Mock the OpenAI response
         mock_response = MagicMock()
         mock_response.choices = [MagicMock()]
@@ -0,0 +1,113 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import auth, database, models
+from backend.database import Base
+from backend.main import app, backfill_profile_emails, get_db as main_get_db, limiter
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    monkeypatch.setattr(limiter, "enabled", False)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def _add_user(username, email=None, school_id="default"):
+    db = TestingSessionLocal()
+    user = models.User(username=username, password_hash=auth.get_password_hash("secret123"),
+                       role="teacher", school_id=school_id, subscription_status="active")
+    db.add(user)
+    db.flush()
+    if email is not None:
+        db.add(models.UserProfile(user_id=user.id, school_id=school_id, email=email))
+    db.commit()
+    db.close()
+
+
+def _login(identifier):
+    return TestClient(app).post("/login", json={"username": identifier, "password": "secret123"})
+
+
+def test_login_by_email_is_case_insensitive_and_one_query():
+    _add_user("teacher_a", email="Teacher.A@School.org")
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lstrip().upper())
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = _login("  teacher.a@SCHOOL.org ")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    # Everything up to the auth session INSERT is identifier resolution
+    resolution = statements[:next(i for i, s in enumerate(statements) if s.startswith(("INSERT", "UPDATE")))]
+    assert len(resolution) == 1
+    assert "EMAIL_NORMALIZED" in resolution[0]
+
+
+def test_exact_username_wins_over_email():
+    _add_user("first", email="second@school.org")
+    _add_user("second@school.org")
+    response = _login("second@school.org")
+    assert response.status_code == 200
+    assert response.json()["name"] == "second@school.org"
+
+
+def test_unknown_identifier_is_rejected():
+    _add_user("someone", email="someone@school.org")
+    assert _login("nobody@school.org").status_code == 401
+
+
+def test_email_unique_per_school():
+    _add_user("a1", email="shared@school.org", school_id="school_a")
+    _add_user("b1", email="SHARED@school.org", school_id="school_b")
+    with pytest.raises(Exception):
+        _add_user("a2", email="Shared@School.org", school_id="school_a")
+
+
+def test_backfill_skips_duplicates_and_is_idempotent():
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ux_user_profiles_email_school"))
+        for i, (email, school) in enumerate([
+            ("Dup@School.org", "s1"), ("dup@school.org ", "s1"), ("dup@school.org", "s2"), ("", "s1"), (None, "s1"),
+        ], start=1):
+            conn.execute(text(
+                "INSERT INTO user_profiles (id, user_id, school_id, email) VALUES (:id, :id, :school, :email)"
+            ), {"id": i, "school": school, "email": email})
+
+        assert backfill_profile_emails(conn) == 2
+        assert backfill_profile_emails(conn) == 0
+        rows = conn.execute(text("SELECT id, email_normalized FROM user_profiles ORDER BY id")).all()
+
+    assert rows == [(1, "dup@school.org"), (2, None), (3, "dup@school.org"), (4, None), (5, None)]
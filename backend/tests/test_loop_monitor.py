@@ -0,0 +1,80 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from backend import main, metrics
+from backend.loop_monitor import LoopMonitor
+
+
+def blocking_handler():
+    time.sleep(0.3)
+
+
+def test_stall_is_attributed_to_blocking_frame():
+    monitor = LoopMonitor(threshold=0.05, interval=0.01)
+    stalls_before = metrics.EVENT_LOOP_STALLS.snapshot()
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_handler()
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(scenario())
+    report = monitor.report()
+
+    assert report["stalls"] == 1
+    assert report["max_stall_ms"] >= 250
+    offender = report["offenders"][0]
+    assert "test_loop_monitor.py" in offender["frame"]
+    assert "blocking_handler" in offender["frame"]
+    assert "blocking_handler" in offender["stack"]
+    assert metrics.EVENT_LOOP_STALLS.snapshot() != stalls_before
+
+
+def test_monitor_restarts_on_a_new_loop():
+    monitor = LoopMonitor(threshold=0.05, interval=0.01)
+
+    async def block_once():
+        monitor.start()
+        await asyncio.sleep(0.03)
+        blocking_handler()
+        await asyncio.sleep(0.03)
+        monitor.stop()
+
+    # Each asyncio.run() mimics a TestClient / serverless loop lifecycle
+    asyncio.run(block_once())
+    asyncio.run(block_once())
+    assert monitor.report()["stalls"] == 2
+
+
+def test_no_stalls_when_loop_stays_responsive():
+    monitor = LoopMonitor(threshold=0.1, interval=0.01)
+
+    async def scenario():
+        monitor.start()
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+        monitor.stop()
+
+    asyncio.run(scenario())
+    assert monitor.report()["stalls"] == 0
+
+
+def test_loop_stalls_endpoint_is_developer_only(monkeypatch):
+    client = TestClient(main.app)
+    assert client.get("/internal/system/loop-stalls").status_code == 401
+
+    monkeypatch.setitem(main.app.dependency_overrides, main.dev_guard, lambda: SimpleNamespace(username="dev"))
+    response = client.get("/internal/system/loop-stalls")
+    assert client.delete("/internal/system/loop-stalls").json() == {"status": "ok"}
+    assert response.status_code == 200
+    assert set(response.json()) == {"threshold_ms", "stalls", "max_stall_ms", "offenders"}
@@ -0,0 +1,144 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import json
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from backend import metrics
+from backend.config import settings
+from backend.main import app as main_app
+from backend.middleware import CoreHTTPMiddleware
+
+
+class NullWriter:
+    def submit(self, row):
+        return True
+
+
+def _sample(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{prefix} not found in exposition")
+
+
+def test_histogram_exposition_is_cumulative():
+    registry = metrics.Registry()
+    hist = registry.histogram("t_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, "/a")
+    text = registry.render()
+
+    assert "# TYPE t_seconds histogram" in text
+    assert 't_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{route="/a",le="1"} 3' in text
+    assert 't_seconds_bucket{route="/a",le="+Inf"} 4' in text
+    assert 't_seconds_count{route="/a"} 4' in text
+    assert _sample(text, 't_seconds_sum{route="/a"}') == 4.05
+
+
+def test_multiprocess_merge_sums_workers_and_drops_dead_gauges(tmp_path):
+    registry = metrics.Registry()
+    counter = registry.counter("t_total", "Test.", ("kind",))
+    gauge = registry.gauge("t_in_flight", "Test.")
+    counter.inc("x", amount=2)
+    gauge.inc()
+    registry._multiproc_dir = str(tmp_path)
+
+    # A worker that has exited: its counter still counts, its gauge does not
+    dead_pid = 2 ** 22 + 12345
+    (tmp_path / f"{dead_pid}.json").write_text('{"t_total": [[["x"], 5.0]], "t_in_flight": [[[], 7.0]]}')
+
+    text = registry.render()
+    assert 't_total{kind="x"} 7' in text
+    assert "t_in_flight 1" in text
+    assert (tmp_path / f"{registry.worker_id()}.json").exists()
+
+
+def test_exited_workers_are_compacted_without_losing_counts(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    registry = metrics.Registry()
+    counter = registry.counter("t_total", "Test.")
+    registry.gauge("t_in_flight", "Test.")
+    counter.inc(amount=1)
+    registry._multiproc_dir = str(tmp_path)
+    own = registry.worker_id()
+
+    # Same PID, two lifetimes: the earlier one exited (no lock held), the later one is alive
+    pid = 2 ** 22 + 777
+    (tmp_path / f"{pid}-aaaa.json").write_text('{"t_total": [[[], 5.0]], "t_in_flight": [[[], 9.0]]}')
+    (tmp_path / f"{pid}-bbbb.json").write_text('{"t_total": [[[], 3.0]], "t_in_flight": [[[], 2.0]]}')
+    live_lock = open(tmp_path / f"{pid}-bbbb.lock", "w")
+    fcntl.flock(live_lock, fcntl.LOCK_EX)
+    try:
+        text = registry.render()
+        assert "t_total 9" in text  # 1 + 5 + 3
+        assert "t_in_flight 2" in text
+        assert sorted(p.name for p in tmp_path.glob("*.json")) == sorted(["archive.json", f"{own}.json", f"{pid}-bbbb.json"])
+
+        # An archived id whose file survived a crashed compaction is not counted twice
+        (tmp_path / f"{pid}-aaaa.json").write_text('{"t_total": [[[], 5.0]]}')
+        archive = json.loads((tmp_path / "archive.json").read_text())
+        archive["merged"] = [f"{pid}-aaaa"]
+        (tmp_path / "archive.json").write_text(json.dumps(archive))
+        assert "t_total 9" in registry.render()
+        assert not (tmp_path / f"{pid}-aaaa.json").exists()
+    finally:
+        live_lock.close()
+
+    # The later worker exits too: its counts move into the archive, its gauge goes
+    text = registry.render()
+    assert "t_total 9" in text
+    assert not [line for line in text.splitlines() if line.startswith("t_in_flight")]
+    assert sorted(p.name for p in tmp_path.glob("*.json")) == sorted(["archive.json", f"{own}.json"])
+
+
+def test_middleware_labels_latency_by_route_template():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(CoreHTTPMiddleware, audit_writer=NullWriter())
+    client = TestClient(app)
+    prefix = 'lumios_http_request_duration_seconds_count{route="/items/{item_id}",method="GET",status_class="2xx"}'
+    before = metrics.registry.render()
+    baseline = _sample(before, prefix) if prefix in before else 0
+
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nope")
+
+    text = metrics.registry.render()
+    assert _sample(text, prefix) == baseline + 2
+    assert 'route="<unmatched>",method="GET",status_class="4xx"' in text
+    assert "lumios_http_requests_in_flight 0" in text
+
+
+def test_metrics_endpoint_requires_token(monkeypatch):
+    client = TestClient(main_app)
+    # No token configured: only loopback clients in development, and the test client is not one
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    monkeypatch.setattr(settings, "ENVIRONMENT", "development")
+    response = client.get("/metrics")
+    assert response.status_code == 403 and "loopback" in response.text
+
+    # Anywhere else a token is required, whoever asks (behind a same-host proxy, everyone is loopback)
+    monkeypatch.setattr(settings, "ENVIRONMENT", "production")
+    response = client.get("/metrics")
+    assert response.status_code == 403 and "METRICS_TOKEN" in response.text
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-me")
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-me"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE lumios_db_connection_checkouts_total counter" in response.text
+    assert "# TYPE lumios_ai_provider_call_duration_seconds histogram" in response.text
@@ -0,0 +1,110 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+from backend.main import app as main_app
+from backend.audit import AuditPolicy
+from backend.middleware import CoreHTTPMiddleware
+from backend.security import SECURITY_RESPONSE_HEADERS
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.rows = []
+
+    def submit(self, row):
+        self.rows.append(row)
+        return True
+
+
+@pytest.fixture
+def writer():
+    return RecordingWriter()
+
+
+@pytest.fixture
+def client(writer):
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok():
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("kaboom")
+
+    app.add_middleware(CORSMiddleware, allow_origins=frozenset(["http://allowed.test"]),
+                       allow_methods=["*"], allow_headers=["*"])
+    app.add_middleware(CoreHTTPMiddleware, audit_writer=writer, audit_policy=AuditPolicy(skip_paths=["/health"]))
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def test_static_and_per_request_headers(client):
+    response = client.get("/ok")
+    assert response.status_code == 200
+    for name, value in SECURITY_RESPONSE_HEADERS.items():
+        assert response.headers[name] == value
+    assert response.headers["X-Created-By"] == "Faizain Murtuza"
+    assert response.headers["X-Request-ID"]
+    assert int(response.headers["X-Response-Time-ms"]) >= 0
+    assert "Access-Control-Allow-Private-Network" not in response.headers
+
+
+def test_private_network_access_on_cors_preflight(client):
+    response = client.options(
+        "/ok",
+        headers={
+            "Origin": "http://allowed.test",
+            "Access-Control-Request-Method": "GET",
+            "Access-Control-Request-Private-Network": "true",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["Access-Control-Allow-Origin"] == "http://allowed.test"
+    assert response.headers["Access-Control-Allow-Private-Network"] == "true"
+
+
+def test_unhandled_error_returns_500_with_request_id(client, writer):
+    response = client.get("/boom")
+    assert response.status_code == 500
+    body = response.json()
+    assert body["detail"] == "Internal Server Error"
+    assert body["request_id"] == response.headers["X-Request-ID"]
+    assert writer.rows[-1]["status_code"] == 500
+
+
+def test_audit_row_submitted_per_request(client, writer):
+    response = client.get("/ok", headers={"User-Agent": "pytest-agent"})
+    row = writer.rows[-1]
+    assert row["path"] == "/ok"
+    assert row["method"] == "GET"
+    assert row["status_code"] == 200
+    assert row["user_agent"] == "pytest-agent"
+    assert row["request_id"] == response.headers["X-Request-ID"]
+    assert row["user_id"] is None
+    assert row["sample_rate"] == 1.0
+
+
+def test_preflight_and_liveness_are_not_audited(client, writer):
+    client.options("/ok", headers={"Origin": "http://allowed.test", "Access-Control-Request-Method": "GET"})
+    response = client.get("/health")
+    assert response.headers["X-Request-ID"]
+    assert writer.rows == []
+
+
+def test_main_app_registers_cors_once():
+    cors_layers = [m for m in main_app.user_middleware if m.cls is CORSMiddleware]
+    assert len(cors_layers) == 1
+    # Our single core layer wraps everything, CORS included
+    assert main_app.user_middleware[0].cls is CoreHTTPMiddleware
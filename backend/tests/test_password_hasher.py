@@ -0,0 +1,197 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import auth, database, models, password_hasher
+from backend.database import Base
+from backend.main import app, get_db as main_get_db, limiter
+from backend.password_hasher import HasherSaturated, HasherUnavailable, PasswordHasher
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_process_pool_matches_hashlib():
+    hasher = PasswordHasher(mode="process", max_workers=1)
+    try:
+        assert hasher.derive("sha256", b"pw", b"salt", 1000) == hashlib.pbkdf2_hmac("sha256", b"pw", b"salt", 1000)
+        assert hasher.pending == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_crashed_worker_rebuilds_pool():
+    hasher = PasswordHasher(mode="process", max_workers=1)
+    try:
+        with pytest.raises(HasherUnavailable):
+            hasher.run(os._exit, 1)
+        assert hasher.derive("sha256", b"pw", b"salt", 1000) == hashlib.pbkdf2_hmac("sha256", b"pw", b"salt", 1000)
+        assert hasher.pending == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_broken_pool_is_busy_not_a_wrong_password(monkeypatch):
+    class BrokenPool:
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("worker died")
+
+        def shutdown(self, **kwargs):
+            pass
+
+    hasher = PasswordHasher(mode="thread", max_workers=1)
+    hasher._executor, hasher._executor_pid = BrokenPool(), os.getpid()
+    monkeypatch.setattr(auth, "password_hasher", hasher)
+    stored = f"$pbkdf2-sha256$i=1000${'00' * 16}${hashlib.pbkdf2_hmac('sha256', b'pw', bytes(16), 1000).hex()}"
+    try:
+        with pytest.raises(HasherUnavailable):
+            auth.verify_password("pw", stored)
+        assert auth.verify_password("pw", stored) is True  # fresh pool
+    finally:
+        hasher.shutdown()
+
+
+def test_pool_that_refuses_work_is_busy_not_a_wrong_password(monkeypatch):
+    class ClosedPool:
+        def submit(self, *args, **kwargs):
+            raise OSError(38, "Function not implemented")
+
+        def shutdown(self, **kwargs):
+            pass
+
+    hasher = PasswordHasher(mode="thread", max_workers=1)
+    hasher._executor, hasher._executor_pid = ClosedPool(), os.getpid()
+    monkeypatch.setattr(auth, "password_hasher", hasher)
+    stored = f"$pbkdf2-sha256$i=1000${'00' * 16}${hashlib.pbkdf2_hmac('sha256', b'pw', bytes(16), 1000).hex()}"
+    try:
+        with pytest.raises(HasherUnavailable):
+            auth.verify_password("pw", stored)
+        assert hasher.pending == 0
+        assert auth.verify_password("pw", stored) is True
+    finally:
+        hasher.shutdown()
+
+
+def test_no_process_pool_falls_back_to_threads(monkeypatch):
+    def no_semaphores(*args, **kwargs):
+        raise OSError(38, "Function not implemented")
+
+    monkeypatch.setattr(password_hasher, "ProcessPoolExecutor", no_semaphores)
+    hasher = PasswordHasher(mode="process", max_workers=1)
+    try:
+        assert hasher.derive("sha256", b"pw", b"salt", 1000) == hashlib.pbkdf2_hmac("sha256", b"pw", b"salt", 1000)
+        assert hasher.mode == "thread"
+    finally:
+        hasher.shutdown()
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        PasswordHasher(mode="gpu")
+
+
+def test_saturated_pool_sheds_immediately():
+    hasher = PasswordHasher(mode="thread", max_workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+    original = hasher._get_executor
+
+    class Blocking:
+        def submit(self, fn, *args):
+            started.set()
+            release.wait(5)
+            return original().submit(fn, *args)
+
+    hasher._get_executor = lambda: Blocking()
+    worker = threading.Thread(target=hasher.derive, args=("sha256", b"a", b"b", 1))
+    worker.start()
+    assert started.wait(5)
+    try:
+        with pytest.raises(HasherSaturated):
+            hasher.derive("sha256", b"a", b"b", 1)
+    finally:
+        release.set()
+        worker.join()
+        hasher.shutdown()
+    assert hasher.pending == 0
+
+
+def test_login_returns_503_with_retry_after_when_saturated(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add(models.User(username="busy", password_hash="00:00", role="teacher"))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    class Saturated:
+        def derive(self, *args):
+            raise HasherSaturated(retry_after=3)
+
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    monkeypatch.setattr(auth, "password_hasher", Saturated())
+    monkeypatch.setattr(limiter, "enabled", False)
+    try:
+        response = TestClient(app).post("/login", json={"username": "busy", "password": "whatever"})
+    finally:
+        Base.metadata.drop_all(bind=engine)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert response.json()["detail"]["code"] == "AUTH_BUSY"
+
+
+def test_login_upgrades_legacy_hash(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    salt = bytes(16)
+    legacy = f"{salt.hex()}:{hashlib.pbkdf2_hmac('sha256', b'secret123', salt, 600000).hex()}"
+    db = TestingSessionLocal()
+    db.add(models.User(username="legacy", password_hash=legacy, role="teacher", subscription_status="active"))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, database.get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, main_get_db, override_get_db)
+    monkeypatch.setattr(limiter, "enabled", False)
+    try:
+        response = TestClient(app).post("/login", json={"username": "legacy", "password": "secret123"})
+        db = TestingSessionLocal()
+        stored = db.query(models.User).filter(models.User.username == "legacy").one().password_hash
+        db.close()
+    finally:
+        Base.metadata.drop_all(bind=engine)
+
+    assert response.status_code == 200
+    assert stored.startswith("$pbkdf2-sha256$")
+    assert auth.verify_password("secret123", stored) is True
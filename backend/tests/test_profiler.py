@@ -0,0 +1,82 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from backend import main, profiler
+
+
+def spin_in_worker(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_worker():
+    stop = threading.Event()
+    thread = threading.Thread(target=spin_in_worker, args=(stop,), name=f"{profiler.ANYIO_WORKER_PREFIX} 1")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+def test_samples_anyio_workers_as_collapsed_stacks(busy_worker):
+    stacks = profiler.sample_stacks(0.1, interval=0.005)
+    assert stacks
+    worker_stacks = [s for s in stacks if "spin_in_worker" in s]
+    assert worker_stacks
+    # Root-first: thread label, then outer frames, leaf last
+    assert all(s.startswith("anyio-worker;") for s in worker_stacks)
+    text = profiler.collapsed(stacks)
+    stack, count = text.splitlines()[0].rsplit(" ", 1)
+    assert int(count) >= 1
+
+
+def test_other_threads_need_all_threads():
+    stop = threading.Event()
+    thread = threading.Thread(target=spin_in_worker, args=(stop,), name="unrelated")
+    thread.start()
+    try:
+        assert not any("spin_in_worker" in s for s in profiler.sample_stacks(0.05, interval=0.005))
+        assert any("spin_in_worker" in s for s in profiler.sample_stacks(0.05, interval=0.005, all_threads=True))
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_one_profile_at_a_time():
+    started = threading.Event()
+    result = {}
+
+    def long_profile():
+        started.set()
+        result["stacks"] = profiler.sample_stacks(0.3, interval=0.01)
+
+    thread = threading.Thread(target=long_profile)
+    thread.start()
+    started.wait()
+    time.sleep(0.05)
+    with pytest.raises(profiler.ProfilerBusy):
+        profiler.sample_stacks(0.01)
+    thread.join()
+    assert "stacks" in result
+
+
+def test_profile_endpoint_is_developer_only(monkeypatch):
+    client = TestClient(main.app)
+    assert client.get("/internal/system/profile", params={"seconds": 0.05}).status_code == 401
+
+    monkeypatch.setitem(main.app.dependency_overrides, main.dev_guard, lambda: SimpleNamespace(username="dev"))
+    response = client.get("/internal/system/profile", params={"seconds": 0.05, "interval_ms": 5})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # The endpoint samples the loop thread that is awaiting the sampler
+    assert "event-loop;" in response.text
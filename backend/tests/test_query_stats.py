@@ -0,0 +1,95 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from backend.middleware import CoreHTTPMiddleware
+from backend.query_stats import StatementStats, instrument_engine, normalize_sql
+
+
+class NullWriter:
+    def submit(self, row):
+        return True
+
+
+def _engine(stats, slow_query_ms=10_000):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    instrument_engine(engine, slow_query_ms=slow_query_ms, stats=stats)
+    return engine
+
+
+def test_normalize_sql_collapses_literals_and_param_lists():
+    assert normalize_sql("SELECT * FROM users WHERE id = 42 AND name = 'o''brien'") == (
+        "SELECT * FROM users WHERE id = ? AND name = ?"
+    )
+    assert normalize_sql("SELECT id FROM audit_logs_202607\n  WHERE id IN (?, ?, ?)") == (
+        "SELECT id FROM audit_logs_202607 WHERE id IN (?, ...)"
+    )
+    assert normalize_sql("SELECT 1 WHERE a = %(a_1)s OR b = :b") == "SELECT ? WHERE a = ? OR b = ?"
+
+
+def test_slow_statements_are_logged_with_call_site(caplog):
+    stats = StatementStats()
+    engine = _engine(stats, slow_query_ms=0)
+    with caplog.at_level(logging.WARNING, logger="lumios.sql"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+
+    record = next(r for r in caplog.records if r.getMessage() == "Slow query")
+    assert record.statement == "SELECT ?"
+    assert "test_query_stats.py" in record.call_site
+    top = stats.top(5)
+    assert top[0]["statement"] == "SELECT ?"
+    assert top[0]["count"] == 2
+    assert "test_query_stats.py" in top[0]["last_slow_call_site"]
+
+
+def test_shape_table_is_bounded():
+    stats = StatementStats(max_shapes=2)
+    stats.record("a", 0.5)
+    stats.record("b", 0.1)
+    stats.record("c", 0.3)
+    assert [row["statement"] for row in stats.top(10)] == ["a", "c"]
+
+
+def test_request_headers_count_queries_from_sync_endpoints():
+    engine = _engine(StatementStats())
+    app = FastAPI()
+
+    @app.get("/three")
+    def three_queries():
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text(f"SELECT {i}"))
+        return {"ok": True}
+
+    @app.get("/none")
+    async def no_queries():
+        return {"ok": True}
+
+    app.add_middleware(CoreHTTPMiddleware, audit_writer=NullWriter(), expose_query_stats=True)
+    client = TestClient(app)
+
+    response = client.get("/three")
+    assert response.headers["X-DB-Queries"] == "3"
+    assert float(response.headers["X-DB-Time-ms"]) >= 0
+    assert client.get("/none").headers["X-DB-Queries"] == "0"
+
+
+def test_query_headers_hidden_in_production():
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok():
+        return {"ok": True}
+
+    app.add_middleware(CoreHTTPMiddleware, audit_writer=NullWriter(), expose_query_stats=False)
+    assert "X-DB-Queries" not in TestClient(app).get("/ok").headers
@@ -0,0 +1,204 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from backend import auth, models
+from backend.database import Base
+from backend.quota_leases import QuotaLeases, lease_block, parse_blocks, reserve
+
+
+@pytest.fixture
+def Session(tmp_path):
+    # A file database so threads get their own connections and really contend
+    engine = create_engine(f"sqlite:///{tmp_path / 'quota.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    factory.engine = engine
+    yield factory
+    engine.dispose()
+
+
+def _count(Session, feature="ai_chat"):
+    db = Session()
+    try:
+        return db.query(func.sum(models.UsageCounter.count)).filter(models.UsageCounter.feature == feature).scalar()
+    finally:
+        db.close()
+
+
+def test_counts_up_to_the_limit_then_refuses(Session):
+    db = Session()
+    try:
+        results = [reserve(db, 1, "ai_chat", "2025-01-01", 3) for _ in range(5)]
+        db.commit()
+    finally:
+        db.close()
+    assert results == [1, 2, 3, None, None]
+    assert _count(Session) == 3
+
+
+def test_counters_are_per_user_feature_and_period(Session):
+    db = Session()
+    try:
+        assert reserve(db, 1, "ai_chat", "2025-01-01", 1) == 1
+        assert reserve(db, 1, "ai_chat", "2025-01-02", 1) == 1
+        assert reserve(db, 1, "ai_quiz", "2025-01-01", 1) == 1
+        assert reserve(db, 2, "ai_chat", "2025-01-01", 1) == 1
+        assert reserve(db, 1, "ai_chat", "2025-01-01", 1) is None
+        assert reserve(db, 3, "ai_chat", "2025-01-01", 0) is None
+    finally:
+        db.close()
+
+
+def test_parallel_requests_never_over_admit(Session):
+    limit, threads, attempts = 25, 8, 10
+    admitted = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        for _ in range(attempts):
+            db = Session()
+            try:
+                used = reserve(db, 1, "ai_chat", "2025-01-01", limit)
+                db.commit()
+            finally:
+                db.close()
+            if used is not None:
+                with lock:
+                    admitted.append(used)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    assert sorted(admitted) == list(range(1, limit + 1))
+    assert _count(Session) == limit
+
+
+def test_feature_access_returns_429_at_the_limit(Session):
+    user = SimpleNamespace(id=7, role="teacher", plan="basic", subscription_status="active",
+                           subscription_expiry=datetime.utcnow() + timedelta(days=1), is_suspended=False)
+    guard = auth.FeatureAccess("ai_chat")
+    db = Session()
+    try:
+        db.add(models.UsageCounter(user_id=7, period=datetime.utcnow().strftime("%Y-%m-%d"), feature="ai_chat",
+                                   count=auth.FEATURE_DAILY_LIMITS["ai_chat"]["basic"] - 1))
+        db.commit()
+        assert guard(user=user, db=db) is user
+        with pytest.raises(HTTPException) as exc:
+            guard(user=user, db=db)
+    finally:
+        db.close()
+    assert exc.value.status_code == 429
+    assert exc.value.detail["code"] == "QUOTA_EXCEEDED"
+
+
+def test_lease_blocks_come_from_config():
+    assert parse_blocks("basic=5, pro=10,enterprise=0") == {"basic": 5, "pro": 10, "enterprise": 1}
+    assert lease_block("basic") == 5
+    assert lease_block("no-such-plan") == 1
+
+
+def test_postgres_statement_has_the_same_shape():
+    class PostgresSession:
+        def get_bind(self):
+            return SimpleNamespace(dialect=postgresql.dialect())
+
+        def execute(self, stmt):
+            self.sql = str(stmt.compile(dialect=postgresql.dialect()))
+            return SimpleNamespace(scalar_one_or_none=lambda: 1)
+
+    db = PostgresSession()
+    reserve(db, 1, "ai_chat", "2025-01-01", 5)
+    assert "ON CONFLICT (user_id, period, feature) DO UPDATE" in db.sql
+    assert "WHERE usage_counters.count + " in db.sql
+    assert db.sql.rstrip().endswith("RETURNING usage_counters.count")
+
+
+def _consume_many(leases, Session, calls, limit, block, user_id=1):
+    admitted = 0
+    for _ in range(calls):
+        db = Session()
+        try:
+            admitted += leases.consume(db, user_id, "ai_chat", "2025-01-01", limit, block)
+        finally:
+            db.close()
+    return admitted
+
+
+def test_lease_serves_a_block_from_memory(Session):
+    leases = QuotaLeases()
+    writes = []
+    event.listen(Session.engine, "before_cursor_execute", lambda *a: writes.append(a[2]))
+
+    assert _consume_many(leases, Session, 10, limit=50, block=10) == 10
+    assert len([w for w in writes if w.startswith("INSERT")]) == 1
+    assert _count(Session) == 10
+
+    assert _consume_many(leases, Session, 1, limit=50, block=10) == 1
+    assert _count(Session) == 20
+    assert leases.held((1, "ai_chat", "2025-01-01")) == 9
+
+
+def test_lease_shrinks_near_the_limit_and_stops_exactly_there(Session):
+    leases = QuotaLeases()
+    assert _consume_many(leases, Session, 20, limit=12, block=10) == 12
+    assert _count(Session) == 12
+
+
+def test_workers_never_over_admit_and_return_unused_units(Session):
+    workers = [QuotaLeases() for _ in range(3)]
+    limit = 53
+    admitted = []
+    start = threading.Barrier(6)
+
+    def run(leases):
+        start.wait()
+        admitted.append(_consume_many(leases, Session, 30, limit=limit, block=5))
+
+    pool = [threading.Thread(target=run, args=(workers[i % 3],)) for i in range(6)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    held = sum(w.held((1, "ai_chat", "2025-01-01")) for w in workers)
+    assert sum(admitted) <= limit
+    assert sum(admitted) >= limit - 2 * (5 - 1)  # at most block - 1 idle in each other worker
+    assert _count(Session) == sum(admitted) + held
+
+    for w in workers:
+        w.release_all(Session.engine)
+    assert _count(Session) == sum(admitted)
+
+
+def test_idle_leases_are_reconciled(Session):
+    now = [0.0]
+    leases = QuotaLeases(idle_seconds=60, clock=lambda: now[0])
+    _consume_many(leases, Session, 1, limit=50, block=10)
+    _consume_many(leases, Session, 1, limit=50, block=10, user_id=2)
+    assert _count(Session) == 20
+
+    now[0] = 30.0
+    _consume_many(leases, Session, 1, limit=50, block=10, user_id=2)
+    now[0] = 61.0
+    assert leases.reconcile(Session.engine) == 9  # user 1's lease only
+    assert leases.held((1, "ai_chat", "2025-01-01")) == 0
+    assert leases.held((2, "ai_chat", "2025-01-01")) == 8
+    assert _count(Session) == 11
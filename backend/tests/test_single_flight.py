@@ -0,0 +1,103 @@
+"""
+LUMIX OS - Advanced Intelligence-First SMS
+Created by: Faizain Murtuza
+© 2025 Faizain Murtuza. All Rights Reserved.
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from backend import metrics
+from backend.ai_service import AIService
+from backend.single_flight import SingleFlight
+
+
+class Gate:
+    """A generation that runs until released; counts how often it was started."""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return self.result
+
+
+@pytest.mark.asyncio
+async def test_broadcast_quiz_makes_one_provider_call():
+    with patch('google.generativeai.configure'):
+        service = AIService(openai_api_key="k", gemini_api_key="k", providers="stub")
+    service.stub.latency_ms = 50
+
+    quizzes = await asyncio.gather(*(service.generate_quiz("Photosynthesis", count=4) for _ in range(40)))
+
+    assert service.metrics["stub_requests"] == 1
+    assert all(q == quizzes[0] for q in quizzes) and len(quizzes[0]) == 4
+    assert (service.inflight.started, service.inflight.coalesced, len(service.inflight)) == (1, 39, 0)
+    assert 'lumios_ai_single_flight_total{namespace="quiz",outcome="coalesced"}' in metrics.registry.render()
+
+    # Settled: later requests are cache hits, not new flights
+    await service.generate_quiz("photosynthesis", count=4)
+    assert service.inflight.started == 1
+
+
+@pytest.mark.asyncio
+async def test_error_reaches_every_waiter_and_is_not_remembered():
+    flight, gate = SingleFlight(), Gate(error=RuntimeError("provider down"))
+    waiters = [asyncio.create_task(flight.do("quiz:x", gate)) for _ in range(3)]
+    await asyncio.sleep(0)
+    gate.release.set()
+
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert [str(r) for r in results] == ["provider down"] * 3
+    assert gate.calls == 1 and len(flight) == 0
+
+    gate.error, gate.result = None, ["ok"]
+    assert await flight.do("quiz:x", gate) == ["ok"]
+    assert gate.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_others_waiting():
+    flight, gate = SingleFlight(), Gate(result=["ok"])
+    first = asyncio.create_task(flight.do("quiz:x", gate))
+    second = asyncio.create_task(flight.do("quiz:x", gate))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    gate.release.set()
+
+    assert await second == ["ok"]
+    assert first.cancelled() and not gate.cancelled
+
+
+@pytest.mark.asyncio
+async def test_generation_cancelled_once_every_waiter_is_gone():
+    flight, gate = SingleFlight(), Gate(result=["ok"])
+    waiters = [asyncio.create_task(flight.do("quiz:x", gate)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert gate.cancelled and len(flight) == 0
+    # A newcomer does not join the abandoned generation
+    gate.release = asyncio.Event()
+    gate.release.set()
+    assert await flight.do("quiz:x", gate) == ["ok"]
+    assert gate.calls == 2